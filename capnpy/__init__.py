@@ -1,16 +1,65 @@
 import sys
-import pkg_resources
 
-from capnpy.compiler.compiler import DynamicCompiler
-from capnpy.compiler.distutils import capnpify
-from capnpy.message import load, loads, load_all, dumps, dump
+# struct_ must be imported before message: see the end of struct_.py
+import capnpy.struct_
+from capnpy.message import load, loads, load_all, dumps, dump, dump_many
+from capnpy.message import (load_packed, loads_packed, load_all_packed,
+                            dumps_packed, dump_packed)
+from capnpy.messagefile import MessageFile
+from capnpy.builder import MessageBuilder
 
+# NOTE: the compiler (and thus capnpy.schema, distutils and Cython) is
+# imported lazily: the modules generated by capnpy need only the runtime, and
+# we don't want to pay the import cost of the compiler every time we import
+# one of them. DynamicCompiler is still available as capnpy.DynamicCompiler,
+# but on Python >= 3.7 it is imported only on first access (see __getattr__
+# below): older Pythons don't support module-level __getattr__, so there we
+# import it eagerly.
 
-try:
-    __version__ = pkg_resources.get_distribution('capnpy').version
-except Exception:
-    __version__ = 'unknown'
+def _get_version():
+    try:
+        # written by setuptools_scm at build time
+        from capnpy._version import version
+        return version
+    except ImportError:
+        pass
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+        version = lambda name: pkg_resources.get_distribution(name).version
+    try:
+        return version('capnpy')
+    except Exception:
+        return 'unknown'
 
-_compiler = DynamicCompiler(sys.path)
-load_schema = _compiler.load_schema
-parse_schema = _compiler.parse_schema
+__version__ = _get_version()
+
+if sys.version_info < (3, 7):
+    from capnpy.compiler.compiler import DynamicCompiler
+else:
+    def __getattr__(name):
+        if name == 'DynamicCompiler':
+            from capnpy.compiler.compiler import DynamicCompiler
+            return DynamicCompiler
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+_compiler = None
+
+def _get_compiler():
+    global _compiler
+    if _compiler is None:
+        from capnpy.compiler.compiler import DynamicCompiler
+        _compiler = DynamicCompiler(sys.path)
+    return _compiler
+
+def load_schema(*args, **kwargs):
+    return _get_compiler().load_schema(*args, **kwargs)
+
+def parse_schema(*args, **kwargs):
+    return _get_compiler().parse_schema(*args, **kwargs)
+
+def capnpify(*args, **kwargs):
+    from capnpy.compiler.distutils import capnpify
+    return capnpify(*args, **kwargs)
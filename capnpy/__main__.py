@@ -8,6 +8,7 @@ Options:
                        Can be bytes or unicode
   --no-pyx             Always produce a .py file, even if Cython is available
   --no-version-check   Don't check for version discrepancy.
+  --cache-fields       Memoize the value of pointer fields on the instance
 """
 from __future__ import print_function
 
@@ -50,7 +51,8 @@ def compile(args):
     kwargs = dict(
         version_check = args['--version-check'],
         convert_case = args['--convert-case'],
-        text_type = args['--text-type']
+        text_type = args['--text-type'],
+        cache_fields = args['--cache-fields']
     )
     options = Options.from_dict(kwargs)
     comp.compile(filename=args['FILE'],
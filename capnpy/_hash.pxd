@@ -1,4 +1,4 @@
 cpdef long inthash(long v)
 cpdef long longhash(unsigned long v)
 cdef long tuplehash(long hashes[], long len)
-cpdef long strhash(bytes a, long start, long size)
+cpdef long strhash(object a, long start, long size)
@@ -3,7 +3,10 @@ longhash = hash
 __tuplehash_for_tests = hash
 
 def strhash(s, start, size):
-    return hash(s[start:start+size])
+    s = s[start:start+size]
+    if type(s) is not bytes:
+        s = s.tobytes()
+    return hash(s)
 
 
 
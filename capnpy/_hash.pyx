@@ -4,6 +4,8 @@ types. The idea is that if you have C variables, you can compute fast hashes
 *without* having to allocate real Python object
 """
 
+from capnpy.packing cimport as_cbuf
+
 cdef extern from "Python.h":
     int PY_MAJOR_VERSION
 cdef int PY3 = PY_MAJOR_VERSION == 3
@@ -20,14 +22,14 @@ cdef extern from "_hash.h":
     long MINLONG
 
 
-cpdef long strhash(bytes a, long start, long size):
-    cdef long maxlen = len(a)
+cpdef long strhash(object a, long start, long size):
+    cdef Py_ssize_t maxlen = 0
+    cdef const unsigned char* p = <const unsigned char*>as_cbuf(a, &maxlen)
     if start >= maxlen or size == 0:
         return 0
     if size > maxlen:
         size = maxlen-start
 
-    cdef const unsigned char* p = a
     p += start
 
     if PY3:
@@ -0,0 +1,82 @@
+"""
+Load and dump messages over asyncio streams.
+
+The API mirrors the one of capnpy.message, but the functions are coroutines
+which take an ``asyncio.StreamReader`` or ``asyncio.StreamWriter`` instead of
+a file-like object.
+"""
+
+import asyncio
+from capnpy.segment.base import unpack_uint32
+from capnpy.message import dumps, _message_from_segments, _read_root
+
+
+async def load(reader, payload_type, traversal_limit_in_words=None,
+               nesting_limit=None):
+    """
+    Load a message of type ``payload_type`` from the given
+    ``asyncio.StreamReader``. See capnpy.message.load() for a description of
+    the encoding and of the limits.
+
+    Raise EOFError if the stream is at EOF before the message starts, and
+    ValueError if it ends in the middle of a message.
+    """
+    msg = await _load_message(reader)
+    return _read_root(msg, payload_type, traversal_limit_in_words,
+                      nesting_limit)
+
+async def load_all(reader, payload_type, traversal_limit_in_words=None,
+                   nesting_limit=None):
+    """
+    Asynchronously iterate over all the messages in the given
+    ``asyncio.StreamReader``, until EOF:
+
+        async for obj in capnpy.aio.load_all(reader, MyStruct):
+            ...
+    """
+    while True:
+        try:
+            obj = await load(reader, payload_type, traversal_limit_in_words,
+                             nesting_limit)
+        except EOFError:
+            return
+        yield obj
+
+async def dump(obj, writer, fastpath=True, packed=False):
+    """
+    Dump a message to the given ``asyncio.StreamWriter``, and wait until it
+    is appropriate to resume writing, as StreamWriter.drain() does.
+    """
+    writer.write(dumps(obj, fastpath=fastpath, packed=packed))
+    await writer.drain()
+
+async def _load_message(reader):
+    try:
+        buf = await reader.readexactly(4)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ValueError("Unexpected EOF when reading the header")
+        raise EOFError("No message to load")
+    n = unpack_uint32(buf, 0) + 1
+    #
+    # read the size of each segment plus the padding up to the next word
+    # boundary, all at once
+    header_size = 4 + n*4
+    if header_size & 7 != 0:
+        header_size += 8-(header_size & 7)
+    try:
+        buf = await reader.readexactly(header_size - 4)
+    except asyncio.IncompleteReadError:
+        raise ValueError("Unexpected EOF when reading the header")
+    segments = [unpack_uint32(buf, i*4) for i in range(n)]
+    #
+    # readexactly() returns a new bytes object: this is the only copy which
+    # is done, as the segments point directly into it
+    message_lenght = sum(segments)*8
+    try:
+        buf = await reader.readexactly(message_lenght)
+    except asyncio.IncompleteReadError as e:
+        raise ValueError("Unexpected EOF: expected %d bytes, got only %s. "
+                         "Segments size: %s" % (message_lenght, len(e.partial),
+                                                segments))
+    return _message_from_segments(buf, segments)
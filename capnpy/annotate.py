@@ -137,8 +137,16 @@ class Options(_Struct):
             value = (value ^ 0)
         return TextType._new(value)
     
+    @property
+    def cache_fields(self):
+        # no union check
+        value = self._read_int16(6)
+        if 2 != 0:
+            value = (value ^ 2)
+        return BoolOption._new(value)
+    
     @staticmethod
-    def __new(version_check=2, convert_case=2, text_type=0):
+    def __new(version_check=2, convert_case=2, text_type=0, cache_fields=2):
         builder = _SegmentBuilder()
         pos = builder.allocate(8)
         version_check ^= 2
@@ -147,10 +155,12 @@ class Options(_Struct):
         builder.write_int16(pos + 2, convert_case)
         text_type ^= 0
         builder.write_int16(pos + 4, text_type)
+        cache_fields ^= 2
+        builder.write_int16(pos + 6, cache_fields)
         return builder.as_string()
     
-    def __init__(self, version_check=2, convert_case=2, text_type=0):
-        _buf = Options.__new(version_check, convert_case, text_type)
+    def __init__(self, version_check=2, convert_case=2, text_type=0, cache_fields=2):
+        _buf = Options.__new(version_check, convert_case, text_type, cache_fields)
         self._init_from_buffer(_buf, 0, 1, 0)
     
     def shortrepr(self):
@@ -158,6 +168,7 @@ class Options(_Struct):
         parts.append("version_check = %s" % self.version_check)
         parts.append("convert_case = %s" % self.convert_case)
         parts.append("text_type = %s" % self.text_type)
+        parts.append("cache_fields = %s" % self.cache_fields)
         return "(%s)" % ", ".join(parts)
 
 _Options_list_item_type = _StructItemType(Options)
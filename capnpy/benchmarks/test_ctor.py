@@ -2,6 +2,15 @@ import py
 import pytest
 from pypytools.codegen import Code
 from capnpy.benchmarks.test_benchmarks import schema, get_obj
+from capnpy.segment.builder import enable_builder_pool
+
+@pytest.fixture
+def pool(schema):
+    if schema.__name__ != 'Capnpy':
+        pytest.skip('N/A')
+    enable_builder_pool()
+    yield
+    enable_builder_pool(False)
 
 class TestCtor(object):
 
@@ -139,3 +148,18 @@ class TestCtor(object):
         items = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
         res = benchmark(new_and_sum, schema.MyInt64List, items)
         assert res == self.N
+
+
+class TestCtorPool(TestCtor):
+    """
+    Same as TestCtor, but with the builder pool enabled: compare with the
+    corresponding benchmarks in the "ctor" group.
+    """
+
+    @pytest.fixture(autouse=True)
+    def enable_pool(self, pool):
+        pass
+
+    @pytest.mark.skip('N/A')
+    def test_copy_pointer(self):
+        pass
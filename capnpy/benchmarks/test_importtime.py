@@ -0,0 +1,96 @@
+import os
+import sys
+import subprocess
+import pytest
+from capnpy.compiler.compiler import StandaloneCompiler
+
+if sys.version_info < (3, 7):
+    pytest.skip('-X importtime requires Python >= 3.7', allow_module_level=True)
+
+SCHEMA = """
+@0xe62e66ea90a396db;
+using Py = import "/capnpy/annotate.capnp";
+
+enum Color {
+    red @0;
+    green @1;
+    blue @2;
+}
+
+struct Point {
+    x @0 :Int64;
+    y @1 :Int64;
+}
+
+struct Shape $Py.key("name") {
+    name @0 :Text;
+    color @1 :Color;
+    points @2 :List(Point);
+    tags @3 :List(Text);
+    union {
+        circle @4 :Float64;
+        square @5 :Void;
+    }
+    style :group {
+        width @6 :Int8;
+        fill @7 :Bool;
+    }
+}
+"""
+
+# the modules which are not needed to use a generated module: importing any
+# of them is a regression.
+#
+# six and pypytools are NOT in the list: the runtime still needs them
+# (six for the Python 2/3 compatibility, pypytools for IS_PYPY, as_signed and
+# the fakecython used by the pure-python mode of the segment modules).
+FORBIDDEN = ('capnpy.compiler', 'capnpy.schema', 'capnpy.printer',
+             'Cython.Build', 'pkg_resources')
+
+def parse_importtime(output):
+    """
+    Parse the output of python -X importtime and return a dict mapping each
+    module name to its cumulative import time, in microseconds
+    """
+    res = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        res[name.strip()] = int(cumulative)
+    return res
+
+
+class TestImportTime(object):
+
+    @pytest.fixture(scope="class")
+    def moddir(self, tmpdir_factory):
+        tmpdir = tmpdir_factory.mktemp('importtime')
+        schema = tmpdir.join('shapes.capnp')
+        schema.write(SCHEMA)
+        comp = StandaloneCompiler(sys.path)
+        comp.compile(schema, pyx='auto', options=None)
+        return tmpdir
+
+    def import_cold(self, tmpdir, modname):
+        # run a fresh interpreter, so that nothing is in sys.modules yet
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join([str(tmpdir)] + sys.path)
+        cmd = [sys.executable, '-X', 'importtime', '-c', 'import ' + modname]
+        output = subprocess.check_output(cmd, env=env, cwd=str(tmpdir),
+                                         stderr=subprocess.STDOUT)
+        return parse_importtime(output.decode('utf-8'))
+
+    @pytest.mark.benchmark(group="importtime")
+    def test_generated_module(self, moddir, benchmark):
+        modname = 'shapes'
+        times = benchmark.pedantic(self.import_cold, args=(moddir, modname),
+                                   rounds=5, iterations=1)
+        # the wall-clock time measured by benchmark includes the startup of
+        # the interpreter: store also what -X importtime says, in ms
+        benchmark.extra_info['import_ms'] = times[modname] / 1000.0
+        benchmark.extra_info['capnpy_ms'] = times['capnpy'] / 1000.0
+        for name in times:
+            for forbidden in FORBIDDEN:
+                assert not (name == forbidden or
+                            name.startswith(forbidden + '.')), name
@@ -58,6 +58,55 @@ class TestLoad(object):
             res = benchmark(self.load_N, schema, open_connection)
         assert res.int64 == 100
 
+    @pytest.mark.benchmark(group="load")
+    def test_load_packed_from_file(self, schema, benchmark, tmpdir):
+        if schema.__name__ != 'Capnpy':
+            pytest.skip('N/A')
+        #
+        N = self.N // 10
+        tmpfile = tmpdir.join('mypackedfile')
+        obj = get_obj(schema)
+        with tmpfile.open('wb') as f:
+            for i in range(N):
+                obj.dump_packed(f)
+        #
+        def load_N():
+            with tmpfile.open('rb') as f:
+                for i in range(N):
+                    obj = schema.MyStruct.load_packed(f)
+            return obj
+        #
+        res = benchmark(load_N)
+        assert res.int64 == 100
+
+    @pytest.mark.benchmark(group="loads")
+    def test_loads(self, schema, benchmark):
+        if schema.__name__ != 'Capnpy':
+            pytest.skip('N/A')
+        #
+        buf = get_obj(schema).dumps()
+        def loads_N():
+            for i in range(self.N // 10):
+                obj = schema.MyStruct.loads(buf)
+            return obj
+        #
+        res = benchmark(loads_N)
+        assert res.int64 == 100
+
+    @pytest.mark.benchmark(group="loads")
+    def test_loads_packed(self, schema, benchmark):
+        if schema.__name__ != 'Capnpy':
+            pytest.skip('N/A')
+        #
+        buf = get_obj(schema).dumps_packed()
+        def loads_N():
+            for i in range(self.N // 10):
+                obj = schema.MyStruct.loads_packed(buf)
+            return obj
+        #
+        res = benchmark(loads_N)
+        assert res.int64 == 100
+
 
 class TestDump(object):
 
@@ -99,6 +148,23 @@ class TestDump(object):
         res = benchmark(dumps_N, obj)
         assert type(res) is six.binary_type
 
+    @pytest.mark.benchmark(group="dumps")
+    def test_dumps_packed(self, schema, benchmark):
+        if schema.__name__ != 'Capnpy':
+            pytest.skip('N/A')
+        #
+        def dumps_N(obj):
+            myobjs = (obj, obj)
+            res = 0
+            for i in range(self.N):
+                obj = myobjs[i%2]
+                res = obj.dumps_packed()
+            return res
+        #
+        obj = get_obj(schema)
+        res = benchmark(dumps_N, obj)
+        assert type(res) is six.binary_type
+
     @pytest.mark.benchmark(group="dumps")
     def test_dumps_not_compact(self, schema, benchmark):
         if schema.__name__ != 'Capnpy':
@@ -9,7 +9,6 @@ from pypytools import IS_PYPY
 
 import capnpy
 from capnpy.util import extend
-from capnpy.printer import BufferPrinter
 from capnpy.segment.segment import Segment
 
 try:
@@ -51,6 +50,7 @@ class Blob(object):
             end = self._get_end()
         elif end is None:
             end = len(self._seg.buf)
+        from capnpy.printer import BufferPrinter
         p = BufferPrinter(self._seg.buf)
         p.printbuf(start=start, end=end, **kwds)
 
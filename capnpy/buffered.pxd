@@ -1,7 +1,11 @@
 import cython
 from capnpy.filelike cimport FileLike
 
-cdef class BufferedStream(FileLike):
+cdef class BufferedFileLike(FileLike):
+    cdef public object wbuf
+
+
+cdef class BufferedStream(BufferedFileLike):
     cdef readonly bytes buf
     cdef readonly int i
 
@@ -19,10 +23,43 @@ cdef class BufferedStream(FileLike):
 cdef class BufferedSocket(BufferedStream):
     cdef readonly object sock
     cdef readonly int bufsize
-    cdef public object wbuf
     cpdef bytes _readchunk(self)
 
 
+cdef class RingBufferedStream(BufferedFileLike):
+    cdef readonly bytearray buf
+    cdef readonly object view
+    cdef readonly Py_ssize_t i
+    cdef readonly Py_ssize_t end
+    cdef readonly bint exported
+
+    cpdef Py_ssize_t _readinto(self, object view) except -1
+    cdef Py_ssize_t _fill(self, Py_ssize_t size) except -1
+
+    @cython.locals(pending=Py_ssize_t, capacity=Py_ssize_t, newbuf=bytearray)
+    cdef _make_room(self, Py_ssize_t size)
+    cdef bytes _readall(self)
+
+    @cython.locals(i=Py_ssize_t, j=Py_ssize_t)
+    cpdef bytes read(self, int size=*)
+
+    @cython.locals(i=Py_ssize_t, j=Py_ssize_t)
+    cpdef readview(self, Py_ssize_t size)
+
+    @cython.locals(start=Py_ssize_t, i=Py_ssize_t, j=Py_ssize_t)
+    cpdef bytes readline(self)
+
+
+cdef class RingBufferedSocket(RingBufferedStream):
+    cdef readonly object sock
+    cpdef Py_ssize_t _readinto(self, object view) except -1
+
+
+cdef class RingBufferedFile(RingBufferedStream):
+    cdef readonly object f
+    cpdef Py_ssize_t _readinto(self, object view) except -1
+
+
 cdef class StringBuffer(FileLike):
     cdef readonly bytes s
     cdef readonly int i
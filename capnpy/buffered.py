@@ -1,6 +1,37 @@
 from capnpy.filelike import FileLike
 
-class BufferedStream(FileLike):
+class BufferedFileLike(FileLike):
+    """
+    Base class for BufferedStream and RingBufferedStream, which implements
+    the write side: write() appends the data to an internal buffer, which is
+    passed to _writeall() only when calling flush(). Subclasses which support
+    writing must implement _writeall(data).
+    """
+
+    def __init__(self):
+        self.wbuf = []
+
+    def _writeall(self, data):
+        raise NotImplementedError
+
+    def write(self, data):
+        self.wbuf.append(data)
+
+    def flush(self):
+        data = b''.join(self.wbuf)
+        self._writeall(data)
+        self.wbuf = []
+
+    def write_messages(self, objs, fastpath=True):
+        """
+        Send each of the given structs as a separate message, after the data
+        which has already been written: see message.dump_many()
+        """
+        from capnpy.message import dump_many
+        dump_many(objs, self, fastpath)
+
+
+class BufferedStream(BufferedFileLike):
     """
     file-like interface to read data from a generic stream in a buffered way.
 
@@ -11,6 +42,7 @@ class BufferedStream(FileLike):
     """
 
     def __init__(self):
+        super(BufferedStream, self).__init__()
         self.buf = b''
         self.i = 0
 
@@ -84,12 +116,6 @@ class BufferedStream(FileLike):
         #
         return b''.join(parts)
 
-    def write(self, data):
-        raise NotImplementedError
-
-    def flush(self):
-        raise NotImplementedError
-
 
 class BufferedSocket(BufferedStream):
     """
@@ -106,23 +132,156 @@ class BufferedSocket(BufferedStream):
         super(BufferedSocket, self).__init__()
         self.sock = sock
         self.bufsize = bufsize
-        self.wbuf = []
 
     def _readchunk(self):
         return self.sock.recv(self.bufsize)
 
-    def write(self, data):
-        self.wbuf.append(data)
+    def _writeall(self, data):
+        self.sock.sendall(data)
 
-    def flush(self):
-        data = b''.join(self.wbuf)
+    def close(self):
+        self.sock.close()
+
+
+class RingBufferedStream(BufferedFileLike):
+    """
+    Like BufferedStream, but the data is read directly into a preallocated
+    bytearray by _readinto(), instead of allocating a new string for each
+    chunk and joining them. This is an abstract class: subclasses must
+    implement _readinto(view), which reads as many bytes as possible into the
+    given memoryview and returns their number, or 0 at EOF.
+
+    readview() returns a memoryview on the buffer without copying: this is
+    what message.load() uses to read the body of the messages. When the
+    buffer is full, the pending data is moved to its beginning and the
+    buffer is reused; however, if some memoryview has been handed out since
+    the last time, a new buffer is allocated instead, so that the data seen
+    by the existing views is never overwritten. The buffer grows only when a
+    single read does not fit in it.
+    """
+
+    def __init__(self, capacity=65536):
+        super(RingBufferedStream, self).__init__()
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.i = 0   # current read position
+        self.end = 0 # end of the valid data
+        self.exported = False
+
+    def _readinto(self, view):
+        raise NotImplementedError
+
+    def _fill(self, size):
+        """
+        Read from the stream until there are at least ``size`` bytes available
+        after the current position, or until EOF. Return the number of
+        available bytes.
+        """
+        if self.i + size > len(self.buf):
+            self._make_room(size)
+        while self.end - self.i < size:
+            n = self._readinto(self.view[self.end:])
+            if n == 0:
+                break # connection closed, no more data
+            self.end += n
+        return self.end - self.i
+
+    def _make_room(self, size):
+        pending = self.end - self.i
+        capacity = len(self.buf)
+        while capacity < size:
+            capacity *= 2
+        if self.exported or capacity != len(self.buf):
+            newbuf = bytearray(capacity)
+            newbuf[:pending] = self.view[self.i:self.end]
+            self.buf = newbuf
+            self.view = memoryview(newbuf)
+            self.exported = False
+        else:
+            self.buf[:pending] = self.buf[self.i:self.end]
+        self.i = 0
+        self.end = pending
+
+    def _readall(self):
+        parts = []
+        while self.i < self.end or self._fill(1) > 0:
+            parts.append(self.view[self.i:self.end].tobytes())
+            self.i = self.end
+        return b''.join(parts)
+
+    def read(self, size=-1):
+        if size == -1:
+            return self._readall()
+        if self.end - self.i < size:
+            self._fill(size)
+        i = self.i
+        j = min(i + size, self.end)
+        self.i = j
+        return self.view[i:j].tobytes()
+
+    def readview(self, size):
+        """
+        Same as read(), but return a memoryview on the internal buffer
+        instead of copying the data.
+        """
+        if self.end - self.i < size:
+            self._fill(size)
+        i = self.i
+        j = min(i + size, self.end)
+        self.i = j
+        self.exported = True
+        return self.view[i:j]
+
+    def readline(self):
+        start = 0 # where to start searching for the newline
+        while True:
+            j = self.buf.find(b'\n', self.i + start, self.end)
+            if j != -1:
+                j += 1
+                break
+            start = self.end - self.i
+            if self._fill(start + 1) == start:
+                j = self.end # EOF
+                break
+        i = self.i
+        self.i = j
+        return self.view[i:j].tobytes()
+
+
+class RingBufferedSocket(RingBufferedStream):
+    """
+    Same as BufferedSocket, but reads the data with sock.recv_into(): see
+    RingBufferedStream.
+    """
+
+    def __init__(self, sock, capacity=65536):
+        super(RingBufferedSocket, self).__init__(capacity)
+        self.sock = sock
+
+    def _readinto(self, view):
+        return self.sock.recv_into(view)
+
+    def _writeall(self, data):
         self.sock.sendall(data)
-        self.wbuf = []
 
     def close(self):
         self.sock.close()
 
 
+class RingBufferedFile(RingBufferedStream):
+    """
+    RingBufferedStream which reads from a binary file object using
+    f.readinto()
+    """
+
+    def __init__(self, f, capacity=65536):
+        super(RingBufferedFile, self).__init__(capacity)
+        self.f = f
+
+    def _readinto(self, view):
+        return self.f.readinto(view) or 0
+
+
 class StringBuffer(FileLike):
     """
     file-like interface to read data out of a string. Like StringIO, but since
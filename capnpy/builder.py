@@ -0,0 +1,345 @@
+"""
+Incremental construction of messages.
+
+The generated ctors need all the fields up front and produce a brand new
+buffer every time. The classes in this module let you build a message piece
+by piece instead: the data is written directly into SegmentBuilders, and
+primitive fields can be changed in place at any time without copying
+anything else.
+
+Each generated struct class ``Foo`` has a companion builder class, reachable
+as ``Foo.__builder__``, which exposes ``set_<field>()`` for slot fields and
+``init_<field>()`` for struct, list and group fields.
+
+By default, the message consists of a single segment which grows as needed.
+If ``segment_size`` is given, a new segment is started whenever the current
+one is full, and objects which live in a different segment than the pointer
+referencing them are reached through a far pointer and a landing pad. Objects
+are never split: a single object which is bigger than ``segment_size`` (or a
+struct/list which is deep-copied by one of the setters) can make its segment
+bigger than that.
+
+Note that pointer fields (text, data, structs and lists) are never
+deallocated: if you set them more than once, the old objects are left
+unreachable in the buffer, exactly as it happens with the C++ implementation.
+"""
+
+import struct
+from capnpy import ptr
+from capnpy.segment.builder import SegmentBuilder
+from capnpy.segment.segment import Segment, MultiSegment
+from capnpy.struct_ import struct_from_buffer
+from capnpy.list import BoolItemType, StructItemType, ListItemType
+from capnpy.message import _write_parts
+
+
+class MessageBuilder(object):
+    """
+    Build a message whose root is a struct.
+
+    ``size_hint`` is the number of bytes to preallocate for the first
+    segment: if you know in advance roughly how big the message is going to
+    be, it avoids to resize the buffer while building it.
+
+    If ``buf`` is given, it must be a bytearray: the first segment is built
+    directly inside it, growing it if needed, so that the same memory can be
+    reused for many messages.
+    """
+
+    def __init__(self, segment_size=None, size_hint=512, buf=None):
+        if segment_size is not None and segment_size < 16:
+            raise ValueError("segment_size must be at least 16 bytes")
+        self.segment_size = segment_size
+        if segment_size is not None:
+            size_hint = min(size_hint, segment_size)
+        self._segments = [SegmentBuilder(ptr.round_up_to_word(size_hint), buf)]
+        self._segments[0].allocate(8) # the root pointer
+        self._root = None
+
+    def reset(self):
+        """
+        Discard the current message, so that the builder can be reused to
+        build a new one. The buffer of the first segment is kept.
+        """
+        del self._segments[1:]
+        self._segments[0].reset()
+        self._segments[0].allocate(8) # the root pointer
+        self._root = None
+
+    def init_root(self, structcls):
+        """
+        Allocate the root struct and return a builder for it. Calling it again
+        discards the previous root.
+        """
+        data_size = structcls.__static_data_size__
+        ptrs_size = structcls.__static_ptrs_size__
+        seg_id, pos = self._alloc_target(0, 0, (data_size+ptrs_size)*8)
+        pos = self._segments[seg_id].alloc_struct(pos, data_size, ptrs_size)
+        self._root = structcls.__builder__(self, seg_id, pos)
+        return self._root
+
+    def get_root(self):
+        if self._root is None:
+            raise ValueError("init_root() has not been called yet")
+        return self._root
+
+    def as_reader(self):
+        return self.get_root().as_reader()
+
+    def _segment_with_room(self, length):
+        """
+        Return the id of a segment which has at least ``length`` free
+        bytes, starting a new one if needed.
+        """
+        last = len(self._segments) - 1
+        if self._segments[last].get_length() + length <= self.segment_size:
+            return last
+        self._segments.append(SegmentBuilder(max(length, self.segment_size)))
+        return last + 1
+
+    def _alloc_target(self, seg_id, pos, length):
+        """
+        We are about to allocate an object of ``length`` bytes, whose pointer
+        is at ``pos`` inside the segment ``seg_id``. Return the (seg_id, pos)
+        where the object must be allocated and its pointer written.
+
+        If the object does not fit in seg_id, a landing pad is allocated in
+        another segment and a far pointer to it is written at ``pos``.
+        """
+        if self.segment_size is None:
+            return seg_id, pos
+        # the allocator rounds all the objects up to a multiple of 8 bytes
+        length = ptr.round_up_to_word(length)
+        seg = self._segments[seg_id]
+        if seg.get_length() + length <= self.segment_size:
+            return seg_id, pos
+        target_id = self._segment_with_room(length + 8)
+        if target_id == seg_id:
+            return seg_id, pos
+        pad = self._segments[target_id].allocate(8)
+        seg.write_int64(pos, ptr.new_far(0, pad//8, target_id))
+        return target_id, pad
+
+    def _as_segment(self):
+        """
+        Return a Segment or MultiSegment containing a copy of the whole
+        message, and the offset at which each segment starts
+        """
+        bufs = [seg.as_string() for seg in self._segments]
+        if len(bufs) == 1:
+            return Segment(bufs[0]), (0,)
+        segment_offsets = []
+        offset = 0
+        for buf in bufs:
+            segment_offsets.append(offset)
+            offset += len(buf)
+        segment_offsets = tuple(segment_offsets)
+        return MultiSegment(b''.join(bufs), segment_offsets), segment_offsets
+
+    def get_segments(self):
+        """
+        Return a list of bytes, one for each segment
+        """
+        self.get_root()
+        return [seg.as_string() for seg in self._segments]
+
+    def _header(self, segments):
+        n = len(segments)
+        fmt = '<I' + 'I'*n
+        if n % 2 == 0:
+            fmt += 'I' # padding, so that the first segment is word-aligned
+        sizes = [len(buf)//8 for buf in segments]
+        if n % 2 == 0:
+            sizes.append(0)
+        return struct.pack(fmt, n-1, *sizes)
+
+    def dumps(self):
+        segments = self.get_segments()
+        return self._header(segments) + b''.join(segments)
+
+    def dump(self, f):
+        """
+        Write the message to ``f``, one segment at a time. If ``f`` is a
+        socket or a real file, the header and all the segments are written
+        with a single system call: see message.dump_many().
+        """
+        segments = self.get_segments()
+        _write_parts(f, [self._header(segments)] + segments)
+
+
+class StructBuilder(object):
+    """
+    Base class for the generated builders. ``__struct__`` is the
+    corresponding reader class.
+    """
+
+    __struct__ = None
+
+    def __init__(self, msg, seg_id, pos):
+        self._msg = msg
+        self._seg_id = seg_id
+        self._builder = msg._segments[seg_id]
+        self._data_offset = pos
+        self._ptrs_offset = pos + self.__struct__.__static_data_size__*8
+
+    def __repr__(self):
+        return '<%s builder at offset %d>' % (self.__struct__.__name__,
+                                              self._data_offset)
+
+    def as_reader(self):
+        """
+        Return a reader for the struct. The reader works on a snapshot of the
+        data: changes done later through the builder are not visible.
+        """
+        structcls = self.__struct__
+        seg, segment_offsets = self._msg._as_segment()
+        offset = segment_offsets[self._seg_id] + self._data_offset
+        return struct_from_buffer(structcls, seg, offset,
+                                  structcls.__static_data_size__,
+                                  structcls.__static_ptrs_size__)
+
+    def _alloc_target(self, offset, length):
+        return self._msg._alloc_target(self._seg_id, self._ptrs_offset + offset,
+                                       length)
+
+    def _set_text(self, offset, value, trailing_zero=1):
+        if value is None:
+            self._builder.write_int64(self._ptrs_offset + offset, 0)
+            return
+        seg_id, pos = self._alloc_target(offset, len(value) + trailing_zero)
+        self._msg._segments[seg_id].alloc_text(pos, value, trailing_zero)
+
+    def _set_data(self, offset, value):
+        self._set_text(offset, value, trailing_zero=0)
+
+    def _set_struct(self, offset, structcls, value):
+        length = (structcls.__static_data_size__ +
+                  structcls.__static_ptrs_size__) * 8
+        seg_id, pos = self._alloc_target(offset, length)
+        self._msg._segments[seg_id].copy_from_struct(pos, structcls, value)
+
+    def _set_list(self, offset, item_type, value):
+        length = 0
+        if value is not None:
+            length = _list_length(item_type, len(value))
+        seg_id, pos = self._alloc_target(offset, length)
+        self._msg._segments[seg_id].copy_from_list(pos, item_type, value)
+
+    def _init_struct(self, offset, structcls):
+        data_size = structcls.__static_data_size__
+        ptrs_size = structcls.__static_ptrs_size__
+        seg_id, pos = self._alloc_target(offset, (data_size+ptrs_size)*8)
+        pos = self._msg._segments[seg_id].alloc_struct(pos, data_size, ptrs_size)
+        return structcls.__builder__(self._msg, seg_id, pos)
+
+    def _init_list(self, offset, item_type, item_count):
+        seg_id, pos = self._alloc_target(offset,
+                                         _list_length(item_type, item_count))
+        return ListBuilder._alloc(self._msg, seg_id, pos, item_type, item_count)
+
+
+def _list_length(item_type, item_count):
+    """
+    Return the number of bytes needed to store the body of a list
+    """
+    size_tag = item_type.size_tag
+    if size_tag == ptr.LIST_SIZE_COMPOSITE:
+        return item_type.item_length * item_count + 8 # +8 for the tag
+    elif size_tag == ptr.LIST_SIZE_BIT:
+        return (item_count+7)//8
+    return item_type.item_length * item_count
+
+
+class ListBuilder(object):
+    """
+    Builder for a list of a fixed length. Items can be set with
+    ``lst[i] = value``; for lists of structs, ``lst[i]`` returns the builder
+    of the i-th item, and for lists of lists ``lst.init(i, n)`` allocates
+    the i-th inner list.
+    """
+
+    def __init__(self, msg, seg_id, pos, item_type, item_count):
+        self._msg = msg
+        self._seg_id = seg_id
+        self._builder = msg._segments[seg_id]
+        self._pos = pos # position of the first item
+        self._item_type = item_type
+        self._item_count = item_count
+
+    @classmethod
+    def _alloc(cls, msg, seg_id, pos, item_type, item_count):
+        """
+        Allocate a new list and write the pointer to it at ``pos``
+        """
+        builder = msg._segments[seg_id]
+        size_tag = item_type.size_tag
+        if size_tag == ptr.LIST_SIZE_COMPOSITE:
+            data_size = item_type.static_data_size
+            ptrs_size = item_type.static_ptrs_size
+            total_words = (data_size+ptrs_size) * item_count
+            start = builder.alloc_list(pos, size_tag, total_words,
+                                       _list_length(item_type, item_count))
+            tag = ptr.new_struct(item_count, data_size, ptrs_size)
+            builder.write_int64(start, tag)
+            start += 8
+        else:
+            start = builder.alloc_list(pos, size_tag, item_count,
+                                       _list_length(item_type, item_count))
+        return cls(msg, seg_id, start, item_type, item_count)
+
+    def __len__(self):
+        return self._item_count
+
+    def _check_index(self, i):
+        if i < 0:
+            i += self._item_count
+        if not 0 <= i < self._item_count:
+            raise IndexError('list index out of range')
+        return i
+
+    def __getitem__(self, i):
+        item_type = self._item_type
+        if not isinstance(item_type, StructItemType):
+            raise TypeError("only the items of lists of structs can be "
+                            "retrieved from a ListBuilder")
+        i = self._check_index(i)
+        pos = self._pos + i*item_type.item_length
+        return item_type.structcls.__builder__(self._msg, self._seg_id, pos)
+
+    def __setitem__(self, i, value):
+        i = self._check_index(i)
+        item_type = self._item_type
+        if isinstance(item_type, BoolItemType):
+            byteoffset, bitoffset = divmod(i, 8)
+            self._builder.write_bool(self._pos + byteoffset, bitoffset, value)
+        elif item_type.size_tag == ptr.LIST_SIZE_PTR:
+            # text, data or list: the item might be allocated in another
+            # segment
+            seg_id, pos = self._msg._alloc_target(self._seg_id,
+                                                  self._pos + i*8,
+                                                  self._item_length(value))
+            item_type.write_item(self._msg._segments[seg_id], pos, value)
+        else:
+            pos = self._pos + i*item_type.item_length
+            item_type.write_item(self._builder, pos, value)
+
+    def _item_length(self, value):
+        if value is None:
+            return 0
+        item_type = self._item_type
+        if isinstance(item_type, ListItemType):
+            return _list_length(item_type.inner_item_type, len(value))
+        return len(value) + 1
+
+    def init(self, i, item_count):
+        """
+        Allocate the i-th item of a list of lists, and return a builder for it
+        """
+        item_type = self._item_type
+        if not isinstance(item_type, ListItemType):
+            raise TypeError("init() can be called only on lists of lists")
+        i = self._check_index(i)
+        inner = item_type.inner_item_type
+        seg_id, pos = self._msg._alloc_target(self._seg_id, self._pos + i*8,
+                                              _list_length(inner, item_count))
+        return ListBuilder._alloc(self._msg, seg_id, pos, inner, item_count)
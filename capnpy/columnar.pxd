@@ -0,0 +1,11 @@
+import cython
+from capnpy cimport ptr
+from capnpy.segment.segment cimport Segment
+from capnpy.message cimport _load_message_from_buffer, _read_message_header
+
+@cython.locals(length=Py_ssize_t, offset=Py_ssize_t)
+cpdef _find_messages(object view)
+
+@cython.locals(seg=Segment, n=Py_ssize_t, i=Py_ssize_t, start=Py_ssize_t,
+               end=Py_ssize_t, p=long)
+cpdef tuple _find_roots(object view, object offsets, object payload_type)
@@ -0,0 +1,161 @@
+"""
+Decode many messages of the same struct type into numpy arrays, one per
+field, without creating a struct object for each message.
+"""
+
+import array
+from six.moves import range
+from capnpy import ptr
+from capnpy.segment.base import as_byteview
+from capnpy.segment.segment import Segment
+from capnpy.message import _load_message_from_buffer, _read_message_header
+from capnpy.messagefile import MessageFile
+
+
+def decode_columns(source, payload_type, fields=None):
+    """
+    Decode all the messages of type ``payload_type`` contained in ``source``
+    and return a dict mapping each field name to a numpy array with one item
+    per message.
+
+    ``source`` can be a string or any object supporting the buffer protocol
+    (e.g. a ``mmap.mmap``) containing consecutive messages, as written by
+    calling dump() repeatedly; a ``MessageFile``; or a file-like object, which
+    is read until the end.
+
+    ``fields`` is the list of fields to decode; by default, all of them.
+
+    Primitive, enum and bool fields are read directly from the message
+    buffer, and give an array of the corresponding dtype (enums are returned
+    as their numeric value). Pointer fields (text, data, structs and lists)
+    give an array of dtype object, containing None where the pointer is NULL.
+    Fields which are part of an union give a ``numpy.ma.MaskedArray``, where
+    the items are masked for the messages in which the field is not set.
+    """
+    import numpy
+    layout = getattr(payload_type, '__layout__', None)
+    if layout is None:
+        raise TypeError("%s does not support columnar decoding" %
+                        payload_type.__name__)
+    if fields is None:
+        fields = list(layout)
+    for name in fields:
+        if name not in layout:
+            raise ValueError("Unknown field: %s" % name)
+    #
+    offsets = None
+    if isinstance(source, MessageFile):
+        # we can reuse its index
+        view = source._view
+        if view is None:
+            raise ValueError('I/O operation on closed MessageFile')
+        offsets = source.offsets
+    elif hasattr(source, 'read'):
+        view = as_byteview(source.read())
+    else:
+        view = as_byteview(source)
+    if offsets is None:
+        offsets = _find_messages(view)
+    starts, data_sizes = _find_roots(view, offsets, payload_type)
+    #
+    n = len(offsets)
+    raw = numpy.frombuffer(view, dtype=numpy.uint8)
+    starts = numpy.frombuffer(starts, dtype=numpy.int64, count=n)
+    data_sizes = numpy.frombuffer(data_sizes, dtype=numpy.int64, count=n) * 8
+    columns = {}
+    for name in fields:
+        kind, fmt, offset, default, tagval = layout[name]
+        if kind == 'ptr':
+            col = _decode_pointers(view, offsets, payload_type, name,
+                                   numpy.empty(n, dtype=object))
+        elif kind == 'bool':
+            byteoffset, bitoffset = divmod(offset, 8)
+            col = _gather(numpy, raw, starts, data_sizes, byteoffset, 'B')
+            col = ((col >> bitoffset) & 1) != default
+        else:
+            col = _gather(numpy, raw, starts, data_sizes, offset, fmt)
+            if default != 0:
+                col ^= default
+        if tagval is not None:
+            tags = _gather(numpy, raw, starts, data_sizes,
+                           payload_type.__tag_offset__, 'h')
+            col = numpy.ma.masked_array(col, mask=(tags != tagval))
+        columns[name] = col
+    return columns
+
+def _gather(numpy, raw, starts, data_sizes, offset, fmt):
+    """
+    Read the value of type ``fmt`` which is at ``offset`` inside the data
+    section of each struct. The structs whose data section is too small
+    (e.g. because they were written with an older version of the schema) get
+    0.
+    """
+    dtype = numpy.dtype('<' + fmt)
+    size = dtype.itemsize
+    valid = (offset + size) <= data_sizes
+    positions = numpy.where(valid, starts + offset, 0)
+    nbytes = raw[positions[:, None] + numpy.arange(size)]
+    col = nbytes.view(dtype).reshape(len(starts))
+    col = col.astype(dtype.newbyteorder('=')) # make a native copy
+    col[~valid] = 0
+    return col
+
+def _decode_pointers(view, offsets, payload_type, name, col):
+    for i in range(len(offsets)):
+        msg, end = _load_message_from_buffer(view, offsets[i])
+        obj = msg._read_struct(0, payload_type)
+        if obj is None:
+            continue
+        try:
+            col[i] = getattr(obj, name)
+        except ValueError:
+            pass # union field which is not set: it is masked anyway
+    return col
+
+def _find_messages(view):
+    """
+    Return an array containing the offset of each message in ``view``
+    """
+    length = len(view)
+    offsets = array.array('q')
+    offset = 0
+    while offset < length:
+        offsets.append(offset)
+        segments, start, offset = _read_message_header(view, offset)
+    return offsets
+
+def _find_roots(view, offsets, payload_type):
+    """
+    Return two arrays containing, for each message, the absolute offset of
+    the data section of the root struct and its size in words.
+    """
+    seg = Segment(view)
+    n = len(offsets)
+    starts = array.array('q', [0]) * n
+    data_sizes = array.array('q', [0]) * n
+    for i in range(n):
+        segments, start, end = _read_message_header(view, offsets[i])
+        p = seg.read_ptr(start)
+        if p == 0:
+            # NULL root: all the fields have their default value
+            starts[i] = start
+            data_sizes[i] = 0
+        elif ptr.kind(p) == ptr.STRUCT:
+            # fast path: the root is in the first segment. The values are
+            # read later without any bound check, so we must make sure that
+            # it is really there and does not point e.g. into the next
+            # message
+            root = ptr.deref(p, start)
+            root_size = (ptr.struct_data_size(p) + ptr.struct_ptrs_size(p))*8
+            if root < start or root + root_size > start + segments[0]*8:
+                raise ValueError("Invalid root pointer in the message at "
+                                 "offset %d" % offsets[i])
+            starts[i] = root
+            data_sizes[i] = ptr.struct_data_size(p)
+        else:
+            # slow path, e.g. the root is a far pointer
+            msg, end = _load_message_from_buffer(view, offsets[i])
+            obj = msg._read_struct(0, payload_type)
+            starts[i] = start + obj._data_offset
+            data_sizes[i] = obj._data_size
+    return starts, data_sizes
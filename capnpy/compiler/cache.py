@@ -0,0 +1,158 @@
+"""
+Persistent on-disk cache for DynamicCompiler.
+
+Compiling a schema means running ``capnp compile``, generating the source
+and, in pyx mode, building an extension module with Cython: this can easily
+take seconds, and without a cache it is done again by every process which
+loads the schema.
+
+Each entry of the cache is a directory named after a hash of everything
+which can influence the result: the content of the schema file and of all
+the files it imports (recursively), the search path, the capnpy and Python
+versions, the pyx flag and the compiler options. Since entries are never
+modified once they are created, they can be shared between processes
+without any further synchronization:
+
+  - entries are written into a temporary directory which is then atomically
+    renamed, so that nobody can ever see a half-written entry
+
+  - while compiling, we hold a lock on the whole cache, so that processes
+    starting at the same time wait for the first one to finish instead of
+    compiling the same schema over and over. There is a single lock file for
+    all the keys: this way, the directory contains only the entries and does
+    not grow with a stray lock file for each of them
+
+Note that the version of the ``capnp`` executable is not part of the key: if
+you upgrade it, you might want to clear the cache.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import py
+try:
+    import fcntl
+except ImportError:
+    # Windows: we rely only on the atomic rename, which means that two
+    # processes might compile the same schema at the same time
+    fcntl = None
+
+import capnpy
+from capnpy.compiler.util import find_schema_files
+
+LOCKFILE = 'cache.lock'
+
+
+class CacheEntry(object):
+    """
+    The content of a cache entry: the CodeGeneratorRequest returned by
+    ``capnp compile``, the generated source and, in pyx mode, the compiled
+    extension module.
+    """
+
+    def __init__(self, entrydir):
+        self.dir = entrydir
+        info = json.loads(entrydir.join('info.json').read())
+        self.modname = str(info['modname'])
+        self.tmpname = str(info['tmpname'])
+        self.dll = info['dll']
+        if self.dll is not None:
+            self.dll = entrydir.join(self.dll)
+
+    @property
+    def request(self):
+        return self.dir.join('request.bin').read_binary()
+
+    @property
+    def source(self):
+        return self.dir.join('source').read()
+
+
+class SchemaCache(object):
+
+    def __init__(self, cachedir):
+        self.cachedir = py.path.local(cachedir)
+        self.cachedir.ensure(dir=True)
+
+    def get_key(self, filename, path, pyx, options):
+        h = hashlib.sha1()
+        def add(s):
+            if not isinstance(s, bytes):
+                s = str(s).encode('utf-8')
+            h.update(s)
+            h.update(b'\0')
+        add(capnpy.__version__)
+        add(sys.version)
+        add(sys.platform)
+        add(pyx)
+        if options is not None:
+            options = [(name, getattr(options, name))
+                       for name in options.FIELDS]
+        add(options)
+        for dirname in path:
+            add(dirname)
+        for f, content in find_schema_files(filename, path):
+            add(f)
+            add(content)
+        return h.hexdigest()
+
+    def get(self, key):
+        entrydir = self.cachedir.join(key)
+        if not entrydir.check(dir=True):
+            return None
+        return CacheEntry(entrydir)
+
+    def put(self, key, modname, tmpname, request, source, dll=None):
+        """
+        Store a new entry. If another process stored the same key in the
+        meantime, we simply keep its entry: by construction, it has the very
+        same content.
+        """
+        tmpdir = py.path.local(tempfile.mkdtemp(prefix='tmp-',
+                                                dir=str(self.cachedir)))
+        try:
+            tmpdir.join('request.bin').write_binary(request)
+            tmpdir.join('source').write(source)
+            if dll is not None:
+                dll = py.path.local(dll)
+                dll.copy(tmpdir.join(dll.basename), mode=True)
+                dll = dll.basename
+            info = dict(modname=modname, tmpname=tmpname, dll=dll)
+            tmpdir.join('info.json').write(json.dumps(info))
+            try:
+                os.rename(str(tmpdir), str(self.cachedir.join(key)))
+            except OSError:
+                # the entry already exists
+                pass
+        finally:
+            if tmpdir.check():
+                shutil.rmtree(str(tmpdir), ignore_errors=True)
+        return self.get(key)
+
+    def lock(self, key):
+        # note that we cannot use a lock file per key and remove it when we
+        # are done: a process waiting on it would get the lock on a file
+        # which no longer exists, while a third one creates a new one
+        return _FileLock(self.cachedir.join(LOCKFILE))
+
+
+class _FileLock(object):
+
+    def __init__(self, lockfile):
+        self.lockfile = lockfile
+        self.f = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.f = open(str(self.lockfile), 'a')
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, etype, evalue, tb):
+        if self.f is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+            self.f.close()
+            self.f = None
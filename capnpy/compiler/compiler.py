@@ -13,13 +13,15 @@ from capnpy.message import loads
 from capnpy.blob import PYX
 from capnpy import annotate
 from capnpy.compiler.module import ModuleGenerator
-from capnpy.compiler.util import as_identifier
+from capnpy.compiler.cache import SchemaCache
+from capnpy.compiler.util import as_identifier, find_schema_files
 
 # these are the default compiler options
 DEFAULT_OPTIONS = annotate.Options(
     version_check = True,
     convert_case = True,
-    text_type = annotate.TextType.bytes
+    text_type = annotate.TextType.bytes,
+    cache_fields = False
     )
 
 PKGDIR = py.path.local(capnpy.__file__).dirpath()
@@ -59,6 +61,9 @@ class BaseCompiler(object):
 
     def generate_py_source(self, filename, pyx, options):
         request = self._parse_schema_file(filename)
+        return self._generate_from_request(request, pyx, options)
+
+    def _generate_from_request(self, request, pyx, options):
         default_options = DEFAULT_OPTIONS
         if options is not None:
             default_options = default_options.combine(options)
@@ -121,15 +126,24 @@ class BaseCompiler(object):
 
 class DynamicCompiler(BaseCompiler):
     """
-    A compiler to compile and load schemas on the fly
+    A compiler to compile and load schemas on the fly.
+
+    If ``cachedir`` is given, or if the ``CAPNPY_CACHE_DIR`` environment
+    variable is set, the compiled schemas are stored there and reused by the
+    next processes: see capnpy/compiler/cache.py.
     """
 
     standalone = False
 
-    def __init__(self, path):
+    def __init__(self, path, cachedir=None):
         BaseCompiler.__init__(self, path)
         self.modules = {}
         self.add_module(annotate)
+        if cachedir is None:
+            cachedir = os.environ.get('CAPNPY_CACHE_DIR')
+        self.cache = None
+        if cachedir:
+            self.cache = SchemaCache(cachedir)
 
     def add_module(self, mod):
         pyfile = py.path.local(mod.__file__)
@@ -165,6 +179,9 @@ class DynamicCompiler(BaseCompiler):
           - *convert_case*: whether to convert camelCase to
             camel_case. Default is True.
 
+          - *cache_fields*: whether to memoize the value of pointer fields
+            on the instance. Default is False.
+
           - *pyx*: specify whether to use **pyx mode** or **py mode**.
             Default is 'auto'
         """
@@ -178,17 +195,46 @@ class DynamicCompiler(BaseCompiler):
             return mod
 
     def _compile_file(self, filename, pyx, options):
+        if self.cache is not None:
+            return self._compile_file_cached(filename, pyx, options)
         m, src = self.generate_py_source(filename, pyx, options)
         if pyx:
             return self._compile_pyx(filename, m, src)
         else:
             return self._compile_py(filename, m, src)
 
+    def _compile_file_cached(self, filename, pyx, options):
+        key = self.cache.get_key(filename, self.path, pyx, options)
+        entry = self.cache.get(key)
+        if entry is None:
+            with self.cache.lock(key):
+                # check again: maybe another process compiled it while we
+                # were waiting for the lock
+                entry = self.cache.get(key)
+                if entry is None:
+                    data = self._capnp_compile(filename)
+                    request = loads(data, schema.CodeGeneratorRequest)
+                    m, src = self._generate_from_request(request, pyx, options)
+                    dll = None
+                    if pyx:
+                        dll = self._pyx_to_dll(filename, m, src)
+                    entry = self.cache.put(key, m.modname, m.tmpname, data,
+                                           str(src), dll)
+        if pyx:
+            return self._load_dll(filename, entry.modname, entry.tmpname,
+                                  entry.dll)
+        else:
+            return self._load_py(filename, entry.modname,
+                                 py.code.Source(entry.source))
+
     def _compile_py(self, filename, m, src):
         """
         Compile and load the schema as pure python
         """
-        mod = types.ModuleType(m.modname)
+        return self._load_py(filename, m.modname, src)
+
+    def _load_py(self, filename, modname, src):
+        mod = types.ModuleType(modname)
         mod.__file__ = str(filename)
         mod.__schema__ = str(filename)
         mod.__source__ = str(src)
@@ -200,6 +246,10 @@ class DynamicCompiler(BaseCompiler):
         """
         Use Cython to compile the schema
         """
+        dll = self._pyx_to_dll(filename, m, src)
+        return self._load_dll(filename, m.modname, m.tmpname, dll)
+
+    def _load_dll(self, filename, modname, tmpname, dll):
         import capnpy.ext # the package which we will load the .so in
         import imp
         #
@@ -215,12 +265,11 @@ class DynamicCompiler(BaseCompiler):
         # contains __compiler. Then, in foo.pyx, we import it:
         #     from foo_tmp import __compiler
         #
-        dll = self._pyx_to_dll(filename, m, src)
-        tmpmod = types.ModuleType(m.tmpname)
+        tmpmod = types.ModuleType(tmpname)
         tmpmod.__dict__['__compiler'] = self
         tmpmod.__dict__['__schema__'] = str(filename)
-        sys.modules[m.tmpname] = tmpmod
-        modname = 'capnpy.ext.%s' % m.modname
+        sys.modules[tmpname] = tmpmod
+        modname = 'capnpy.ext.%s' % modname
         mod = imp.load_dynamic(modname, str(dll))
         #
         # clean-up the cluttered sys.modules
@@ -294,7 +343,7 @@ class DistutilsCompiler(BaseCompiler):
         else:
             outfile = infile.new(ext='py')
         #
-        if outfile.exists() and outfile.mtime() > infile.mtime():
+        if self._is_up_to_date(infile, outfile):
             # already compiled
             return outfile
         cwd = py.path.local('.')
@@ -302,3 +351,16 @@ class DistutilsCompiler(BaseCompiler):
         m, src = self.generate_py_source(infile, pyx, options)
         outfile.write(src)
         return outfile
+
+    def _is_up_to_date(self, infile, outfile):
+        # outfile must be newer than the schema and all the files it imports
+        if not outfile.exists():
+            return False
+        mtime = outfile.mtime()
+        for f, content in find_schema_files(infile, self.path):
+            # imports which we cannot resolve (e.g. /capnp/c++.capnp, if it
+            # is not on the path) cannot be newer than outfile: capnp will
+            # complain in case they really do not exist
+            if content is not None and f.mtime() >= mtime:
+                return False
+        return True
@@ -3,6 +3,7 @@ import py
 import sys
 import glob
 import warnings
+import multiprocessing
 from distutils.core import Extension
 from capnpy.compiler.compiler import DistutilsCompiler
 from capnpy import annotate
@@ -14,26 +15,43 @@ except ImportError:
 # setuptools entry-points
 def capnpy_options(dist, attr, value):
     for opt in value:
-        if opt not in annotate.Options.FIELDS:
+        if opt not in annotate.Options.FIELDS and opt not in ('pyx', 'nthreads'):
             warnings.warn('Unknown capnpy option: %s' % opt)
 
 def capnpy_schemas(dist, attr, schemas):
     assert attr == 'capnpy_schemas'
     option_dict = dist.capnpy_options or {}
     pyx = option_dict.pop('pyx', 'auto')
+    nthreads = option_dict.pop('nthreads', 0)
     options = annotate.Options.from_dict(option_dict)
     if dist.ext_modules is None:
         dist.ext_modules = []
-    dist.ext_modules += capnpify(schemas, pyx, options)
+    dist.ext_modules += capnpify(schemas, pyx, options, nthreads)
 
-def capnpify(files, pyx='auto', options=None):
+def capnpify(files, pyx='auto', options=None, nthreads=0):
+    """
+    Compile the given schemas and return the list of extensions to build.
+    Schemas which are older than their compiled version are skipped.
+
+    If ``nthreads`` is greater than 1, the schemas are compiled by a pool of
+    ``nthreads`` processes, and ``nthreads`` is passed to ``cythonize``.
+    """
     cwd = py.path.local('.')
     if isinstance(files, str):
         files = glob.glob(files)
         if files == []:
             raise ValueError("'%s' did not match any files" % files)
     compiler = DistutilsCompiler(sys.path)
-    outfiles = [compiler.compile(f, pyx, options) for f in files]
+    if nthreads > 1 and len(files) > 1:
+        pool = multiprocessing.Pool(nthreads)
+        try:
+            outfiles = pool.map(_compile_one, [(f, pyx, options) for f in files])
+        finally:
+            pool.close()
+            pool.join()
+        outfiles = [py.path.local(outf) for outf in outfiles]
+    else:
+        outfiles = [compiler.compile(f, pyx, options) for f in files]
     outfiles = [outf.relto(cwd) for outf in outfiles]
     #
     if compiler.getpyx(pyx):
@@ -42,7 +60,13 @@ def capnpify(files, pyx='auto', options=None):
             ext = Extension('*', [str(f)],
                             include_dirs=compiler.include_dirs)
             exts.append(ext)
-        exts = cythonize(exts)
+        exts = cythonize(exts, nthreads=nthreads)
         return exts
     else:
         return []
+
+def _compile_one(args):
+    # executed in the worker processes of capnpify
+    filename, pyx, options = args
+    compiler = DistutilsCompiler(sys.path)
+    return str(compiler.compile(filename, pyx, options))
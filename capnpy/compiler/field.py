@@ -107,7 +107,7 @@ class Field__Slot:
 
     def _emit_text_bytes(self, m, ns, name):
         ns.name = name
-        m.def_property(ns, name, """
+        self._def_pointer_property(m, ns, name, """
             {ensure_union}
             return self._read_text_bytes({offset})
         """)
@@ -120,7 +120,7 @@ class Field__Slot:
 
     def _emit_text_unicode(self, m, ns, name):
         ns.name = name
-        m.def_property(ns, name, """
+        self._def_pointer_property(m, ns, name, """
             {ensure_union}
             return self._read_text_unicode({offset})
         """)
@@ -133,7 +133,7 @@ class Field__Slot:
 
     def _emit_data(self, m, ns, name):
         ns.name = name
-        m.def_property(ns, name, """
+        self._def_pointer_property(m, ns, name, """
             {ensure_union}
             return self._read_data({offset})
         """)
@@ -158,7 +158,7 @@ class Field__Slot:
             ns.cdef_offset = 'offset'
             ns.cdef_p = 'p'
             ns.cdef_obj = 'obj'
-        m.def_property(ns, name, """
+        self._def_pointer_property(m, ns, name, """
             {ensure_union}
             {cdef_offset} = {offset}
             {cdef_p} = self._read_fast_ptr(offset)
@@ -168,6 +168,7 @@ class Field__Slot:
                 offset += self._ptrs_offset
             if p == 0:
                 return None
+            self._seg.charge_traversal(p)
             {cdef_obj} = {structcls}.__new__({structcls})
             obj._init_from_pointer(self._seg, offset, p)
             return obj
@@ -187,7 +188,7 @@ class Field__Slot:
         ns.name = name
         t = self.slot.type.list.elementType
         ns.list_item_type = t.list_item_type(m, options)
-        m.def_property(ns, name, """
+        self._def_pointer_property(m, ns, name, """
             {ensure_union}
             return self._read_list({offset}, {list_item_type})
         """)
@@ -201,6 +202,12 @@ class Field__Slot:
         ns.w()
         self._emit_has_method(ns)
 
+    def _def_pointer_property(self, m, ns, name, src):
+        if m.options(self).cache_fields:
+            m.def_cached_property(ns, name, src)
+        else:
+            m.def_property(ns, name, src)
+
     def _emit_anyPointer(self, m, ns, name):
         ns.name = name
         m.def_property(ns, name, """
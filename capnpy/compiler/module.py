@@ -166,3 +166,27 @@ class ModuleGenerator(object):
             with ns.block('def {name}(self):', name=name):
                 ns.ww(src)
         ns.w()
+
+    def def_cached_property(self, ns, name, src):
+        """
+        Like def_property, but the value is computed only the first time and
+        stored in the _cache_{name} slot of the instance. None is never
+        cached: this way, we don't need a special marker for "not computed
+        yet", and reading a NULL pointer is cheap anyway.
+        """
+        if self.pyx:
+            ns.w('cdef object _cache_{name}', name=name)
+            with ns.block('cdef _uncached_{name}(self):', name=name):
+                ns.ww(src)
+        else:
+            ns.w('_cache_{name} = None', name=name)
+            with ns.block('def _uncached_{name}(self):', name=name):
+                ns.ww(src)
+        ns.w()
+        self.def_property(ns, name, """
+            value = self._cache_{name}
+            if value is None:
+                value = self._uncached_{name}()
+                self._cache_{name} = value
+            return value
+        """.format(name=name))
@@ -95,7 +95,10 @@ class RequestedFile:
         m.w("from capnpy.enum {cimport} BaseEnum as _BaseEnum")
         m.w("from capnpy.type import Types as _Types")
         m.w("from capnpy.segment.builder {cimport} SegmentBuilder as _SegmentBuilder")
+        m.w("from capnpy.segment.builder {cimport} new_builder as _new_builder")
+        m.w("from capnpy.segment.builder {cimport} release_builder as _release_builder")
         m.w("from capnpy.list {cimport} List as _List")
+        m.w("from capnpy.builder import StructBuilder as _StructBuilder")
         m.w("from capnpy.list {cimport} PrimitiveItemType as _PrimitiveItemType")
         m.w("from capnpy.list {cimport} BoolItemType as _BoolItemType")
         m.w("from capnpy.list {cimport} TextItemType as _TextItemType")
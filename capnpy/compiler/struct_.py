@@ -2,6 +2,7 @@ from capnpy import annotate
 from capnpy import schema
 from capnpy.type import Types
 from capnpy.compiler.structor import Structor
+from capnpy.compiler.structbuilder import StructBuilderClass
 from capnpy.compiler.fieldtree import FieldTree
 
 try:
@@ -61,6 +62,8 @@ class Node__Struct:
         ns.dotname = self.runtime_name(m)
         ns.data_size = self.struct.dataWordCount
         ns.ptrs_size = self.struct.pointerCount
+        ns.builder = StructBuilderClass.get_name(m, self)
+        StructBuilderClass(m, self).emit()
         #
         if not m.pyx:
             # use the @extend decorator only in Pure Python mode: in pyx mode
@@ -72,8 +75,10 @@ class Node__Struct:
             ns.ww("""
                 __static_data_size__ = {data_size}
                 __static_ptrs_size__ = {ptrs_size}
+                __builder__ = {builder}
 
             """)
+            self._emit_layout(m)
             for child in m.children[self.id]:
                 child.emit_reference_as_child(m)
             m.w()
@@ -92,6 +97,44 @@ class Node__Struct:
             ns.w("_{name}_list_item_type = _StructItemType({name})")
         ns.w()
 
+    def _emit_layout(self, m):
+        # describe where each field is stored inside the struct, so that
+        # capnpy.columnar can read it without creating the struct. Each
+        # field is described by a tuple (kind, fmt, offset, default, tagval):
+        #   - kind is 'data', 'bool' or 'ptr'
+        #   - offset is in bytes, except for bools where it is in bits
+        #   - tagval is the discriminant value for union fields, else None
+        # Void fields and groups are not included
+        entries = []
+        for f in self.get_struct_fields() or []:
+            if f.is_group() or f.is_void():
+                continue
+            default = 0
+            if f.slot.hadExplicitDefault:
+                default = f.slot.defaultValue.as_pyobj()
+            if f.is_bool():
+                desc = ('bool', '?', f.slot.offset, int(default))
+            elif f.is_primitive() or f.is_enum():
+                fmt = f.slot.get_fmt()
+                if isinstance(fmt, bytes):
+                    fmt = fmt.decode('ascii')
+                offset = f.slot.offset * f.slot.get_size()
+                desc = ('data', fmt, offset, default)
+            else:
+                desc = ('ptr', None, f.slot.offset * 8, None)
+            tagval = None
+            if f.is_part_of_union():
+                tagval = f.discriminantValue
+            entries.append((m.field_name(f), desc + (tagval,)))
+        ns = m.code.new_scope()
+        if not entries:
+            ns.w('__layout__ = {{}}')
+            return
+        ns.w('__layout__ = {{')
+        for name, desc in entries:
+            ns.w('    {name!r}: {desc!r},', name=str(name), desc=desc)
+        ns.w('}}')
+
     def emit_reference_as_child(self, m):
         if self.is_nested(m) and not self.struct.isGroup:
             m.w('{shortname} = {name}', shortname=self.shortname(m),
@@ -288,13 +331,60 @@ class Node__Struct:
         ns.key = ', '.join(['self.%s' % m.field_name(f) for f in fields])
         ns.w()
         ns.ww("""
+            __has_key__ = True
+
             def _key(self):
                 return ({key},)
         """) # the trailing comma is to ensure a tuple even if there is a single field
         #
+        self._emit_raw_equals_maybe(m, fields)
         if m.pyx:
             self._emit_fash_hash(m, fieldnames)
 
+    def _emit_raw_equals_maybe(self, m, fields):
+        # if the key is made only of integer and enum fields, we can compare
+        # two instances of the same class by comparing directly the relevant
+        # bytes of their data sections, without building the _key() tuples.
+        # Bools are not considered because they share their byte with other
+        # fields, and floats because 0.0 == -0.0 and nan != nan.
+        ranges = []
+        for f in fields:
+            if (not f.is_slot() or f.is_part_of_union() or
+                f.is_float32() or f.is_float64()):
+                return
+            if not (f.slot.type.is_primitive() or f.slot.type.is_enum()):
+                return
+            size = f.slot.get_size()
+            start = f.slot.offset * size
+            ranges.append((start, start+size))
+        #
+        # merge the adjacent ranges
+        ranges.sort()
+        merged = [list(ranges[0])]
+        for start, end in ranges[1:]:
+            if start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        #
+        ns = m.code.new_scope()
+        ns.data_size = (merged[-1][1] + 7) // 8 # in words
+        ns.cdef_s = 'cdef _Struct s' if m.pyx else 's'
+        ns.cond = ' and '.join(['self._data_equals(s, %d, %d)' % (start, end-start)
+                                for start, end in merged])
+        ns.w()
+        ns.ww("""
+            {cpdef} _equals(self, other):
+                if type(other) is not type(self):
+                    return _Struct._equals(self, other)
+                {cdef_s} = other
+                if self._data_size < {data_size} or s._data_size < {data_size}:
+                    # at least one of the two was written with an older
+                    # schema which does not contain all the key fields
+                    return _Struct._equals(self, other)
+                return {cond}
+        """)
+
     def _emit_fash_hash(self, m, fieldnames):
         # emit a specialized, fast __hash__.
         fields = {f.name: f for f in self.get_struct_fields()}
@@ -302,6 +392,9 @@ class Node__Struct:
         with m.code.block('def __hash__(self):') as ns:
             ns.n = len(fieldnames)
             ns.w('cdef long h[{n}]')
+            # the hash is cached: see the comment in Struct.__hash__
+            ns.w('if self._cached_hash != -1:')
+            ns.w('    return self._cached_hash')
             # compute the hash of each field
             for ns.i, fname in enumerate(fieldnames):
                 f = fields[fname]
@@ -317,7 +410,8 @@ class Node__Struct:
                     ns.w('h[{i}] = {hash}(self.{fname})')
             #
             # compute the hash of the whole tuple
-            ns.w('return _hash.tuplehash(h, {n})')
+            ns.w('self._cached_hash = _hash.tuplehash(h, {n})')
+            ns.w('return self._cached_hash')
         #
         # XXX this is a hack/workaround for what it looks like a Cython bug:
         # apparently, we need to redefine __richcmp__ together with __hash__,
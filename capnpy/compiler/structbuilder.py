@@ -0,0 +1,175 @@
+"""
+Generate the builder class which goes together with each struct: see
+capnpy/builder.py for the runtime part.
+"""
+
+class StructBuilderClass(object):
+    """
+    Emit a class like this:
+
+        class _Point_Builder(_StructBuilder):
+            __struct__ = Point
+
+            def set_x(self, value):
+                self._builder.write_int64(self._data_offset + 0, value)
+
+            def init_tags(self, n):
+                return self._init_list(0, _text_bytes_list_item_type, n)
+    """
+
+    def __init__(self, m, structnode):
+        self.m = m
+        self.node = structnode
+        self.struct = structnode.struct
+
+    @staticmethod
+    def get_name(m, structnode):
+        return '_%s_Builder' % structnode.compile_name(m)
+
+    def emit(self):
+        m = self.m
+        ns = m.code.new_scope()
+        ns.name = self.get_name(m, self.node)
+        ns.structname = self.node.compile_name(m)
+        with ns.block('class {name}(_StructBuilder):'):
+            ns.w('__struct__ = {structname}')
+            ns.w()
+            for f in self.node.get_struct_fields() or []:
+                self.emit_field(f)
+        ns.w()
+
+    def emit_field(self, f):
+        m = self.m
+        ns = m.code.new_scope()
+        ns.name = m.field_name(f)
+        if f.is_part_of_union():
+            ns.tag_offset = self.struct.discriminantOffset * 2
+            ns.tagval = f.discriminantValue
+            ns.set_tag = ns.format(
+                'self._builder.write_int16(self._data_offset + {tag_offset}, {tagval})')
+        else:
+            ns.set_tag = '# no union tag'
+        #
+        if f.is_void():
+            override = m.field_override.get(f, None)
+            if override:
+                f = override
+        if f.is_group():
+            if f.is_nullable(m):
+                self.emit_nullable(ns, f)
+            else:
+                self.emit_group(ns, f)
+            return
+        #
+        ns.offset = f.slot.offset * f.slot.get_size()
+        if f.is_void():
+            self.emit_void(ns, f)
+        elif f.is_primitive() or f.is_enum():
+            self.emit_primitive(ns, f)
+        elif f.is_bool():
+            self.emit_bool(ns, f)
+        elif f.is_text_bytes(m):
+            self.emit_pointer(ns, 'self._set_text({offset}, value)')
+        elif f.is_text_unicode(m):
+            self.emit_pointer(ns, 'self._set_text({offset}, _encode_maybe(value))')
+        elif f.is_data():
+            self.emit_pointer(ns, 'self._set_data({offset}, value)')
+        elif f.is_struct():
+            self.emit_struct(ns, f)
+        elif f.is_list():
+            self.emit_list(ns, f)
+        # anyPointer fields are not supported: they can be set only by the
+        # ctors
+
+    def emit_void(self, ns, f):
+        if f.is_part_of_union():
+            ns.ww("""
+                def set_{name}(self):
+                    {set_tag}
+            """)
+            ns.w()
+
+    def emit_primitive(self, ns, f):
+        ns.type = f.slot.get_typename()
+        if f.slot.hadExplicitDefault:
+            ns.xor_default = 'value ^= %s' % f.slot.defaultValue.as_pyobj()
+        else:
+            ns.xor_default = '# no default'
+        ns.ww("""
+            def set_{name}(self, value):
+                {set_tag}
+                {xor_default}
+                self._builder.write_{type}(self._data_offset + {offset}, value)
+        """)
+        ns.w()
+
+    def emit_bool(self, ns, f):
+        ns.byteoffset, ns.bitoffset = divmod(f.slot.offset, 8)
+        if f.slot.hadExplicitDefault:
+            ns.xor_default = 'value ^= %s' % f.slot.defaultValue.as_pyobj()
+        else:
+            ns.xor_default = '# no default'
+        ns.ww("""
+            def set_{name}(self, value):
+                {set_tag}
+                {xor_default}
+                self._builder.write_bool(self._data_offset + {byteoffset},
+                                         {bitoffset}, value)
+        """)
+        ns.w()
+
+    def emit_pointer(self, ns, write):
+        ns.write = ns.format(write)
+        ns.ww("""
+            def set_{name}(self, value):
+                {set_tag}
+                {write}
+        """)
+        ns.w()
+
+    def emit_struct(self, ns, f):
+        ns.structcls = f.slot.type.runtime_name(self.m)
+        self.emit_pointer(ns, 'self._set_struct({offset}, {structcls}, value)')
+        ns.ww("""
+            def init_{name}(self):
+                {set_tag}
+                return self._init_struct({offset}, {structcls})
+        """)
+        ns.w()
+
+    def emit_list(self, ns, f):
+        t = f.slot.type.list.elementType
+        ns.list_item_type = t.list_item_type(self.m, self.m.options(f))
+        self.emit_pointer(ns, 'self._set_list({offset}, {list_item_type}, value)')
+        ns.ww("""
+            def init_{name}(self, n):
+                {set_tag}
+                return self._init_list({offset}, {list_item_type}, n)
+        """)
+        ns.w()
+
+    def emit_group(self, ns, f):
+        groupnode = f.group.get_node(self.m)
+        ns.groupbuilder = self.get_name(self.m, groupnode)
+        ns.ww("""
+            def init_{name}(self):
+                {set_tag}
+                return {groupbuilder}(self._msg, self._seg_id, self._data_offset)
+        """)
+        ns.w()
+
+    def emit_nullable(self, ns, f):
+        # the value is None <==> is_null is set
+        groupnode = f.group.get_node(self.m)
+        ns.groupbuilder = self.get_name(self.m, groupnode)
+        ns.ww("""
+            def set_{name}(self, value):
+                {set_tag}
+                g = {groupbuilder}(self._msg, self._seg_id, self._data_offset)
+                if value is None:
+                    g.set_is_null(1)
+                else:
+                    g.set_is_null(0)
+                    g.set_value(value)
+        """)
+        ns.w()
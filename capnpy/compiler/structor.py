@@ -34,12 +34,14 @@ class Structor(object):
         ## generate a constructor which looks like this
         ## @staticmethod
         ## def __new(x=0, y=0, z=None):
-        ##     builder = _SegmentBuilder()
+        ##     builder = _new_builder(536)
         ##     pos = builder.allocate(24)
         ##     builder.write_int64(pos + 0, x)
         ##     builder.write_int64(pos + 8, y)
         ##     builder.alloc_text(pos + 16, z)
-        ##     return builder.as_string()
+        ##     _buf = builder.as_string()
+        ##     _release_builder(builder)
+        ##     return _buf
         #
         # the parameters have the same order as fields
         code = self.m.code
@@ -50,15 +52,23 @@ class Structor(object):
         code.w('@staticmethod')
         with code.cdef_('__new', self.params) as ns:
             ns.length = (self.data_size + self.ptrs_size)*8
+            # the initial capacity of the builder: the exact size for structs
+            # without pointers, else leave room for the children as the
+            # default capacity of SegmentBuilder does
+            ns.capacity = ns.length
+            if self.ptrs_size > 0:
+                ns.capacity += 512
             ns.cdef_var('_SegmentBuilder', 'builder')
             ns.cdef_var('long', 'pos')
-            ns.w('builder = _SegmentBuilder()')
+            ns.w('builder = _new_builder({capacity})')
             ns.w('pos = builder.allocate({length})')
             for union in self.fieldtree.all_unions():
                 ns.w('{union}__curtag = None', union=union.varname)
             for node in self.fieldtree.children:
                 self.handle_node(node)
-            ns.w('return builder.as_string()')
+            ns.w('_buf = builder.as_string()')
+            ns.w('_release_builder(builder)')
+            ns.w('return _buf')
 
     def handle_node(self, node):
         if node.f.is_part_of_union():
@@ -1,5 +1,9 @@
+import re
+import py
 import six
 
+IMPORT_RE = re.compile(br'\b(?:import|embed)\s*"([^"]+)"')
+
 def as_identifier(s):
     """
     Take a bytes string and make sure that it can be used as an identifier.
@@ -29,3 +33,39 @@ def as_identifier(s):
         return decoded_s
     else:
         return s
+
+def find_schema_files(filename, path):
+    """
+    Return a list of (file, content) for filename and all the files it
+    imports, recursively. Imports are found with a regexp, so we might find
+    more than the real ones (e.g. in comments): this is harmless, since it
+    can only cause an unneeded recompilation. If an imported
+    file cannot be found, its content is None and file is the name used in
+    the import.
+    """
+    result = []
+    seen = set()
+    todo = [py.path.local(filename)]
+    while todo:
+        f = todo.pop()
+        if str(f) in seen:
+            continue
+        seen.add(str(f))
+        if not f.check(file=True):
+            result.append((f, None))
+            continue
+        content = f.read_binary()
+        result.append((f, content))
+        for name in IMPORT_RE.findall(content):
+            name = name.decode('utf-8')
+            if name.startswith('/'):
+                candidates = [py.path.local(d).join(name) for d in path]
+            else:
+                candidates = [f.dirpath().join(name)]
+            for candidate in candidates:
+                if candidate.check(file=True):
+                    todo.append(candidate)
+                    break
+            else:
+                result.append((name, None))
+    return result
@@ -7,6 +7,7 @@ from capnpy.segment.endof cimport endof
 from capnpy.segment.builder cimport SegmentBuilder
 
 cdef class ItemType(object)
+cdef class ListIndex(object)
 
 cdef class List(Blob):
     cdef readonly long _offset
@@ -17,12 +18,51 @@ cdef class List(Blob):
     cdef readonly long _item_count
     cdef readonly long _item_length
     cdef readonly long _item_offset
+    cdef readonly long _start
+    cdef readonly long _step
+    cdef ListIndex _index
 
     cpdef _init_from_buffer(self, object buf, long offset, long size_tag,
                             long item_count, ItemType item_type)
     cpdef _set_list_tag(self, long size_tag, long item_count)
     cpdef _getitem_fast(self, long i)
 
+    @cython.locals(obj=List, start=long, stop=long, step=long)
+    cpdef List _slice(self, object s)
+    cpdef bint _is_view(self)
+    cpdef bint _is_contiguous(self)
+    cpdef long _get_start(self)
+
+    @cython.locals(last=long)
+    cpdef long _physical_count(self)
+
+    cpdef ListIndex build_index(self, object key=*)
+    cpdef lookup(self, object key)
+
+    @cython.locals(kind=object, fmt=object, offset=long, default=object,
+                   tagval=object, data_length=long)
+    cpdef tuple _sort_field(self, object field)
+    cpdef _read_sort_key(self, long i, long offset, char ifmt)
+
+    @cython.locals(offset=long, ifmt=char, lo=long, hi=long, mid=long)
+    cpdef long bisect_left(self, object field, object value) except -1
+
+    @cython.locals(offset=long, ifmt=char, lo=long, hi=long, mid=long)
+    cpdef long bisect_right(self, object field, object value) except -1
+
+cdef class ListIndex(object):
+    cdef readonly List lst
+    cdef readonly object key
+    cdef readonly long mask
+    cdef object hashes
+    cdef object positions
+
+    @cython.locals(j=long)
+    cpdef _insert(self, long h, long i)
+
+    @cython.locals(h=long, j=long, i=long)
+    cpdef lookup(self, object key)
+
 cdef class ItemType(object):
     cdef readonly long item_length
     cdef readonly long size_tag
@@ -1,4 +1,7 @@
+import sys
 import struct
+import array
+from six import PY3
 from six.moves import range
 
 import capnpy
@@ -29,6 +32,9 @@ class List(Blob):
         self._init_blob(buf)
         self._offset = offset
         self._item_type = item_type
+        self._index = None
+        self._start = 0
+        self._step = 1
         self._set_list_tag(size_tag, item_count)
 
     def __reduce__(self):
@@ -58,8 +64,7 @@ class List(Blob):
 
     def __getitem__(self, i):
         if isinstance(i, slice):
-            idx = range(*i.indices(len(self)))
-            return [self._getitem_fast(j) for j in idx]
+            return self._slice(i)
         if i < 0:
             i += self._item_count
         if 0 <= i < self._item_count:
@@ -70,19 +75,85 @@ class List(Blob):
         """
         WARNING: no bound checks!
         """
-        return self._item_type.read_item(self, i)
+        return self._item_type.read_item(self, self._start + i*self._step)
+
+    def _slice(self, s):
+        """
+        Return a view over the items selected by the slice ``s``: the new
+        List shares the same segment, and the items are not read until they
+        are accessed.
+
+        A view keeps the layout of the underlying list: the i-th item of the
+        view is the item number ``_start + i*_step`` of the list.
+        """
+        start, stop, step = s.indices(self._item_count)
+        obj = List.__new__(List)
+        obj._init_blob(self._seg)
+        obj._offset = self._offset
+        obj._item_type = self._item_type
+        obj._index = None
+        obj._size_tag = self._size_tag
+        obj._tag = self._tag
+        obj._item_length = self._item_length
+        obj._item_offset = self._item_offset
+        obj._item_count = len(range(start, stop, step))
+        obj._start = self._start + start*self._step
+        obj._step = self._step * step
+        return obj
+
+    def _is_view(self):
+        return self._start != 0 or self._step != 1
+
+    def _physical_count(self):
+        """
+        Return the number of items of the underlying list which we need to
+        read to get all the items of the view, i.e. up to the one with the
+        highest index
+        """
+        if self._item_count == 0:
+            return 0
+        last = self._start + (self._item_count-1)*self._step
+        return max(self._start, last) + 1
+
+    def _is_contiguous(self):
+        """
+        Return True if the items are laid out in memory exactly as the ones
+        of a standalone list. This is not the case for views whose step is
+        not 1, nor for views over lists of structs (the items are preceded by
+        the tag of the whole list) or of bools (the first item might not
+        start at a byte boundary).
+        """
+        if not self._is_view():
+            return True
+        return (self._step == 1 and
+                self._size_tag != ptr.LIST_SIZE_COMPOSITE and
+                self._size_tag != ptr.LIST_SIZE_BIT)
+
+    def _get_start(self):
+        """
+        Return the offset of the first item. For views, it makes sense only
+        if _is_contiguous() is True.
+        """
+        return self._offset + self._start*self._item_length
 
     def _get_end(self):
+        if not self._is_contiguous():
+            return -1
         p = ptr.new_list(0, self._size_tag, self._item_count)
-        return endof(self._seg, p, self._offset-8)
+        return endof(self._seg, p, self._get_start()-8)
 
     def _get_slice(self):
         # XXX: investigate whether it is faster to user memoryview for
         # comparing the memory without doing a full copy
-        start = self._offset
+        start = self._get_start()
         end = self._get_end()
         return self._seg.buf[start:end]
 
+    def _print_buf(self, start=None, end='auto', **kwds):
+        if start is None:
+            start = self._get_start()
+        Blob._print_buf(self, start, end, **kwds)
+
     def _equals(self, other):
         if not self._item_type.can_compare():
             raise TypeError("Cannot compare lists of structs.")
@@ -90,6 +161,9 @@ class List(Blob):
             return list(self) == other
         if self.__class__ is not other.__class__:
             return False
+        if self._is_view() or other._is_view():
+            # the items are not contiguous in memory: compare them one by one
+            return list(self) == list(other)
         return (self._item_count == other._item_count and
                 self._item_type.get_type() == other._item_type.get_type() and
                 self._get_slice() == other._get_slice())
@@ -98,6 +172,252 @@ class List(Blob):
         parts = [self._item_type.item_repr(item) for item in self]
         return '[%s]' % (', '.join(parts))
 
+    def _array_fmt(self):
+        item_type = self._item_type
+        if isinstance(item_type, BoolItemType):
+            return None
+        if isinstance(item_type, PrimitiveItemType):
+            return item_type.t.fmt.decode('ascii')
+        raise TypeError("as_numpy() and as_array() are supported only for "
+                        "lists of primitives, enums and bools")
+
+    def as_numpy(self):
+        """
+        Return a read-only numpy array containing the items of the list.
+
+        For lists of primitives and enums, the array is a zero-copy view over
+        the underlying buffer. Lists of bools are stored as packed bits, so
+        they are unpacked into a new array of dtype bool.
+        """
+        # check the item type first, so that unsupported lists raise
+        # TypeError also when numpy is not installed
+        fmt = self._array_fmt()
+        import numpy
+        buf = self._seg.buf
+        n = self._physical_count()
+        if fmt is None:
+            nbytes = (n + 7) // 8
+            packed = numpy.frombuffer(buf, dtype=numpy.uint8, count=nbytes,
+                                      offset=self._offset)
+            bits = numpy.unpackbits(packed, bitorder='little')
+            res = bits[:n].astype(bool)
+        else:
+            res = numpy.frombuffer(buf, dtype=numpy.dtype('<' + fmt),
+                                   count=n, offset=self._offset)
+        if self._is_view():
+            res = res[self._start::self._step][:self._item_count]
+        res.flags.writeable = False
+        return res
+
+    def as_array(self):
+        """
+        Like as_numpy(), but return an array.array, for when numpy is not
+        available. The items are copied with a single bulk copy; lists of
+        bools are returned as an array of 0s and 1s with typecode 'B'.
+        """
+        fmt = self._array_fmt()
+        start = self._offset
+        n = self._physical_count()
+        if fmt is None:
+            data = bytearray(self._seg.buf[start:start + (n + 7) // 8])
+            res = array.array('B', [(data[i >> 3] >> (i & 7)) & 1
+                                    for i in range(n)])
+        else:
+            res = array.array(fmt)
+            end = start + n * self._item_length
+            data = bytes(self._seg.buf[start:end])
+            if PY3:
+                res.frombytes(data)
+            else:
+                res.fromstring(data)
+            if sys.byteorder == 'big':
+                res.byteswap()
+        if self._is_view():
+            res = res[self._start::self._step][:self._item_count]
+        return res
+
+
+    # ------------------------------------------------------
+    # Lookup by key
+    # ------------------------------------------------------
+
+    def build_index(self, key=None):
+        """
+        Build a hash index over the items of a list of structs, to be used by
+        lookup(). ``key`` is a function which computes the key of an item: by
+        default, it is the key specified by ``$Py.key``.
+
+        The items are read only once, to compute the hashes of their keys:
+        the index stores only the hashes and the positions of the items.
+        """
+        if not isinstance(self._item_type, StructItemType):
+            raise TypeError("build_index() is supported only for lists "
+                            "of structs")
+        if key is None:
+            key = _py_key
+        self._index = ListIndex(self, key)
+        return self._index
+
+    def index_by_key(self):
+        """
+        Same as build_index(), using the ``$Py.key`` of the items
+        """
+        return self.build_index()
+
+    def lookup(self, key):
+        """
+        Return the first item whose key is ``key``, or raise KeyError. If
+        build_index() has not been called yet, the list is indexed by
+        ``$Py.key``.
+
+        The index is kept on this List object: reading a list field again
+        returns a new List (unless the field is cached), which has to build
+        its own index.
+        """
+        if self._index is None:
+            self.build_index()
+        return self._index.lookup(key)
+
+
+    # ------------------------------------------------------
+    # Binary search on lists of structs sorted by a field
+    # ------------------------------------------------------
+
+    def _sort_field(self, field):
+        """
+        Return the offset and the ifmt of ``field`` inside the items of a list
+        of structs, as found in the __layout__ of the struct class. The offset
+        is -1 if the items were written with an older schema whose data
+        section does not contain the field, which thus reads as 0.
+        """
+        if not isinstance(self._item_type, StructItemType):
+            raise TypeError("bisect() and range() are supported only for "
+                            "lists of structs")
+        layout = getattr(self._item_type.structcls, '__layout__', None) or {}
+        try:
+            kind, fmt, offset, default, tagval = layout[field]
+        except KeyError:
+            raise ValueError("Unknown field: %s" % field)
+        if kind != 'data' or tagval is not None or default != 0:
+            raise TypeError("bisect() and range() are supported only for "
+                            "primitive fields without explicit defaults "
+                            "which are not part of an union")
+        data_length = ptr.struct_data_size(self._tag) * 8
+        if offset + struct.calcsize(fmt) > data_length:
+            offset = -1
+        return offset, ord(fmt)
+
+    def _read_sort_key(self, i, offset, ifmt):
+        """
+        WARNING: no bound checks on i!
+        """
+        if offset == -1:
+            return 0
+        i = self._start + i*self._step
+        offset += self._offset + self._item_offset + i*self._item_length
+        return self._seg.read_primitive(offset, ifmt)
+
+    def bisect_left(self, field, value):
+        """
+        Return the index of the first item whose ``field`` is not less than
+        ``value``, like bisect.bisect_left. The list must be sorted by
+        ``field``, which must be a primitive field: the items are not
+        created, only the field is read directly from the buffer.
+        """
+        offset, ifmt = self._sort_field(field)
+        lo = 0
+        hi = self._item_count
+        while lo < hi:
+            mid = (lo+hi) // 2
+            if self._read_sort_key(mid, offset, ifmt) < value:
+                lo = mid+1
+            else:
+                hi = mid
+        return lo
+
+    def bisect_right(self, field, value):
+        """
+        Like bisect_left(), but return the index of the first item whose
+        ``field`` is greater than ``value``.
+        """
+        offset, ifmt = self._sort_field(field)
+        lo = 0
+        hi = self._item_count
+        while lo < hi:
+            mid = (lo+hi) // 2
+            if value < self._read_sort_key(mid, offset, ifmt):
+                hi = mid
+            else:
+                lo = mid+1
+        return lo
+
+    def bisect(self, field, value):
+        """
+        Same as bisect_right(), like bisect.bisect
+        """
+        return self.bisect_right(field, value)
+
+    def range(self, field, lo, hi):
+        """
+        Return the items whose ``field`` is greater or equal than ``lo`` and
+        less than ``hi``. The list must be sorted by ``field``: see
+        bisect_left().
+        """
+        start = self.bisect_left(field, lo)
+        stop = self.bisect_left(field, hi)
+        return self[start:stop]
+
+
+def _py_key(item):
+    return item._key()
+
+
+class ListIndex(object):
+    """
+    Open addressing hash table which maps the keys of the items of a List to
+    their positions. Collisions are resolved by linear probing, and slots
+    whose position is -1 are empty.
+    """
+
+    def __init__(self, lst, key):
+        n = lst._item_count
+        size = 8
+        while size < n*2:
+            size *= 2
+        self.lst = lst
+        self.key = key
+        self.mask = size-1
+        self.hashes = array.array('q', [0]) * size
+        self.positions = array.array('q', [-1]) * size
+        for i in range(n):
+            self._insert(hash(key(lst._getitem_fast(i))), i)
+
+    def __len__(self):
+        return self.lst._item_count
+
+    def _insert(self, h, i):
+        j = h & self.mask
+        while self.positions[j] != -1:
+            j = (j+1) & self.mask
+        self.hashes[j] = h
+        self.positions[j] = i
+
+    def lookup(self, key):
+        if self.key is _py_key and isinstance(key, Blob):
+            # we want to be able to look up a struct by another struct
+            key = key._key()
+        h = hash(key)
+        j = h & self.mask
+        while True:
+            i = self.positions[j]
+            if i == -1:
+                raise KeyError(key)
+            if self.hashes[j] == h:
+                item = self.lst._getitem_fast(i)
+                if self.key(item) == key:
+                    return item
+            j = (j+1) & self.mask
+
 
 class ItemType(object):
 
@@ -309,6 +629,7 @@ class ListItemType(ItemType):
         p = lst._seg.read_ptr(offset)
         if ptr.kind(p) == ptr.FAR:
             offset, p = lst._seg.read_far_ptr(offset)
+        lst._seg.charge_traversal(p)
         obj = List.__new__(List)
         obj._init_from_buffer(lst._seg,
                               ptr.deref(p, offset),
@@ -1,22 +1,44 @@
 import cython
 from capnpy.segment.base cimport unpack_uint32
 from capnpy.segment.segment cimport Segment
-from capnpy.segment.builder cimport SegmentBuilder
+from capnpy.segment.builder cimport SegmentBuilder, new_builder, release_builder
 from capnpy.struct_ cimport Struct, struct_from_buffer
 from capnpy cimport ptr
 from capnpy.filelike cimport FileLike, as_filelike
+from capnpy.buffered cimport RingBufferedStream
+from capnpy.packed cimport pack, unpack, PackedReader
 
 
 @cython.locals(msg=Struct, f2=FileLike)
-cpdef load(object f, object payload_type)
+cpdef load(object f, object payload_type, object traversal_limit_in_words=*,
+           object nesting_limit=*)
 
-cpdef loads(bytes buf, object payload_type)
+cpdef loads(object buf, object payload_type,
+            object traversal_limit_in_words=*, object nesting_limit=*)
+
+@cython.locals(msg=Struct, end=Py_ssize_t)
+cpdef _loads_buffer(object buf, object payload_type,
+                    object traversal_limit_in_words, object nesting_limit)
+
+@cython.locals(msg=Struct, reader=PackedReader)
+cpdef load_packed(object f, object payload_type,
+                  object traversal_limit_in_words=*, object nesting_limit=*)
+
+cpdef loads_packed(object buf, object payload_type,
+                   object traversal_limit_in_words=*, object nesting_limit=*)
 #cpdef load_all(FileLike f, object payload_type)
 
+@cython.locals(seg=Segment)
+cpdef _read_root(Struct msg, object payload_type,
+                 object traversal_limit_in_words, object nesting_limit)
+
 
 @cython.locals(buf = bytes, n=int)
 cpdef Struct _load_message(FileLike f)
 
+@cython.locals(buf=bytes, n=long, header_size=long, message_lenght=long)
+cpdef Struct _load_message_view(RingBufferedStream f)
+
 @cython.locals(buf=bytes, message_size=int, message_lenght=int)
 cpdef _load_buffer_single_segment(FileLike f)
 
@@ -24,6 +46,28 @@ cpdef _load_buffer_single_segment(FileLike f)
                 padding=int, message_lenght=int, offset=int, size=int)
 cpdef _load_buffer_multiple_segments(FileLike f, int n)
 
+@cython.locals(start=Py_ssize_t, end=Py_ssize_t)
+cpdef tuple _load_message_from_buffer(object view, Py_ssize_t offset)
+
+@cython.locals(seg_offset=Py_ssize_t, size=long)
+cpdef Struct _message_from_segments(object buf, list segments)
+
+@cython.locals(length=Py_ssize_t, n=long, header_size=Py_ssize_t,
+               start=Py_ssize_t, end=Py_ssize_t, message_lenght=Py_ssize_t)
+cpdef tuple _read_message_header(object view, Py_ssize_t offset)
+
+@cython.locals(buf=bytes)
+cpdef dumps(Struct obj, bint fastpath=*, bint packed=*)
+
+@cython.locals(buf=bytes)
+cpdef bytes _dump_bytes(Struct obj)
+
 @cython.locals(builder=SegmentBuilder, segment_size=long, segment_count=long,
-               p=long, start=long, end=long)
-cpdef dumps(Struct obj, bint fastpath=*)
+               p=long, start=long, end=long, buf=bytes)
+cpdef bytes _dumps(Struct obj, bint fastpath)
+
+@cython.locals(obj=Struct, scratch=bytearray, parts=list, i=long, p=long,
+               start=long, end=long)
+cpdef dump_many(object objs, object f, bint fastpath=*)
+
+cpdef dumps_packed(Struct obj, bint fastpath=*)
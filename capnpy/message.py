@@ -1,15 +1,19 @@
+import os
 import struct
-from capnpy.segment.base import unpack_uint32
+from functools import partial
+from capnpy.segment.base import unpack_uint32, as_byteview
 from capnpy.segment.segment import Segment, MultiSegment
-from capnpy.segment.builder import SegmentBuilder
+from capnpy.segment.builder import SegmentBuilder, new_builder, release_builder
 from capnpy.struct_ import Struct, struct_from_buffer
 from capnpy import ptr
 from capnpy.filelike import as_filelike
-from capnpy.buffered import StringBuffer
+from capnpy.buffered import (StringBuffer, RingBufferedStream, BufferedSocket,
+                             RingBufferedSocket)
+from capnpy.packed import pack, unpack, PackedReader
 from six.moves import range
 
 
-def load(f, payload_type):
+def load(f, payload_type, traversal_limit_in_words=None, nesting_limit=None):
     """
     Load a message of type ``payload_type`` from f.
 
@@ -24,32 +28,117 @@ def load(f, payload_type):
       - (0 or 4 bytes) Padding up to the next word boundary.
 
       - The content of each segment, in order.
+
+    If f is a RingBufferedStream, the body of the message is not copied: the
+    returned object points directly into the buffer of the stream.
+
+    To protect against malicious messages, it is possible to limit the work
+    done to read them:
+
+      - ``traversal_limit_in_words``: the total size of the objects which can
+        be dereferenced, summed over all the reads. If a pointer is followed
+        twice, its target is counted twice, so a message whose pointers
+        overlap cannot amplify the work.
+
+      - ``nesting_limit``: the maximum depth of nested structs and lists
+        which can be copied by e.g. compact() or dumps(), or checked by
+        endof().
+
+    ValueError is raised when a limit is exceeded. By default, there is no
+    limit.
     """
-    f2 = as_filelike(f)
-    msg = _load_message(f2)
-    return msg._read_struct(0, payload_type)
+    if isinstance(f, RingBufferedStream):
+        msg = _load_message_view(f)
+    else:
+        f2 = as_filelike(f)
+        msg = _load_message(f2)
+    return _read_root(msg, payload_type, traversal_limit_in_words, nesting_limit)
 
-def loads(buf, payload_type):
+def loads(buf, payload_type, traversal_limit_in_words=None, nesting_limit=None):
     """
-    Same as load(), but load from a string instead of a file
+    Same as load(), but load from a string instead of a file.
+
+    ``buf`` can also be any object which supports the buffer protocol, such as
+    ``memoryview``, ``mmap.mmap`` or a numpy ``uint8`` array. In that case,
+    the segments are not copied: the returned object keeps a reference to
+    ``buf`` and reads its fields directly from there.
     """
+    if not isinstance(buf, bytes):
+        return _loads_buffer(buf, payload_type, traversal_limit_in_words,
+                             nesting_limit)
     f = StringBuffer(buf)
-    obj = load(f, payload_type)
+    obj = load(f, payload_type, traversal_limit_in_words, nesting_limit)
     if f.tell() != len(buf):
         remaining = len(buf)-f.tell()
         raise ValueError("Not all bytes were consumed: %d bytes left" % remaining)
     return obj
 
-def load_all(f, payload_type):
+def _loads_buffer(buf, payload_type, traversal_limit_in_words, nesting_limit):
+    view = as_byteview(buf)
+    msg, end = _load_message_from_buffer(view, 0)
+    if end != len(view):
+        remaining = len(view)-end
+        raise ValueError("Not all bytes were consumed: %d bytes left" % remaining)
+    return _read_root(msg, payload_type, traversal_limit_in_words, nesting_limit)
+
+def load_all(f, payload_type, traversal_limit_in_words=None, nesting_limit=None):
+    """
+    Load and yield all the messages in the given file-like object. The limits
+    apply to each message separately.
+    """
+    try:
+        while True:
+            yield load(f, payload_type, traversal_limit_in_words, nesting_limit)
+    except EOFError:
+        pass
+
+def load_packed(f, payload_type, traversal_limit_in_words=None,
+                nesting_limit=None):
+    """
+    Same as load(), but the message is expected to be encoded using the capnp
+    packing scheme, as written by dump_packed().
+
+    Only the bytes which belong to the message are consumed from f, so it is
+    possible to load several consecutive packed messages from the same
+    file.
+    """
+    reader = PackedReader(as_filelike(f))
+    msg = _load_message(reader)
+    if not reader.at_boundary():
+        raise ValueError("The message ends in the middle of a packed run")
+    return _read_root(msg, payload_type, traversal_limit_in_words, nesting_limit)
+
+def loads_packed(buf, payload_type, traversal_limit_in_words=None,
+                 nesting_limit=None):
     """
-    Load and yield all the messages in the given file-like object
+    Same as load_packed(), but load from a string instead of a file
+    """
+    return loads(unpack(buf), payload_type, traversal_limit_in_words,
+                 nesting_limit)
+
+def load_all_packed(f, payload_type, traversal_limit_in_words=None,
+                    nesting_limit=None):
+    """
+    Load and yield all the packed messages in the given file-like object
     """
     try:
         while True:
-            yield load(f, payload_type)
+            yield load_packed(f, payload_type, traversal_limit_in_words,
+                              nesting_limit)
     except EOFError:
         pass
 
+def _read_root(msg, payload_type, traversal_limit_in_words, nesting_limit):
+    """
+    Set the limits on the segment of ``msg`` and read its root
+    """
+    seg = msg._seg
+    if traversal_limit_in_words is not None:
+        seg.traversal_limit = traversal_limit_in_words
+    if nesting_limit is not None:
+        seg.nesting_limit = nesting_limit
+    return msg._read_struct(0, payload_type)
+
 def _load_message(f):
     # read the total number of segments
     buf = f.read(4)
@@ -71,6 +160,34 @@ def _load_message(f):
     return struct_from_buffer(Struct, capnp_buf, 0, data_size=0, ptrs_size=1)
 
 
+def _load_message_view(f):
+    # zero-copy version of _load_message, for RingBufferedStream
+    buf = f.read(4)
+    if len(buf) < 4:
+        raise EOFError("No message to load")
+    n = unpack_uint32(buf, 0) + 1
+    #
+    # read the size of each segment plus the padding up to the next word
+    # boundary, all at once
+    header_size = 4 + n*4
+    if header_size & 7 != 0:
+        header_size += 8-(header_size & 7)
+    buf = f.read(header_size - 4)
+    if len(buf) < header_size - 4:
+        raise ValueError("Unexpected EOF when reading the header")
+    segments = [unpack_uint32(buf, i*4) for i in range(n)]
+    message_lenght = sum(segments)*8
+    view = f.readview(message_lenght)
+    if len(view) < message_lenght:
+        if n == 1:
+            raise ValueError("Unexpected EOF: expected %d bytes, got only %s. "
+                             "Segment size: %s" % (message_lenght, len(view),
+                                                   segments[0]))
+        raise ValueError("Unexpected EOF: expected %d bytes, got only %s. "
+                         "Segments size: %s" % (message_lenght, len(view),
+                                                segments))
+    return _message_from_segments(view, segments)
+
 def _load_buffer_single_segment(f):
     # fast path for the single-segment case. In this scenario, we don't
     # even need to compute the padding as we know that we read exactly 4+4
@@ -126,12 +243,75 @@ def _load_buffer_multiple_segments(f, n):
     # 5. we are finally done :)
     return MultiSegment(buf, tuple(segment_offsets))
 
-def dumps(obj, fastpath=True):
+def _load_message_from_buffer(view, offset):
+    """
+    Load the message which starts at ``offset`` inside ``view``, which must be
+    a memoryview as returned by as_byteview(). This is the zero-copy
+    equivalent of _load_message: the segments are slices of ``view``.
+
+    Return the message and the offset at which it ends.
+    """
+    segments, start, end = _read_message_header(view, offset)
+    msg = _message_from_segments(view[start:end], segments)
+    return msg, end
+
+def _message_from_segments(buf, segments):
+    """
+    Return the root of the message whose body is ``buf``, given the list of
+    the segment sizes in words
+    """
+    if len(segments) == 1:
+        seg = Segment(buf)
+    else:
+        segment_offsets = []
+        seg_offset = 0
+        for size in segments:
+            segment_offsets.append(seg_offset)
+            seg_offset += size*8
+        seg = MultiSegment(buf, tuple(segment_offsets))
+    return struct_from_buffer(Struct, seg, 0, data_size=0, ptrs_size=1)
+
+def _read_message_header(view, offset):
+    """
+    Read the header of the message which starts at ``offset`` inside
+    ``view``. Return a tuple (segments, start, end), where segments is the
+    list of the segment sizes, and start:end is the range of the message body.
+    """
+    length = len(view)
+    if offset + 4 > length:
+        raise EOFError("No message to load")
+    n = unpack_uint32(view, offset) + 1
+    #
+    # compute the size of the header, including the padding up to the next
+    # word boundary
+    header_size = 4 + n*4
+    if header_size & 7 != 0:
+        header_size += 8-(header_size & 7)
+    if offset + header_size > length:
+        raise ValueError("Unexpected EOF when reading the header")
+    segments = [unpack_uint32(view, offset + 4 + i*4) for i in range(n)]
+    #
+    start = offset + header_size
+    message_lenght = sum(segments)*8
+    end = start + message_lenght
+    if end > length:
+        if n == 1:
+            raise ValueError("Unexpected EOF: expected %d bytes, got only %s. "
+                             "Segment size: %s" % (message_lenght, length-start,
+                                                   segments[0]))
+        raise ValueError("Unexpected EOF: expected %d bytes, got only %s. "
+                         "Segments size: %s" % (message_lenght, length-start,
+                                                segments))
+    return segments, start, end
+
+def dumps(obj, fastpath=True, packed=False):
     """
     Dump a struct into a message, returned as a string of bytes.
 
     The message is encoded using the recommended capnp format for serializing
-    messages over a stream. It always uses a single segment.
+    messages over a stream. It always uses a single segment. If ``packed`` is
+    True, the message is additionally compressed using the capnp packing
+    scheme.
 
     By default, it tries to follow a fast path: it checks if the object is
     "compact" (as defined by capnpy/visit.py) and, is so, uses a fast memcpy
@@ -141,7 +321,50 @@ def dumps(obj, fastpath=True):
     and 10x faster on PyPy. However, if the object is **not** compact, the
     fast path check makes it ~2x slower. If you are sure that the object is
     not compact, you can disable the check by passing ``fastpath=False``.
+
+    When following the fast path, the result of the check is cached on the
+    object. If enable_dump_cache() has been called, the message itself is
+    cached too, so dumping it again is O(1): see ``_dump_bytes``.
     """
+    if fastpath:
+        buf = _dump_bytes(obj)
+    else:
+        buf = _dumps(obj, False)
+    if packed:
+        return pack(buf)
+    return buf
+
+# see enable_dump_cache()
+DUMP_CACHE = False
+
+def enable_dump_cache(enabled=True):
+    """
+    Enable or disable the caching of the messages returned by dumps() on the
+    dumped objects. When enabled, dumping the same object again returns the
+    very same bytes without copying them, but every object which has been
+    dumped keeps its message alive: this roughly doubles the memory used by
+    the objects which are dumped.
+    """
+    global DUMP_CACHE
+    DUMP_CACHE = enabled
+
+def _dump_bytes(obj):
+    """
+    Same as dumps(obj), but the message is cached on the object: the
+    subsequent calls return the very same bytes object. Since capnpy objects
+    are immutable, the cache never needs to be invalidated, but it assumes
+    that the underlying buffer is not modified behind our back.
+
+    The message is cached only if enable_dump_cache() has been called.
+    """
+    buf = obj._cached_dump
+    if buf is None:
+        buf = _dumps(obj, True)
+        if DUMP_CACHE:
+            obj._cached_dump = buf
+    return buf
+
+def _dumps(obj, fastpath):
     if fastpath:
         # try the fast path: if the object is compact, we can dump the
         # object with a fast memcpy
@@ -155,9 +378,9 @@ def dumps(obj, fastpath=True):
         # difference seems negligible, for small objects at least.
         start = obj._data_offset
         p = ptr.new_struct(0, obj._data_size, obj._ptrs_size)
-        return obj._seg.dump_message(p, start, end)
+        buf = obj._seg.dump_message(p, start, end)
     else:
-        builder = SegmentBuilder()
+        builder = new_builder()
         builder.allocate(16) # reserve space for segment header+the root pointer
         builder.copy_from_struct(8, Struct, obj)
         segment_count = 1
@@ -165,11 +388,110 @@ def dumps(obj, fastpath=True):
                                                      # and convert to words
         builder.write_uint32(0, segment_count - 1)
         builder.write_uint32(4, segment_size)
-        return builder.as_string()
+        buf = builder.as_string()
+        release_builder(builder)
+    return buf
 
-def dump(obj, f, fastpath=True):
+def dump(obj, f, fastpath=True, packed=False):
     """
     Same as dumps, but write to the specified file instead of returning a
     string
     """
-    f.write(dumps(obj, fastpath))
+    f.write(dumps(obj, fastpath, packed))
+
+def dump_many(objs, f, fastpath=True):
+    """
+    Dump each of the given structs as a separate message, as calling dump()
+    on each of them would do.
+
+    The messages are written in batches, each one with a single vectored
+    system call: socket.sendmsg() if f is a socket, a BufferedSocket or a
+    RingBufferedSocket, os.writev() if f is a real file. The headers are built
+    into a small scratch buffer, and the body of compact objects is sent
+    directly from their buffer, without concatenating or copying it.
+    """
+    parts = []
+    i = 0
+    for obj in objs:
+        if i == 0:
+            # we need a new scratch buffer for each batch: f.write() might
+            # keep a reference to the parts of the previous one, e.g. if f is
+            # a buffered writer
+            scratch = bytearray(DUMP_BATCH_SIZE * 16)
+            scratch_view = memoryview(scratch)
+        if fastpath:
+            end = obj._get_end()
+        else:
+            end = -1
+        if end != -1:
+            start = obj._data_offset
+            p = ptr.new_struct(0, obj._data_size, obj._ptrs_size)
+            struct.pack_into('<IIq', scratch, i*16, 0, (end-start)//8 + 1, p)
+            parts.append(scratch_view[i*16:i*16+16])
+            parts.append(memoryview(obj._seg.buf)[start:end])
+        else:
+            parts.append(dumps(obj, fastpath=False))
+        i += 1
+        if i == DUMP_BATCH_SIZE:
+            _write_parts(f, parts)
+            parts = []
+            i = 0
+    if parts:
+        _write_parts(f, parts)
+
+# each message needs at most 2 parts: this way, a batch never exceeds IOV_MAX,
+# which is 1024 on Linux
+DUMP_BATCH_SIZE = 512
+IOV_MAX = 1024
+
+def _write_parts(f, parts):
+    """
+    Write all the given parts (bytes or memoryviews) to f, using a single
+    vectored system call when possible
+    """
+    if isinstance(f, (BufferedSocket, RingBufferedSocket)):
+        if f.wbuf:
+            f.flush()
+        f = f.sock
+    sendmsg = getattr(f, 'sendmsg', None)
+    if sendmsg is not None:
+        _write_vectored(sendmsg, parts)
+        return
+    fileno = getattr(f, 'fileno', None)
+    if hasattr(os, 'writev') and fileno is not None:
+        try:
+            fd = fileno()
+        except (AttributeError, IOError, OSError, ValueError):
+            fd = None # e.g. a BytesIO
+        if fd is not None:
+            f.flush()
+            _write_vectored(partial(os.writev, fd), parts)
+            return
+    for part in parts:
+        f.write(part)
+
+def _write_vectored(write, parts):
+    """
+    Call write(parts), which is either os.writev or socket.sendmsg, until all
+    the parts have been written
+    """
+    parts = [memoryview(part) for part in parts]
+    while parts:
+        n = write(parts[:IOV_MAX])
+        while parts and n >= len(parts[0]):
+            n -= len(parts[0])
+            parts.pop(0)
+        if parts and n:
+            parts[0] = parts[0][n:]
+
+def dumps_packed(obj, fastpath=True):
+    """
+    Same as dumps(obj, packed=True)
+    """
+    return dumps(obj, fastpath, True)
+
+def dump_packed(obj, f, fastpath=True):
+    """
+    Same as dump(obj, f, packed=True)
+    """
+    f.write(dumps(obj, fastpath, True))
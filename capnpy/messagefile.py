@@ -0,0 +1,143 @@
+import os
+import mmap
+import array
+import struct
+from six import PY3
+from six.moves import range
+from capnpy.segment.base import as_byteview
+from capnpy.message import _load_message_from_buffer, _read_message_header
+
+
+class MessageFile(object):
+    """
+    Random-access reader for a file containing many consecutive messages, as
+    written e.g. by calling dump() repeatedly.
+
+    The file is memory-mapped, and the structs returned by indexing or
+    iterating point directly into the mapping, without copying. The first
+    time, the file is scanned to build an index of the offsets at which each
+    message starts. If ``index_path`` is given, the index is saved there and
+    reused the next time, as long as the size and modification time of the
+    file do not change.
+
+    MessageFile needs Python 3: on Python 2, memoryviews cannot point into a
+    mmap.
+    """
+
+    INDEX_MAGIC = b'capnpidx'
+    INDEX_HEADER = struct.Struct('=8sqqq') # magic, size, mtime_ns, count
+
+    def __init__(self, path, payload_type, index_path=None):
+        if not PY3:
+            raise RuntimeError("MessageFile requires Python 3")
+        self.path = path
+        self.payload_type = payload_type
+        self.index_path = index_path
+        self._file = open(path, 'rb')
+        st = os.fstat(self._file.fileno())
+        self._stat = (st.st_size, st.st_mtime_ns)
+        if st.st_size == 0:
+            # it is not possible to mmap an empty file
+            self._mmap = None
+            self._view = memoryview(b'')
+        else:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            self._view = as_byteview(self._mmap)
+        self.offsets = None
+        if index_path is not None:
+            self.offsets = self._load_index(index_path)
+        if self.offsets is None:
+            self.offsets = self._build_index()
+            if index_path is not None:
+                self._save_index(index_path)
+
+    def close(self):
+        """
+        Close the file. The structs which have been returned so far keep the
+        mapping alive, so they can still be used after close().
+        """
+        if self._file is None:
+            return
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # some struct is still pointing into the mapping: it will be
+                # closed automatically when the last one goes away
+                pass
+        self._file.close()
+        self._mmap = None
+        self._view = None
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, evalue, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._load(j) for j in range(*i.indices(len(self)))]
+        n = len(self.offsets)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('MessageFile index out of range')
+        return self._load(i)
+
+    def __iter__(self):
+        for i in range(len(self.offsets)):
+            yield self._load(i)
+
+    def __reversed__(self):
+        for i in range(len(self.offsets)-1, -1, -1):
+            yield self._load(i)
+
+    def _load(self, i):
+        if self._view is None:
+            raise ValueError('I/O operation on closed MessageFile')
+        msg, end = _load_message_from_buffer(self._view, self.offsets[i])
+        return msg._read_struct(0, self.payload_type)
+
+    def _build_index(self):
+        view = self._view
+        length = len(view)
+        offsets = array.array('q')
+        offset = 0
+        while offset < length:
+            offsets.append(offset)
+            segments, start, offset = _read_message_header(view, offset)
+        return offsets
+
+    def _load_index(self, index_path):
+        try:
+            with open(index_path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        hsize = self.INDEX_HEADER.size
+        if len(data) < hsize:
+            return None
+        magic, size, mtime_ns, count = self.INDEX_HEADER.unpack_from(data, 0)
+        if (magic != self.INDEX_MAGIC or (size, mtime_ns) != self._stat or
+            len(data) != hsize + count*8):
+            return None # stale or corrupted index
+        offsets = array.array('q')
+        offsets.frombytes(data[hsize:])
+        return offsets
+
+    def _save_index(self, index_path):
+        size, mtime_ns = self._stat
+        header = self.INDEX_HEADER.pack(self.INDEX_MAGIC, size, mtime_ns,
+                                        len(self.offsets))
+        tmp = index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(self.offsets.tobytes())
+        os.replace(tmp, index_path)
@@ -0,0 +1,16 @@
+from libc.stdint cimport uint8_t
+from capnpy.filelike cimport FileLike
+
+cpdef bytes pack(object buf)
+cpdef bytes unpack(object buf)
+
+cdef class PackedReader(FileLike):
+    cdef readonly FileLike f
+    cdef readonly long zeros
+    cdef readonly long raw
+    cdef uint8_t pending[8]
+    cdef int pending_start
+
+    cpdef bint at_boundary(self)
+    cpdef bytes read(self, int size=*)
+    cdef long _read_words(self, uint8_t* dst, long nwords) except -1
@@ -0,0 +1,189 @@
+# This is the pure python version. Note that it exists packed.pyx, which is
+# automatically used if you enable cython compilation. The two versions should
+# stay in-sync, as they are supposed to implement the same API. Make sure that
+# every feature you add is tested by test_packed.
+
+"""
+Implementation of the capnproto packing scheme:
+    https://capnproto.org/encoding.html#packing
+
+Each word is encoded as a tag byte, whose bits indicate which of the 8 bytes
+of the word are nonzero, followed by the nonzero bytes themselves. Moreover:
+
+  - a tag of 0x00 is followed by a byte containing the number of additional
+    zero words which follow
+
+  - a tag of 0xff is followed by a byte containing the number of additional
+    words which follow verbatim, uncompressed
+"""
+
+from six.moves import range
+from capnpy.filelike import FileLike
+
+ZERO_WORD = b'\x00' * 8
+_POPCOUNT = tuple(bin(i).count('1') for i in range(256))
+
+
+def pack(buf):
+    """
+    Pack ``buf``, whose length must be a multiple of 8 bytes, and return the
+    packed string. ``buf`` can be a string or any object supporting the
+    buffer protocol.
+    """
+    n = len(buf)
+    if n & 7:
+        raise ValueError("The length of the buffer must be a multiple of 8 "
+                         "bytes: got %d" % n)
+    buf = bytearray(buf) # indexing returns ints both on Python 2 and 3
+    out = bytearray()
+    i = 0
+    while i < n:
+        tag = 0
+        tagpos = len(out)
+        out.append(0)
+        for j in range(8):
+            b = buf[i+j]
+            if b:
+                tag |= 1 << j
+                out.append(b)
+        out[tagpos] = tag
+        i += 8
+        if tag == 0:
+            # count the zero words which follow
+            start = i
+            limit = min(n, i + 255*8)
+            while i < limit and buf[i:i+8] == ZERO_WORD:
+                i += 8
+            out.append((i-start) // 8)
+        elif tag == 0xff:
+            # count the words which follow and contain at most one zero
+            # byte: with two or more zeros, packing becomes a net win
+            start = i
+            limit = min(n, i + 255*8)
+            while i < limit and buf[i:i+8].count(b'\x00') < 2:
+                i += 8
+            out.append((i-start) // 8)
+            out += buf[start:i]
+    return bytes(out)
+
+
+def unpack(buf):
+    """
+    Unpack the given packed string or buffer, and return the unpacked string.
+    """
+    buf = bytearray(buf)
+    n = len(buf)
+    out = bytearray()
+    i = 0
+    while i < n:
+        tag = buf[i]
+        i += 1
+        if i + _POPCOUNT[tag] > n:
+            raise ValueError("Unexpected EOF: truncated packed data")
+        for j in range(8):
+            if tag & (1 << j):
+                out.append(buf[i])
+                i += 1
+            else:
+                out.append(0)
+        if tag == 0 or tag == 0xff:
+            if i >= n:
+                raise ValueError("Unexpected EOF: truncated packed data")
+            count = buf[i]
+            i += 1
+            if tag == 0:
+                out += ZERO_WORD * count
+            else:
+                length = count*8
+                if i + length > n:
+                    raise ValueError("Unexpected EOF: truncated packed data")
+                out += buf[i:i+length]
+                i += length
+    return bytes(out)
+
+
+class PackedReader(FileLike):
+    """
+    file-like object which unpacks on the fly the data read from ``f``.
+
+    It reads from ``f`` only the bytes which are strictly needed to return the
+    requested amount of unpacked data: this way, it is possible to read
+    several consecutive packed messages from the same stream, creating a new
+    PackedReader for each of them.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.zeros = 0      # zero words still to emit because of a 0x00 tag
+        self.raw = 0        # raw words still to read because of a 0xff tag
+        self.pending = b''  # unpacked bytes which have not been consumed yet
+
+    def at_boundary(self):
+        """
+        Return True if all the unpacked data has been consumed and we are not
+        in the middle of a zero or raw run.
+        """
+        return not (self.zeros or self.raw or self.pending)
+
+    def read(self, size=-1):
+        if size < 0:
+            raise ValueError("PackedReader.read() needs an explicit size")
+        result = self.pending[:size]
+        self.pending = self.pending[size:]
+        parts = [result]
+        total = len(result)
+        while total < size:
+            need = size - total
+            if self.raw and need >= 8:
+                # fast path: read many raw words at once
+                k = min(self.raw, need // 8)
+                word = self._read_exactly(k*8)
+                self.raw -= k
+            else:
+                word = self._read_word()
+                if not word:
+                    break # EOF
+                if need < 8:
+                    self.pending = word[need:]
+                    word = word[:need]
+            parts.append(word)
+            total += len(word)
+        return b''.join(parts)
+
+    def _read_exactly(self, n):
+        data = self.f.read(n)
+        if len(data) < n:
+            raise ValueError("Unexpected EOF: truncated packed data")
+        return data
+
+    def _read_word(self):
+        """
+        Read and unpack a single word. Return b'' if there is no more data.
+        """
+        if self.zeros:
+            self.zeros -= 1
+            return ZERO_WORD
+        if self.raw:
+            self.raw -= 1
+            return self._read_exactly(8)
+        tag = self.f.read(1)
+        if not tag:
+            return b''
+        tag = ord(tag)
+        nbytes = _POPCOUNT[tag]
+        if tag == 0 or tag == 0xff:
+            nbytes += 1 # the count byte
+        data = bytearray(self._read_exactly(nbytes))
+        if tag == 0:
+            self.zeros = data[0]
+            return ZERO_WORD
+        elif tag == 0xff:
+            self.raw = data[8]
+            return bytes(data[:8])
+        word = bytearray(8)
+        j = 0
+        for i in range(8):
+            if tag & (1 << i):
+                word[i] = data[j]
+                j += 1
+        return bytes(word)
@@ -0,0 +1,231 @@
+# This is the cython version of packed.py. See the docstring there for a
+# description of the packing scheme.
+
+from libc.stdint cimport uint8_t, uint64_t
+from libc.string cimport memcpy, memset
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+from capnpy.filelike cimport FileLike
+from capnpy.packing cimport as_cbuf
+
+cdef extern from "_util.h":
+    cdef Py_ssize_t _PyString_GET_SIZE(object string)
+    cdef char* _PyString_AS_STRING(object string)
+    cdef bytes _PyString_FromStringAndSize(char *v, Py_ssize_t len)
+
+
+cdef inline int popcount8(uint8_t x):
+    x = x - ((x >> 1) & 0x55)
+    x = (x & 0x33) + ((x >> 2) & 0x33)
+    return (x + (x >> 4)) & 0x0f
+
+cdef inline int count_zeros(const uint8_t* word):
+    cdef int i, res = 0
+    for i in range(8):
+        res += (word[i] == 0)
+    return res
+
+cdef object raise_truncated():
+    raise ValueError("Unexpected EOF: truncated packed data")
+
+
+cpdef bytes pack(object buf):
+    cdef Py_ssize_t n
+    cdef const uint8_t* src = <const uint8_t*>as_cbuf(buf, &n)
+    if n & 7:
+        raise ValueError("The length of the buffer must be a multiple of 8 "
+                         "bytes: got %d" % n)
+    #
+    # in the worst case, packing adds one byte every two words, plus the
+    # count byte of a trailing 0xff tag
+    cdef Py_ssize_t maxlen = n + n/8 + 16
+    cdef uint8_t* out = <uint8_t*>PyMem_Malloc(maxlen)
+    if out == NULL:
+        raise MemoryError()
+    #
+    cdef Py_ssize_t i = 0, o = 0, start, limit, tagpos
+    cdef uint8_t tag, b
+    cdef int j
+    try:
+        while i < n:
+            tag = 0
+            tagpos = o
+            o += 1
+            for j in range(8):
+                b = src[i+j]
+                if b:
+                    tag |= (1 << j)
+                    out[o] = b
+                    o += 1
+            out[tagpos] = tag
+            i += 8
+            if tag == 0:
+                # count the zero words which follow
+                start = i
+                limit = min(n, i + 255*8)
+                while i < limit and (<uint64_t*>(src+i))[0] == 0:
+                    i += 8
+                out[o] = (i-start) / 8
+                o += 1
+            elif tag == 0xff:
+                # count the words which follow and contain at most one zero
+                # byte: with two or more zeros, packing becomes a net win
+                start = i
+                limit = min(n, i + 255*8)
+                while i < limit and count_zeros(src+i) < 2:
+                    i += 8
+                out[o] = (i-start) / 8
+                o += 1
+                memcpy(out+o, src+start, i-start)
+                o += i-start
+        return _PyString_FromStringAndSize(<char*>out, o)
+    finally:
+        PyMem_Free(out)
+
+
+cpdef bytes unpack(object buf):
+    cdef Py_ssize_t n
+    cdef const uint8_t* src = <const uint8_t*>as_cbuf(buf, &n)
+    cdef Py_ssize_t i = 0, o = 0, length = 0, count
+    cdef uint8_t tag
+    cdef int j
+    #
+    # first pass: validate the input and compute the unpacked length
+    while i < n:
+        tag = src[i]
+        i += 1 + popcount8(tag)
+        length += 8
+        if tag == 0 or tag == 0xff:
+            if i >= n:
+                raise_truncated()
+            count = src[i]
+            i += 1
+            length += count*8
+            if tag == 0xff:
+                i += count*8
+    if i > n:
+        raise_truncated()
+    #
+    # second pass: unpack
+    cdef bytes res = _PyString_FromStringAndSize(NULL, length)
+    cdef uint8_t* out = <uint8_t*>_PyString_AS_STRING(res)
+    i = 0
+    while i < n:
+        tag = src[i]
+        i += 1
+        for j in range(8):
+            if tag & (1 << j):
+                out[o+j] = src[i]
+                i += 1
+            else:
+                out[o+j] = 0
+        o += 8
+        if tag == 0:
+            count = src[i]*8
+            i += 1
+            memset(out+o, 0, count)
+            o += count
+        elif tag == 0xff:
+            count = src[i]*8
+            i += 1
+            memcpy(out+o, src+i, count)
+            i += count
+            o += count
+    return res
+
+
+cdef class PackedReader(FileLike):
+    """
+    file-like object which unpacks on the fly the data read from ``f``.
+
+    It reads from ``f`` only the bytes which are strictly needed to return the
+    requested amount of unpacked data: this way, it is possible to read
+    several consecutive packed messages from the same stream, creating a new
+    PackedReader for each of them.
+    """
+
+    def __cinit__(self, FileLike f):
+        self.f = f
+        self.zeros = 0
+        self.raw = 0
+        self.pending_start = 8 # pending[pending_start:8] is not consumed yet
+
+    cpdef bint at_boundary(self):
+        return self.zeros == 0 and self.raw == 0 and self.pending_start == 8
+
+    cpdef bytes read(self, int size=-1):
+        cdef Py_ssize_t pos, k
+        if size < 0:
+            raise ValueError("PackedReader.read() needs an explicit size")
+        cdef bytes res = _PyString_FromStringAndSize(NULL, size)
+        cdef uint8_t* dst = <uint8_t*>_PyString_AS_STRING(res)
+        #
+        # 1. consume the pending bytes
+        pos = min(8 - self.pending_start, size)
+        memcpy(dst, self.pending + self.pending_start, pos)
+        self.pending_start += pos
+        #
+        # 2. unpack all the whole words directly into the result
+        k = (size - pos) / 8
+        if k:
+            pos += self._read_words(dst+pos, k) * 8
+        #
+        # 3. unpack the last partial word, if needed
+        k = size - pos
+        if 0 < k < 8 and self._read_words(self.pending, 1):
+            memcpy(dst+pos, self.pending, k)
+            self.pending_start = k
+            pos += k
+        #
+        if pos < size:
+            return res[:pos] # EOF
+        return res
+
+    cdef long _read_words(self, uint8_t* dst, long nwords) except -1:
+        """
+        Unpack up to nwords words into dst. Return the number of words which
+        have been read, which is less than nwords only in case of EOF.
+        """
+        cdef long done = 0, k
+        cdef bytes data
+        cdef const uint8_t* src
+        cdef uint8_t tag
+        cdef int i, j, nbytes
+        while done < nwords:
+            if self.zeros:
+                k = min(self.zeros, nwords-done)
+                memset(dst + done*8, 0, k*8)
+                self.zeros -= k
+                done += k
+            elif self.raw:
+                k = min(self.raw, nwords-done)
+                data = self.f.read(k*8)
+                if _PyString_GET_SIZE(data) < k*8:
+                    raise_truncated()
+                memcpy(dst + done*8, _PyString_AS_STRING(data), k*8)
+                self.raw -= k
+                done += k
+            else:
+                data = self.f.read(1)
+                if _PyString_GET_SIZE(data) == 0:
+                    break # EOF
+                tag = (<const uint8_t*>_PyString_AS_STRING(data))[0]
+                nbytes = popcount8(tag)
+                if tag == 0 or tag == 0xff:
+                    nbytes += 1 # the count byte
+                data = self.f.read(nbytes)
+                if _PyString_GET_SIZE(data) < nbytes:
+                    raise_truncated()
+                src = <const uint8_t*>_PyString_AS_STRING(data)
+                j = 0
+                for i in range(8):
+                    if tag & (1 << i):
+                        dst[done*8+i] = src[j]
+                        j += 1
+                    else:
+                        dst[done*8+i] = 0
+                if tag == 0:
+                    self.zeros = src[0]
+                elif tag == 0xff:
+                    self.raw = src[8]
+                done += 1
+        return done
@@ -1,3 +1,5 @@
+from cpython.buffer cimport (PyObject_GetBuffer, PyBuffer_Release,
+                             PyBUF_SIMPLE, PyBUF_WRITABLE)
 from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
                           uint32_t, int32_t, int64_t, uint64_t, INT64_MAX)
 
@@ -30,10 +32,29 @@ cdef char* as_cbuf(object buf, Py_ssize_t* length, bint rw=0) except NULL:
         length[0] = PyByteArray_GET_SIZE(ba_buf)
         return PyByteArray_AS_STRING(ba_buf)
     else:
+        return as_cbuf_slow(buf, length, rw)
+
+cdef char* as_cbuf_slow(object buf, Py_ssize_t* length, bint rw) except NULL:
+    # generic path for all the other objects which support the buffer
+    # protocol, such as memoryview, mmap or numpy arrays. The buffer is
+    # released immediately: the pointer is valid as long as the caller keeps
+    # a reference to buf and does not resize it, which is always the case for
+    # the short-lived calls in this module
+    cdef Py_buffer view
+    cdef int flags = PyBUF_SIMPLE
+    if rw:
+        flags |= PyBUF_WRITABLE
+    try:
+        PyObject_GetBuffer(buf, &view, flags)
+    except (TypeError, BufferError):
         if rw:
-            raise TypeError("Expected bytearray")
+            raise TypeError("Expected bytearray or a writable buffer")
         else:
-            raise TypeError("Expected str or bytearray")
+            raise TypeError("Expected str, bytearray or a buffer")
+    length[0] = view.len
+    cdef char* res = <char*>view.buf
+    PyBuffer_Release(&view)
+    return res
 
 cdef checkbound(int size, Py_ssize_t length, int offset):
     if offset < 0 or offset + size > length:
@@ -2,6 +2,7 @@
 Look at the docstring of _copy_pointer.py for an explanation of why we
 need fakecython/cython.compiled/etc.
 """
+import sys
 from pypytools import fakecython
 from six import PY3
 
@@ -11,9 +12,49 @@ with fakecython:
 if not cython.compiled:
     from capnpy import ptr
     from capnpy.segment.builder import SegmentBuilder
-    from capnpy.list import ItemType, StructItemType
+    from capnpy.list import ItemType, StructItemType, PrimitiveItemType
     if PY3: long = int
 
+# buffer format characters which are compatible with each of the capnp
+# primitive types: the itemsize is checked separately
+_FORMAT_KIND = {}
+for _c in 'bhilqn':
+    _FORMAT_KIND[_c] = 'signed'
+for _c in 'BHILQN':
+    _FORMAT_KIND[_c] = 'unsigned'
+for _c in 'fd':
+    _FORMAT_KIND[_c] = 'float'
+
+def _as_primitive_buffer(item_type, lst):
+    """
+    If lst supports the buffer protocol and its memory layout is the same as
+    the body of a list of item_type, return a memoryview over it. Else,
+    return None and let the caller fall back to the item-by-item copy.
+    """
+    if isinstance(lst, (list, tuple)):
+        return None
+    if not isinstance(item_type, PrimitiveItemType):
+        return None
+    try:
+        view = memoryview(lst)
+    except TypeError:
+        return None
+    if view.ndim != 1 or not view.c_contiguous:
+        return None
+    fmt = view.format
+    byteorder = '@'
+    if fmt[:1] in ('@', '=', '<', '>', '!'):
+        byteorder = fmt[0]
+        fmt = fmt[1:]
+    if byteorder in ('>', '!') or (byteorder != '<' and
+                                   sys.byteorder != 'little'):
+        return None
+    expected = item_type.t.fmt.decode('ascii')
+    if (view.itemsize != item_type.item_length or
+        _FORMAT_KIND.get(fmt) != _FORMAT_KIND[expected]):
+        return None
+    return view
+
 @cython.ccall
 @cython.locals(builder=SegmentBuilder, pos=long, item_type=ItemType,
                item_length=long, size_tag=long, item_count=long, body_length=long,
@@ -42,6 +83,12 @@ def copy_from_list(builder, pos, item_type, lst):
     else:
         # alloc the list, no tag
         pos = builder.alloc_list(pos, size_tag, item_count, body_length)
+        view = _as_primitive_buffer(item_type, lst)
+        if view is not None:
+            # fast path: e.g. an array.array or a numpy array of the right
+            # type, which we can copy in a single memcpy
+            builder.write_buffer(pos, view)
+            return
     #
     for item in lst:
         item_type.write_item(builder, pos, item)
@@ -30,7 +30,9 @@ if not cython.compiled:
     from capnpy import ptr
     from capnpy.segment.builder import SegmentBuilder
     from capnpy.segment.base import BaseSegment
+    from capnpy.segment.stack import LongStack
     if PY3: long = int
+    bint = bool
 
     # we cannot call this check_bounds directly, else Cython (incorrectly)
     # thinks that we are overriding the low-level check_bounds defined in
@@ -64,88 +66,200 @@ if not cython.compiled:
 ##@cython.returns(long)
 ##@cython.except_(-1)
 @cython.locals(src=BaseSegment, p=long, src_pos=long, dst=SegmentBuilder, dst_pos=long,
-               kind=long)
-def copy_pointer(src, p, src_pos, dst, dst_pos):
+               depth=long, check_limits=bint, level=long, stack=LongStack,
+               pos=long, dpos=long, n=long, items=long, ptrs_size=long,
+               data_length=long, kind=long, size_tag=long, data_size=long,
+               ds=long, count=long, body_length=long, total_words=long, tag=long,
+               child_pos=long, child_dpos=long, child_n=long, child_items=long,
+               child_ptrs_size=long, child_data_length=long)
+def copy_pointer(src, p, src_pos, dst, dst_pos, depth=0):
     """
     Copy from: BaseSegment src, pointer p living at the src_pos offset
            to: SegmentBuilder dst at position dst_pos
+
+    depth is the nesting level of the object pointed by p: it is checked
+    against src.nesting_limit, and the size of each object is charged to
+    src.traversal_limit.
+
+    The objects are copied in depth-first order, but without recursion: the
+    unfinished pointer sections are saved in an explicit stack, so that the
+    depth of the object does not cost any C or Python stack frame. A section
+    is described by pos and dpos (the offsets of the next pointer to copy in
+    src and dst), n (the number of pointers left in the current item) and,
+    for composite lists, items (the number of items left after the current
+    one): to go to the next item, we skip its data section, which is
+    data_length bytes, and we reset n to ptrs_size.
     """
-    kind = ptr.kind(p)
-    if kind == ptr.STRUCT:
-        return _copy_struct(src, p, src_pos, dst, dst_pos)
-    elif kind == ptr.LIST:
-        item_size = ptr.list_size_tag(p)
-        if item_size == ptr.LIST_SIZE_COMPOSITE:
-            return _copy_list_composite(src, p, src_pos, dst, dst_pos)
-        elif item_size == ptr.LIST_SIZE_PTR:
-            return _copy_list_ptr(src, p, src_pos, dst, dst_pos)
-        else:
-            return _copy_list_primitive(src, p, src_pos, dst, dst_pos)
-    elif kind == ptr.FAR:
-        src_pos, p = src.read_far_ptr(src_pos)
-        return copy_pointer(src, p, src_pos, dst, dst_pos)
+    # check the limits only if they are set, to avoid two virtual calls per
+    # object in the common case
+    check_limits = src.nesting_limit >= 0 or src.traversal_limit >= 0
+    #
+    # the root object has no parent section, so we start by copying it
+    level = depth - 1
+    pos = 0
+    dpos = 0
+    n = 0
+    items = 0
+    ptrs_size = 0
+    data_length = 0
+    stack = None
+    while True:
+        # 1. copy the object pointed by p, and write the pointer to the copy
+        # at dst_pos
+        kind = ptr.kind(p)
+        if kind == ptr.FAR:
+            src_pos, p = src.read_far_ptr(src_pos)
+            kind = ptr.kind(p)
+        if check_limits:
+            src.check_nesting(level+1)
+            src.charge_traversal(p)
+        child_n = 0
+        if kind == ptr.STRUCT:
+            src_pos = ptr.deref(p, src_pos)
+            data_size = ptr.struct_data_size(p)
+            child_ptrs_size = ptr.struct_ptrs_size(p)
+            if data_size + child_ptrs_size == 0:
+                # "empty" struct, no need to allocate
+                dst.write_int64(dst_pos, ptr.new_struct(-1, 0, 0))
+            else:
+                ds = data_size*8
+                dst_pos = dst.alloc_struct(dst_pos, data_size, child_ptrs_size)
+                check_bounds(src, ds, src_pos)
+                dst.write_slice(dst_pos, src, src_pos, ds) # copy data section
+                check_bounds(src, child_ptrs_size*8, src_pos+ds)
+                child_pos = src_pos + ds
+                child_dpos = dst_pos + ds
+                child_n = child_ptrs_size
+                child_items = 0
+                child_data_length = 0
+        elif kind == ptr.LIST:
+            size_tag = ptr.list_size_tag(p)
+            if size_tag == ptr.LIST_SIZE_COMPOSITE:
+                src_pos = ptr.deref(p, src_pos)
+                total_words = ptr.list_item_count(p) # n of words NOT including the tag
+                body_length = (total_words+1)*8      # total length INCLUDING the tag
+                #
+                # check that there is enough data for both the tag AND the
+                # whole body; this way we do the bound checking only once
+                check_bounds(src, body_length, src_pos)
+                tag = read_int64_fast(src, src_pos)
+                count = ptr.offset(tag)
+                data_size = ptr.struct_data_size(tag)
+                child_ptrs_size = ptr.struct_ptrs_size(tag)
+                #
+                # allocate the list and copy the whole body at once; then, we
+                # iterate over the elements to fix the pointers and copy the
+                # content
+                dst_pos = dst.alloc_list(dst_pos, ptr.LIST_SIZE_COMPOSITE,
+                                         total_words, body_length)
+                dst.write_slice(dst_pos, src, src_pos, body_length)
+                if count > 0:
+                    child_data_length = data_size*8
+                    child_pos = src_pos + 8 + child_data_length
+                    child_dpos = dst_pos + 8 + child_data_length
+                    child_n = child_ptrs_size
+                    child_items = count - 1
+            elif size_tag == ptr.LIST_SIZE_PTR:
+                src_pos = ptr.deref(p, src_pos)
+                count = ptr.list_item_count(p)
+                body_length = count*8
+                dst_pos = dst.alloc_list(dst_pos, ptr.LIST_SIZE_PTR, count, body_length)
+                check_bounds(src, body_length, src_pos)
+                child_pos = src_pos
+                child_dpos = dst_pos
+                child_n = count
+                child_items = 0
+                child_ptrs_size = 0
+                child_data_length = 0
+            else:
+                _copy_list_primitive(src, p, src_pos, dst, dst_pos)
+        #
+        # 2. if the object has pointers, descend into it. If the current
+        # section is finished we don't need to come back to it, so we don't
+        # push it: this way, long chains of objects don't grow the stack
+        if child_n > 0:
+            if n > 0 or items > 0:
+                if stack is None:
+                    stack = LongStack()
+                stack.push(pos)
+                stack.push(dpos)
+                stack.push(n)
+                stack.push(items)
+                stack.push(ptrs_size)
+                stack.push(data_length)
+                stack.push(level)
+            pos = child_pos
+            dpos = child_dpos
+            n = child_n
+            items = child_items
+            ptrs_size = child_ptrs_size
+            data_length = child_data_length
+            level += 1
+        #
+        # 3. find the next non-NULL pointer, popping the finished sections
+        while True:
+            if n == 0:
+                if items > 0:
+                    items -= 1
+                    pos += data_length
+                    dpos += data_length
+                    n = ptrs_size
+                    continue
+                if stack is None or stack.is_empty():
+                    return
+                level = stack.pop()
+                data_length = stack.pop()
+                ptrs_size = stack.pop()
+                items = stack.pop()
+                n = stack.pop()
+                dpos = stack.pop()
+                pos = stack.pop()
+                continue
+            p = read_int64_fast(src, pos)
+            src_pos = pos
+            dst_pos = dpos
+            pos += 8
+            dpos += 8
+            n -= 1
+            if p != 0:
+                break
 
 
 @cython.cfunc
 ##@cython.returns(long)
 ##@cython.except_(-1)
 @cython.locals(n=long, src=BaseSegment, src_pos=long, dst=SegmentBuilder, dst_pos=long,
-               i=long, p=long, offset=long)
-def _copy_many_ptrs(n, src, src_pos, dst, dst_pos):
+               depth=long, i=long, p=long, offset=long)
+def _copy_many_ptrs(n, src, src_pos, dst, dst_pos, depth):
     check_bounds(src, n*8, src_pos)
     for i in range(n):
         offset = i*8
         p = read_int64_fast(src, src_pos + offset)
         if p != 0:
-            copy_pointer(src, p, src_pos + offset, dst, dst_pos + offset)
+            copy_pointer(src, p, src_pos + offset, dst, dst_pos + offset, depth+1)
 
 
 @cython.cfunc
 ##@cython.returns(long)
 ##@cython.except_(-1)
 @cython.locals(src=BaseSegment, p=long, src_pos=long, dst=SegmentBuilder, dst_pos=long,
-               data_size=long, ptrs_size=long, ds=long)
-def _copy_struct(src, p, src_pos, dst, dst_pos):
-    src_pos = ptr.deref(p, src_pos)
-    data_size = ptr.struct_data_size(p)
-    ptrs_size = ptr.struct_ptrs_size(p)
-    if data_size + ptrs_size == 0:
-        # "empty" struct, no need to allocate
-        dst.write_int64(dst_pos, ptr.new_struct(-1, 0, 0))
-        return
-    ds = data_size*8
-    dst_pos = dst.alloc_struct(dst_pos, data_size, ptrs_size)
-    check_bounds(src, ds, src_pos)
-    dst.write_slice(dst_pos, src, src_pos, ds) # copy data section
-    _copy_many_ptrs(ptrs_size, src, src_pos+ds, dst, dst_pos+ds)
-
-
-@cython.cfunc
-##@cython.returns(long)
-##@cython.except_(-1)
-@cython.locals(src=BaseSegment, p=long, src_pos=long, dst=SegmentBuilder, dst_pos=long,
-               data_size=long, ptrs_size=long, ds=long)
-def _copy_struct_inline(src, p, src_pos, dst, dst_pos):
-    # this does the same as _copy_struct, but instead of allocating space for
-    # it, it fills an already-allocated space (useful e.g. for writing structs
-    # into lists).
-    #
-    # I have tried several ways to reduce code duplication (such as adding a
-    # do_allocation param to determine whether to allocate or not), but it
-    # always caused a ~30% slowdown. Apparently, it seems to be related to the
-    # number of call-sites to _copy_struct: at the moment of writing is it
-    # called only from copy_pointer, but it seems enough to add another call
-    # site (even if it's never actually called!) to cause the slowdown. Maybe
-    # it's because this causes GCC not to inline it? Anyway, the only solution
-    # I found, was to duplicate some of the code :(
+               depth=long, data_size=long, ptrs_size=long, ds=long)
+def _copy_struct_inline(src, p, src_pos, dst, dst_pos, depth):
+    # this copies a struct as copy_pointer does, but instead of allocating
+    # space for it, it fills an already-allocated space (useful e.g. for
+    # writing structs into lists). The children are copied by calling
+    # copy_pointer on each of them, which does not recurse.
     #
+    if src.nesting_limit >= 0 or src.traversal_limit >= 0:
+        src.check_nesting(depth)
+        src.charge_traversal(p)
     src_pos = ptr.deref(p, src_pos)
     data_size = ptr.struct_data_size(p)
     ptrs_size = ptr.struct_ptrs_size(p)
     ds = data_size*8
     check_bounds(src, ds, src_pos)
     dst.write_slice(dst_pos, src, src_pos, ds) # copy data section
-    _copy_many_ptrs(ptrs_size, src, src_pos+ds, dst, dst_pos+ds)
+    _copy_many_ptrs(ptrs_size, src, src_pos+ds, dst, dst_pos+ds, depth)
 
 
 @cython.cfunc
@@ -166,53 +280,3 @@ def _copy_list_primitive(src, p, src_pos, dst, dst_pos):
     dst_pos = dst.alloc_list(dst_pos, size_tag, count, body_length)
     check_bounds(src, body_length, src_pos)
     dst.write_slice(dst_pos, src, src_pos, body_length)
-
-
-@cython.cfunc
-##@cython.returns(long)
-##@cython.except_(-1)
-@cython.locals(src=BaseSegment, p=long, src_pos=long, dst=SegmentBuilder, dst_pos=long,
-               count=long, body_length=long)
-def _copy_list_ptr(src, p, src_pos, dst, dst_pos):
-    src_pos = ptr.deref(p, src_pos)
-    count = ptr.list_item_count(p)
-    body_length = count*8
-    dst_pos = dst.alloc_list(dst_pos, ptr.LIST_SIZE_PTR, count, body_length)
-    check_bounds(src, body_length, src_pos)
-    _copy_many_ptrs(count, src, src_pos, dst, dst_pos)
-
-
-@cython.cfunc
-##@cython.returns(long)
-##@cython.except_(-1)
-@cython.locals(src=BaseSegment, p=long, src_pos=long, dst=SegmentBuilder, dst_pos=long,
-               total_words=long, body_length=long,
-               tag=long, count=long, data_size=long, ptrs_size=long,
-               i=long, item_length=long, ptrs_section_offset=long)
-def _copy_list_composite(src, p, src_pos, dst, dst_pos):
-    src_pos = ptr.deref(p, src_pos)
-    total_words = ptr.list_item_count(p) # n of words NOT including the tag
-    body_length = (total_words+1)*8      # total length INCLUDING the tag
-    #
-    # check that there is enough data for both the tag AND the whole body;
-    # this way we do the bound checking only once
-    check_bounds(src, body_length, src_pos)
-    tag = read_int64_fast(src, src_pos)
-    count = ptr.offset(tag)
-    data_size = ptr.struct_data_size(tag)
-    ptrs_size = ptr.struct_ptrs_size(tag)
-    #
-    # allocate the list and copy the whole body at once
-    dst_pos = dst.alloc_list(dst_pos, ptr.LIST_SIZE_COMPOSITE, total_words, body_length)
-    dst.write_slice(dst_pos, src, src_pos, body_length)
-    #
-    # iterate over the elements, fix the pointers and copy the content
-    i = 0
-    item_length = (data_size+ptrs_size) * 8
-    ptrs_section_offset = 0
-    for i in range(count):
-        ptrs_section_offset = 8 + item_length*i + data_size*8
-        _copy_many_ptrs(ptrs_size, src,
-                        src_pos + ptrs_section_offset,
-                        dst,
-                        dst_pos + ptrs_section_offset)
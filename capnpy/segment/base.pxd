@@ -2,12 +2,19 @@ cimport cython
 from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
                           uint32_t, int32_t, int64_t, uint64_t)
 
-cpdef uint32_t unpack_uint32(bytes buf, Py_ssize_t offset) except? 0xffffffff
+cpdef uint32_t unpack_uint32(object buf, Py_ssize_t offset) except? 0xffffffff
 
 cdef class BaseSegment(object):
-    cdef readonly bytes buf
+    cdef readonly object buf
     cdef const char* cbuf
+    cdef readonly Py_ssize_t buflen
+    cdef Py_buffer *view
+    cdef bint has_view
+    cdef public long traversal_limit
+    cdef public long nesting_limit
 
+    cpdef charge_traversal(self, long p)
+    cpdef check_nesting(self, long depth)
     cdef inline check_bounds(self, Py_ssize_t size, Py_ssize_t offset)
     cdef object read_primitive(self, Py_ssize_t offset, char ifmt)
     cdef int64_t read_int64(self, Py_ssize_t offset) except? 0x7fffffffffffffff
@@ -21,4 +28,7 @@ cdef class BaseSegment(object):
     cdef uint8_t read_uint8(self, Py_ssize_t offset) except? 0xff
     cdef double read_double(self, Py_ssize_t offset) except? -1
     cdef float read_float(self, Py_ssize_t offset) except? -1
+    cdef bytes read_bytes(self, Py_ssize_t start, Py_ssize_t end)
+    cdef int bytes_equal(self, Py_ssize_t start, BaseSegment other,
+                         Py_ssize_t otherstart, Py_ssize_t size) except -1
     cdef object dump_message(self, long p, Py_ssize_t start, Py_ssize_t end)
@@ -1,6 +1,7 @@
 import struct
 from six import int2byte
 from pypytools import IS_PYPY
+from capnpy import ptr
 
 
 if IS_PYPY:
@@ -23,6 +24,42 @@ else:
     mychr = int2byte
 
 
+def as_byteview(buf):
+    """
+    Return a one-dimensional, byte-oriented memoryview on the memory of
+    ``buf``, which can be any object supporting the buffer protocol
+    """
+    view = memoryview(buf)
+    if view.ndim != 1 or view.itemsize != 1:
+        view = view.cast('B')
+    return view
+
+
+def _target_size(p):
+    """
+    Return the size in words of the object pointed by ``p``, as it is charged
+    to the traversal limit. Lists of zero-sized items count one word per item,
+    else a huge list of void would be free to iterate over.
+    """
+    kind = ptr.kind(p)
+    if kind == ptr.STRUCT:
+        words = ptr.struct_data_size(p) + ptr.struct_ptrs_size(p)
+    elif kind == ptr.LIST:
+        size_tag = ptr.list_size_tag(p)
+        count = ptr.list_item_count(p)
+        if size_tag == ptr.LIST_SIZE_COMPOSITE:
+            words = count + 1 # the body plus the tag
+        elif size_tag == ptr.LIST_SIZE_VOID:
+            words = count
+        elif size_tag == ptr.LIST_SIZE_BIT:
+            words = (count + 63) // 64
+        else:
+            words = ptr.round_up_to_word(count * ptr.list_item_length(size_tag)) // 8
+    else:
+        words = 0
+    return max(words, 1)
+
+
 def unpack_uint32(buf, offset):
     if offset < 0 or offset + 4 > len(buf):
         raise IndexError('Offset out of bounds: %d' % offset)
@@ -33,7 +70,36 @@ class BaseSegment(object):
 
     def __init__(self, buf):
         assert buf is not None
+        if not isinstance(buf, bytes):
+            # any other object supporting the buffer protocol: we keep a
+            # flat view of its bytes, without copying them
+            buf = as_byteview(buf)
         self.buf = buf
+        self.buflen = len(buf)
+        self.traversal_limit = -1
+        self.nesting_limit = -1
+
+    def charge_traversal(self, p):
+        """
+        Subtract the size of the object pointed by ``p`` from the traversal
+        budget of the message, and raise ValueError if it is exhausted. A
+        traversal_limit of -1 means that there is no limit.
+        """
+        if self.traversal_limit < 0:
+            return
+        words = _target_size(p)
+        if words > self.traversal_limit:
+            self.traversal_limit = 0
+            raise ValueError("Exceeded the message traversal limit")
+        self.traversal_limit -= words
+
+    def check_nesting(self, depth):
+        """
+        Raise ValueError if an object at the given nesting ``depth`` is too
+        deep. A nesting_limit of -1 means that there is no limit.
+        """
+        if 0 <= self.nesting_limit <= depth:
+            raise ValueError("Exceeded the message nesting limit")
 
     def read_primitive(self, offset, ifmt):
         fmt = b'<' + mychr(ifmt)
@@ -74,6 +140,23 @@ class BaseSegment(object):
     def read_float(self, offset):
         return self.read_primitive(offset, ord('f'))
 
+    def read_bytes(self, start, end):
+        s = self.buf[start:end]
+        if type(s) is not bytes:
+            s = s.tobytes()
+        return s
+
+    def bytes_equal(self, start, other, otherstart, size):
+        """
+        Check whether the ``size`` bytes at ``start`` are the same as the ones
+        at ``otherstart`` in the segment ``other``.
+        """
+        if (start < 0 or start + size > self.buflen or
+            otherstart < 0 or otherstart + size > other.buflen):
+            raise IndexError('Offset out of bounds')
+        return (self.buf[start:start+size] ==
+                other.buf[otherstart:otherstart+size])
+
     def dump_message(self, p, start, end):
         maxlen = len(self.buf)
         if start < 0 or start > end or end > maxlen:
@@ -82,7 +165,7 @@ class BaseSegment(object):
         segment_count = 1
         length = end-start
         header = struct.pack(b'IIq', (segment_count-1), length//8 + 1, p)
-        return header + self.buf[start:end]
+        return header + self.read_bytes(start, end)
 
 
 BaseSegmentForTests = BaseSegment
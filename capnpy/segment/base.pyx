@@ -1,19 +1,63 @@
 cimport cython
-from libc.string cimport memcpy
+from libc.string cimport memcpy, memcmp
 from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
                           uint32_t, int32_t, int64_t, uint64_t, INT64_MAX)
 
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+
 from capnpy cimport ptr
+from capnpy.packing cimport as_cbuf
 
 cdef extern from "_util.h":
     cdef Py_ssize_t _PyString_GET_SIZE(object string)
     cdef char* _PyString_AS_STRING(object string)
+    cdef bint _PyString_CheckExact(object o)
     cdef bytes _PyString_FromStringAndSize(char *v, Py_ssize_t len)
 
 
-cpdef uint32_t unpack_uint32(bytes buf, Py_ssize_t offset) except? 0xffffffff:
-    cdef const char *cbuf = _PyString_AS_STRING(buf)
-    cdef Py_ssize_t buflen = _PyString_GET_SIZE(buf)
+def as_byteview(buf):
+    """
+    Return a one-dimensional, byte-oriented memoryview on the memory of
+    ``buf``, which can be any object supporting the buffer protocol
+    """
+    view = memoryview(buf)
+    if view.ndim != 1 or view.itemsize != 1:
+        view = view.cast('B')
+    return view
+
+
+cdef long _target_size(long p):
+    # see base.py for the docs
+    cdef long kind = ptr.kind(p)
+    cdef long size_tag, count
+    cdef long words = 0
+    if kind == ptr.STRUCT:
+        words = ptr.struct_data_size(p) + ptr.struct_ptrs_size(p)
+    elif kind == ptr.LIST:
+        size_tag = ptr.list_size_tag(p)
+        count = ptr.list_item_count(p)
+        if size_tag == ptr.LIST_SIZE_COMPOSITE:
+            words = count + 1 # the body plus the tag
+        elif size_tag == ptr.LIST_SIZE_VOID:
+            words = count
+        elif size_tag == ptr.LIST_SIZE_BIT:
+            words = (count + 63) // 64
+        else:
+            words = ptr.round_up_to_word(count * ptr.list_item_length(size_tag)) // 8
+    if words < 1:
+        words = 1
+    return words
+
+
+cpdef uint32_t unpack_uint32(object buf, Py_ssize_t offset) except? 0xffffffff:
+    cdef const char *cbuf
+    cdef Py_ssize_t buflen
+    if _PyString_CheckExact(buf):
+        cbuf = _PyString_AS_STRING(buf)
+        buflen = _PyString_GET_SIZE(buf)
+    else:
+        cbuf = as_cbuf(buf, &buflen)
     if offset < 0 or offset + 4 > buflen:
         raise IndexError('Offset out of bounds: %d' % (offset+4))
     return (<uint32_t*>(cbuf+offset))[0]
@@ -23,16 +67,57 @@ cdef class BaseSegment(object):
 
     # bah, we need to specify segment_offsets also here, even if it's used
     # only by MultiSegment
-    def __cinit__(self, bytes buf, object segment_offsets=None):
+    def __cinit__(self, object buf, object segment_offsets=None):
         assert buf is not None
         self.buf = buf
-        self.cbuf = _PyString_AS_STRING(self.buf)
+        if _PyString_CheckExact(buf):
+            self.cbuf = _PyString_AS_STRING(buf)
+            self.buflen = _PyString_GET_SIZE(buf)
+        else:
+            # any other object supporting the buffer protocol (memoryview,
+            # mmap, numpy arrays, ...). We keep the buffer acquired for the
+            # whole lifetime of the segment, so that the memory cannot go
+            # away under our feet, and we never copy it.
+            #
+            # The Py_buffer is malloc()ed on purpose: if it were a plain
+            # struct field, cython would visit view.obj in tp_traverse and
+            # the GC could clear the exporter while the buffer is still
+            # acquired, crashing when we release it in __dealloc__
+            self.view = <Py_buffer*>PyMem_Malloc(sizeof(Py_buffer))
+            if self.view == NULL:
+                raise MemoryError
+            PyObject_GetBuffer(buf, self.view, PyBUF_SIMPLE)
+            self.has_view = True
+            self.cbuf = <const char*>self.view.buf
+            self.buflen = self.view.len
+        self.traversal_limit = -1
+        self.nesting_limit = -1
+
+    def __dealloc__(self):
+        if self.has_view:
+            PyBuffer_Release(self.view)
+        PyMem_Free(self.view)
 
     def __init__(self, buf, segment_offsets=None):
         # we need this empty init to silence this warning:
         # DeprecationWarning: object.__init__() takes no parameters
         pass
 
+    cpdef charge_traversal(self, long p):
+        # see base.py for the docs
+        if self.traversal_limit < 0:
+            return
+        cdef long words = _target_size(p)
+        if words > self.traversal_limit:
+            self.traversal_limit = 0
+            raise ValueError("Exceeded the message traversal limit")
+        self.traversal_limit -= words
+
+    cpdef check_nesting(self, long depth):
+        # see base.py for the docs
+        if 0 <= self.nesting_limit <= depth:
+            raise ValueError("Exceeded the message nesting limit")
+
     @cython.final
     cdef inline check_bounds(self, Py_ssize_t size, Py_ssize_t offset):
         # the bound check seems to introduce a 5-10% overhead when calling
@@ -40,8 +125,7 @@ cdef class BaseSegment(object):
         # relatively much higher if you call it from C. In case it's needed,
         # consider adding a read_int64_fast or similar method, which does
         # *not* do the check.
-        cdef Py_ssize_t buflen = _PyString_GET_SIZE(self.buf)
-        if offset < 0 or offset + size > buflen:
+        if offset < 0 or offset + size > self.buflen:
             raise IndexError('Offset out of bounds: %d' % (offset+size))
 
     @cython.final
@@ -131,9 +215,29 @@ cdef class BaseSegment(object):
         self.check_bounds(4, offset)
         return (<float*>(self.cbuf+offset))[0]
 
+    @cython.final
+    cdef bytes read_bytes(self, Py_ssize_t start, Py_ssize_t end):
+        if not self.has_view:
+            return (<bytes>self.buf)[start:end]
+        # same semantics as slicing a bytes object
+        if start < 0:
+            start = 0
+        if end > self.buflen:
+            end = self.buflen
+        if end < start:
+            end = start
+        return _PyString_FromStringAndSize(<char*>self.cbuf+start, end-start)
+
+    @cython.final
+    cdef int bytes_equal(self, Py_ssize_t start, BaseSegment other,
+                         Py_ssize_t otherstart, Py_ssize_t size) except -1:
+        self.check_bounds(size, start)
+        other.check_bounds(size, otherstart)
+        return memcmp(self.cbuf+start, other.cbuf+otherstart, size) == 0
+
     @cython.final
     cdef object dump_message(self, long p, Py_ssize_t start, Py_ssize_t end):
-        cdef Py_ssize_t maxlen = _PyString_GET_SIZE(self.buf)
+        cdef Py_ssize_t maxlen = self.buflen
         if start < 0 or start > end or end > maxlen:
             raise ValueError("start:end values out of bounds: %s:%s" %
                              (start, end))
@@ -157,7 +261,7 @@ cdef class BaseSegmentForTests(object):
     """
     cdef BaseSegment s
 
-    def __cinit__(self, bytes buf):
+    def __cinit__(self, object buf):
         self.s = BaseSegment(buf)
 
     def read_primitive(self, Py_ssize_t offset, char ifmt):
@@ -196,5 +300,12 @@ cdef class BaseSegmentForTests(object):
     def read_float(self, Py_ssize_t offset):
         return self.s.read_float(offset)
 
+    def read_bytes(self, Py_ssize_t start, Py_ssize_t end):
+        return self.s.read_bytes(start, end)
+
+    def bytes_equal(self, Py_ssize_t start, BaseSegmentForTests other,
+                    Py_ssize_t otherstart, Py_ssize_t size):
+        return bool(self.s.bytes_equal(start, other.s, otherstart, size))
+
     def dump_message(self, long p, Py_ssize_t start, Py_ssize_t end):
         return self.s.dump_message(p, start, end)
@@ -2,6 +2,13 @@ cimport cython
 from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
                           uint32_t, int32_t, int64_t, uint64_t)
 from capnpy cimport ptr
+
+# these need to be declared before cimporting struct_, because struct_.pxd
+# cimports them in turn
+cdef class SegmentBuilder(object)
+cpdef SegmentBuilder new_builder(long length=*)
+cpdef release_builder(SegmentBuilder builder)
+
 from capnpy.segment.base cimport BaseSegment
 from capnpy.struct_ cimport Struct
 
@@ -14,7 +21,8 @@ cdef class SegmentBuilder(object):
                                      # cbuf; the next allocation will start at
                                      # this position
 
-    cdef void _resize(self, Py_ssize_t minlen)
+    cdef int _resize(self, Py_ssize_t minlen) except -1
+    cpdef reset(self)
     cpdef Py_ssize_t get_length(self)
     cpdef as_string(self)
 
@@ -31,13 +39,14 @@ cdef class SegmentBuilder(object):
     cpdef void write_float64(self, Py_ssize_t i, double value)
     cpdef void write_bool(self, Py_ssize_t byteoffset, int bitoffset, bint value)
     cpdef void write_slice(self, Py_ssize_t i, BaseSegment src, Py_ssize_t start, Py_ssize_t n)
+    cpdef void write_buffer(self, Py_ssize_t i, object src) except *
 
-    cpdef Py_ssize_t allocate(self, Py_ssize_t length)
-    cpdef Py_ssize_t alloc_struct(self, Py_ssize_t pos, long data_size, long ptrs_size)
+    cpdef Py_ssize_t allocate(self, Py_ssize_t length) except -1
+    cpdef Py_ssize_t alloc_struct(self, Py_ssize_t pos, long data_size, long ptrs_size) except -1
     cpdef Py_ssize_t alloc_list(self, Py_ssize_t pos, long size_tag, long item_count,
-                                long body_length)
-    cpdef Py_ssize_t alloc_text(self, Py_ssize_t pos, bytes s, long trailing_zero=*)
-    cpdef Py_ssize_t alloc_data(self, Py_ssize_t pos, bytes s)
+                                long body_length) except -1
+    cpdef Py_ssize_t alloc_text(self, Py_ssize_t pos, bytes s, long trailing_zero=*) except? -1
+    cpdef Py_ssize_t alloc_data(self, Py_ssize_t pos, bytes s) except? -1
     cpdef copy_from_pointer(self, Py_ssize_t dst_pos, BaseSegment src, long p,
                             Py_ssize_t src_pos)
     cpdef copy_from_struct(self, Py_ssize_t dst_pos, type structcls, Struct value)
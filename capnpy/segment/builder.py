@@ -3,20 +3,45 @@ from six import binary_type
 
 from capnpy import ptr
 from capnpy.packing import mychr
-from capnpy.printer import print_buffer
 
 class SegmentBuilder(object):
 
-    def __init__(self, length=None):
-        self.buf = bytearray()
+    def __init__(self, length=512, buf=None):
+        if buf is None:
+            buf = bytearray(length)
+            dirty_end = 0
+        else:
+            # build directly into the given bytearray: its current content
+            # is garbage which needs to be zeroed before being used
+            dirty_end = len(buf)
+        self.buf = buf
+        self.length = len(buf) # length of the allocated buffer
+        self.end = 0           # the next allocation will start here
+        self.dirty_end = dirty_end # buf[end:dirty_end] needs to be zeroed
+
+    def _resize(self, minlen):
+        # exponential growth of the buffer, see builder.pyx
+        newlen = self.length + (self.length >> 1) + 512
+        newlen = ptr.round_up_to_word(max(minlen, newlen))
+        self.buf += b'\x00' * (newlen - self.length)
+        self.length = newlen
+
+    def reset(self):
+        """
+        Forget all the allocated data, so that the builder can be reused for
+        a new message. The underlying buffer is kept.
+        """
+        self.dirty_end = max(self.dirty_end, self.end)
+        self.end = 0
 
     def get_length(self):
-        return len(self.buf)
+        return self.end
 
     def as_string(self):
-        return binary_type(self.buf)
+        return binary_type(self.buf[:self.end])
 
     def _print(self):
+        from capnpy.printer import print_buffer
         print_buffer(self.as_string())
 
     def write_generic(self, ifmt, i, value):
@@ -54,16 +79,34 @@ class SegmentBuilder(object):
 
     def write_bool(self, byteoffset, bitoffset, value):
         current = struct.unpack_from('B', self.buf, byteoffset)[0]
-        current |= (value << bitoffset)
+        if value:
+            current |= (1 << bitoffset)
+        else:
+            current &= ~(1 << bitoffset)
         struct.pack_into('B', self.buf, byteoffset, current)
 
     def write_slice(self, i, src, start, n):
         self.buf[i:i+n] = src.buf[start:start+n]
 
+    def write_buffer(self, i, src):
+        """
+        Copy the raw bytes of src, which must support the buffer protocol, at
+        position i.
+        """
+        view = memoryview(src)
+        n = view.itemsize * len(view)
+        self.buf[i:i+n] = view
+
     def allocate(self, length):
-        # XXX: check whether there is a better method to zero-extend the array in PyPy
-        result = len(self.buf)
-        self.buf += b'\x00'*length
+        result = self.end
+        end = result + length
+        if end > self.length:
+            self._resize(end)
+        if result < self.dirty_end:
+            # the memory was used by a previous message: zero it
+            n = min(end, self.dirty_end) - result
+            self.buf[result:result+n] = b'\x00' * n
+        self.end = end
         return result
 
     def alloc_struct(self, pos, data_size, ptrs_size):
@@ -125,10 +168,57 @@ class SegmentBuilder(object):
           2. it does NOT allocate a new struct in dst_pos: instead, it writes
              the struct directly into dst_pos
         """
-        return _copy_struct_inline(src, p, src_pos, self, dst_pos)
+        return _copy_struct_inline(src, p, src_pos, self, dst_pos, 0)
 
     def copy_from_list(self, pos, item_type, lst):
         return copy_from_list(self, pos, item_type, lst)
 
+
+# the pool of SegmentBuilders used by the generated ctors: see
+# enable_builder_pool(). It is a plain list shared by all the threads: pop()
+# and append() are atomic, so two threads can never get the same builder
+_pool = None
+POOL_SIZE = 16
+POOL_MAX_LENGTH = 64*1024 # bigger builders are not kept in the pool
+
+def enable_builder_pool(enabled=True):
+    """
+    Enable or disable the reuse of SegmentBuilders inside the generated
+    ctors. When enabled, building a new struct requires a single allocation
+    (the resulting bytes) instead of allocating a new builder each time.
+    """
+    global _pool
+    if not enabled:
+        _pool = None
+    elif _pool is None:
+        _pool = []
+
+def new_builder(length=512):
+    """
+    Return a SegmentBuilder, taking it from the pool if it is enabled.
+    ``length`` is the initial capacity of the builder if a new one needs to
+    be allocated: it is only a hint, since the builder grows as needed.
+    """
+    pool = _pool
+    if pool is not None:
+        # another thread might empty the pool between a check and the pop():
+        # just try and see
+        try:
+            return pool.pop()
+        except IndexError:
+            pass
+    return SegmentBuilder(length)
+
+def release_builder(builder):
+    """
+    Give back a builder obtained by new_builder(). The builder must not be
+    used afterwards.
+    """
+    pool = _pool
+    if (pool is not None and len(pool) < POOL_SIZE and
+        builder.length <= POOL_MAX_LENGTH):
+        builder.reset()
+        pool.append(builder)
+
 from capnpy.segment._copy_pointer import copy_pointer, _copy_struct_inline
 from capnpy.segment._copy_list import copy_from_list
@@ -2,13 +2,16 @@ cimport cython
 from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
                           uint32_t, int32_t, int64_t, uint64_t, INT64_MAX)
 from libc.string cimport memcpy, memset
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE
 
 from capnpy.segment.base cimport BaseSegment
+from capnpy.segment.stack cimport LongStack
 from capnpy.struct_ cimport Struct
-from capnpy.list cimport List, ItemType, StructItemType
+from capnpy.list cimport List, ItemType, StructItemType, PrimitiveItemType
 
 cdef extern from "Python.h":
-    int PyByteArray_Resize(object o, Py_ssize_t len)
+    bytearray PyByteArray_FromStringAndSize(const char *string, Py_ssize_t len)
+    int PyByteArray_Resize(object o, Py_ssize_t len) except -1
     char* PyByteArray_AS_STRING(object o)
 
 cdef extern from "_util.h":
@@ -23,13 +26,18 @@ cdef long round_to_word(long pos):
 
 cdef class SegmentBuilder(object):
 
-    def __cinit__(self, long length=512):
-        self.length = length
-        self.buf = bytearray(self.length)
+    def __cinit__(self, long length=512, bytearray buf=None):
+        # the buffer is not initialized here: allocate() zeroes only the
+        # memory which is actually used. If buf is given, we build directly
+        # into it
+        if buf is None:
+            buf = PyByteArray_FromStringAndSize(NULL, length)
+        self.buf = buf
+        self.length = len(buf)
         self.cbuf = PyByteArray_AS_STRING(self.buf)
         self.end = 0
 
-    cdef void _resize(self, Py_ssize_t minlen):
+    cdef int _resize(self, Py_ssize_t minlen) except -1:
         # exponential growth of the buffer. By using this formula, we grow
         # faster at the beginning (where the constant plays a major role) and
         # slower when the buffer it's already big (where length >> 1 plays a
@@ -38,6 +46,9 @@ cdef class SegmentBuilder(object):
         newlen = max(minlen, newlen)
         newlen = round_to_word(newlen)
         cdef long curlen = self.length
+        # this fails e.g. if someone holds a memoryview on the buffer which
+        # was passed to __cinit__: in that case, we must leave cbuf and
+        # length untouched
         PyByteArray_Resize(self.buf, newlen)
         cdef char* oldbuf = self.cbuf
         self.cbuf = PyByteArray_AS_STRING(self.buf)
@@ -45,8 +56,15 @@ cdef class SegmentBuilder(object):
         ##     print 'REALLOC %s --> %s' % (curlen, newlen)
         ## else:
         ##     print '        %s --> %s' % (curlen, newlen)
-        memset(self.cbuf + curlen, 0, newlen - curlen)
         self.length = newlen
+        return 0
+
+    cpdef reset(self):
+        """
+        Forget all the allocated data, so that the builder can be reused for
+        a new message. The underlying buffer is kept.
+        """
+        self.end = 0
 
     cpdef Py_ssize_t get_length(self):
         return self.end
@@ -110,7 +128,10 @@ cdef class SegmentBuilder(object):
 
     cpdef void write_bool(self, Py_ssize_t byteoffset, int bitoffset, bint value):
         cdef uint8_t current = (<uint8_t*>(self.cbuf+byteoffset))[0]
-        current |= (value << bitoffset)
+        if value:
+            current |= (1 << bitoffset)
+        else:
+            current &= ~(1 << bitoffset)
         (<uint8_t*>(self.cbuf+byteoffset))[0] = current
 
     cpdef void write_slice(self, Py_ssize_t i, BaseSegment src,
@@ -119,18 +140,27 @@ cdef class SegmentBuilder(object):
         cdef const void* psrc = src.cbuf + start
         memcpy(pdst, psrc, n)
 
-    cpdef Py_ssize_t allocate(self, Py_ssize_t length):
+    cpdef void write_buffer(self, Py_ssize_t i, object src) except *:
+        cdef Py_buffer view
+        PyObject_GetBuffer(src, &view, PyBUF_SIMPLE)
+        try:
+            memcpy(self.cbuf + i, view.buf, view.len)
+        finally:
+            PyBuffer_Release(&view)
+
+    cpdef Py_ssize_t allocate(self, Py_ssize_t length) except -1:
         """
         Allocate ``length`` bytes of memory inside the buffer. Return the start
         position of the newly allocated space.
         """
         cdef Py_ssize_t result = self.end
-        self.end += length
-        if self.end > self.length:
-            self._resize(self.end)
+        if result + length > self.length:
+            self._resize(result + length)
+        self.end = result + length
+        memset(self.cbuf + result, 0, length)
         return result
 
-    cpdef Py_ssize_t alloc_struct(self, Py_ssize_t pos, long data_size, long ptrs_size):
+    cpdef Py_ssize_t alloc_struct(self, Py_ssize_t pos, long data_size, long ptrs_size) except -1:
         """
         Allocate a new struct of the given size, and write the resulting pointer
         at position i. Return the newly allocated position.
@@ -143,7 +173,7 @@ cdef class SegmentBuilder(object):
         return result
 
     cpdef Py_ssize_t alloc_list(self, Py_ssize_t pos, long size_tag, long item_count,
-                                long body_length):
+                                long body_length) except -1:
         """
         Allocate a new list of the given size, and write the resulting pointer
         at position i. Return the newly allocated position.
@@ -155,7 +185,7 @@ cdef class SegmentBuilder(object):
         self.write_int64(pos, p)
         return result
 
-    cpdef Py_ssize_t alloc_text(self, Py_ssize_t pos, bytes s, long trailing_zero=1):
+    cpdef Py_ssize_t alloc_text(self, Py_ssize_t pos, bytes s, long trailing_zero=1) except? -1:
         if s is None:
             self.write_int64(pos, 0)
             return -1
@@ -168,7 +198,7 @@ cdef class SegmentBuilder(object):
         # guaranteed to be 0
         return result
 
-    cpdef Py_ssize_t alloc_data(self, Py_ssize_t pos, bytes s):
+    cpdef Py_ssize_t alloc_data(self, Py_ssize_t pos, bytes s) except? -1:
         return self.alloc_text(pos, s, trailing_zero=0)
 
     cpdef copy_from_struct(self, Py_ssize_t dst_pos, type structcls, Struct value):
@@ -193,11 +223,42 @@ cdef class SegmentBuilder(object):
           2. it does NOT allocate a new struct in dst_pos: instead, it writes
              the struct directly into dst_pos
         """
-        return _copy_struct_inline(src, p, src_pos, self, dst_pos)
+        return _copy_struct_inline(src, p, src_pos, self, dst_pos, 0)
 
     cpdef copy_from_list(self, Py_ssize_t pos, item_type, lst):
         return copy_from_list(self, pos, item_type, lst)
 
+
+# the pool of SegmentBuilders used by the generated ctors: see
+# enable_builder_pool() in builder.py. It is shared by all the threads: pop()
+# and append() are atomic under the GIL, so two threads can never get the
+# same builder
+cdef list _pool = None
+cdef long POOL_SIZE = 16
+cdef long POOL_MAX_LENGTH = 64*1024 # bigger builders are not kept in the pool
+
+def enable_builder_pool(bint enabled=True):
+    global _pool
+    if not enabled:
+        _pool = None
+    elif _pool is None:
+        _pool = []
+
+cpdef SegmentBuilder new_builder(long length=512):
+    cdef list pool = _pool
+    # the GIL is not released between the check and the pop(), so no other
+    # thread can empty the pool in the meantime
+    if pool:
+        return pool.pop()
+    return SegmentBuilder(length)
+
+cpdef release_builder(SegmentBuilder builder):
+    cdef list pool = _pool
+    if (pool is not None and len(pool) < POOL_SIZE and
+        builder.length <= POOL_MAX_LENGTH):
+        builder.reset()
+        pool.append(builder)
+
 # we need to play weird tricks to be able to use the copy_pointer algo both
 # for Cython and PyPy AND to have very good performance. See the big comment
 # at the beginning of _copy_pointer.py for an explanation
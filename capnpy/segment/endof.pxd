@@ -1,29 +1,17 @@
 import cython
 from capnpy cimport ptr
 from capnpy.segment.segment cimport Segment
+from capnpy.segment.stack cimport LongStack
 
-cpdef long endof(Segment seg, long p, long offset) except -2
+@cython.locals(check_limits=bint, end=long, level=long, pos=long, n=long, items=long,
+               ptrs_size=long, data_length=long, stack=LongStack,
+               kind=long, start=long, data_size=long, item_size=long,
+               count=long, tag=long, p_offset=long,
+               child_pos=long, child_n=long, child_items=long,
+               child_ptrs_size=long, child_data_length=long)
+cpdef long endof(Segment seg, long p, long offset, long depth=*) except -2
 
-@cython.locals(i=long, p_offset=long, p=long)
-cdef long _endof_ptrs(Segment seg, long offset, long ptrs_size,
-                     long current_end)
+cdef long _endof_list_primitive(long offset, long item_size, long count)
 
-@cython.locals(end=long)
-cdef long _endof_struct(Segment seg, long p, long offset,
-                       long data_size, long ptrs_size)
-
-@cython.locals(item_size=long, i=long)
-cdef long _endof_list_composite(Segment seg, long p, long offset,
-                               long count, long data_size, long ptrs_size)
-
-@cython.locals(count=long, end=long)
-cdef long _endof_list_ptr(Segment seg, long p, long offset,
-                         long count)
-
-cdef long _endof_list_primitive(Segment seg, long p, long offset,
-                               long item_size, long count)
-
-
-@cython.locals(count=long, bytes_length=long, extra_bits=long)
-cdef long _endof_list_bit(Segment seg, long p, long offset,
-                         long count)
+@cython.locals(bytes_length=long)
+cdef long _endof_list_bit(long offset, long count)
@@ -1,6 +1,7 @@
 from capnpy import ptr
+from capnpy.segment.stack import LongStack
 
-def endof(seg, p, offset):
+def endof(seg, p, offset, depth=0):
     """
     Check whether the given object is compact, and in that case compute its
     end boundary. If it's not compact, return -1.
@@ -14,79 +15,138 @@ def endof(seg, p, offset):
       3. its children are compact
 
       4. there are no FAR pointers
-    """
-    kind = ptr.kind(p)
-    offset = ptr.deref(p, offset)
-    if kind == ptr.STRUCT:
-        data_size = ptr.struct_data_size(p)
-        ptrs_size = ptr.struct_ptrs_size(p)
-        return _endof_struct(seg, p, offset, data_size, ptrs_size)
-    elif kind == ptr.LIST:
-        item_size = ptr.list_size_tag(p)
-        count = ptr.list_item_count(p)
-        if item_size == ptr.LIST_SIZE_COMPOSITE:
-            tag = seg.read_ptr(offset)
-            count = ptr.offset(tag)
-            data_size = ptr.struct_data_size(tag)
-            ptrs_size = ptr.struct_ptrs_size(tag)
-            return _endof_list_composite(seg, p, offset,
-                                         count, data_size, ptrs_size)
-        elif item_size == ptr.LIST_SIZE_PTR:
-            return _endof_list_ptr(seg, p, offset, count)
-        elif item_size == ptr.LIST_SIZE_BIT:
-            return _endof_list_bit(seg, p, offset, count)
-        else:
-            return _endof_list_primitive(seg, p, offset, item_size, count)
-    elif kind == ptr.FAR:
-        return -1
-    else:
-        assert False, 'unknown ptr kind'
 
-def _endof_ptrs(seg, offset, ptrs_size, current_end):
-    i = 0
-    while i < ptrs_size:
-        p_offset = offset + i*8
-        i += 1
-        p = seg.read_ptr(p_offset)
-        if not p:
-            continue
-        new_start = ptr.deref(p, p_offset)
-        if new_start != current_end:
-            return -1
-        current_end = endof(seg, p, p_offset)
-    #
-    return current_end
+    ``depth`` is the nesting level of the object, which is checked against the
+    nesting limit of ``seg``; the size of each object is charged to its
+    traversal limit.
+
+    The object graph is visited in depth-first order, as the children must be
+    laid out in this order to be compact. Instead of recursing, we keep the
+    state of the unfinished pointer sections in an explicit stack, so that
+    deeply nested objects cost neither C nor Python stack frames. The
+    current section is described by:
+
+      - pos: the offset of the next pointer to check
 
-def _endof_struct(seg, p, offset, data_size, ptrs_size):
-    offset += data_size*8
-    current_end = offset + (ptrs_size*8)
-    return _endof_ptrs(seg, offset, ptrs_size, current_end)
+      - n: the number of pointers left in the current item
 
-def _endof_list_composite(seg, p, offset, count, data_size, ptrs_size):
-    item_size = (data_size+ptrs_size)*8
-    offset += 8 # skip the tag
-    end = offset + (item_size)*count
-    if ptrs_size == 0:
-        return end
+      - items: the number of items left after the current one, for
+        composite lists. When we finish an item, we skip the data section of
+        the next one, which is data_length bytes, and we reset n to ptrs_size
+
+      - level: the nesting level of the object which owns the section
+    """
+    # check the limits only if they are set, to avoid two virtual calls per
+    # object in the common case
+    check_limits = seg.nesting_limit >= 0 or seg.traversal_limit >= 0
     #
-    i = 0
-    while i < count:
-        item_offset = offset + (item_size)*i + (data_size*8)
-        end = _endof_ptrs(seg, item_offset, ptrs_size, end)
-        if end == -1:
+    # the root object has no parent section, so we start by visiting it
+    end = ptr.deref(p, offset)
+    level = depth - 1
+    pos = 0
+    n = 0
+    items = 0
+    ptrs_size = 0
+    data_length = 0
+    stack = None
+    while True:
+        # 1. visit the object pointed by p, which starts at end
+        kind = ptr.kind(p)
+        if kind == ptr.FAR:
+            return -1
+        if check_limits:
+            seg.check_nesting(level+1)
+            seg.charge_traversal(p)
+        start = end
+        child_n = 0
+        if kind == ptr.STRUCT:
+            data_size = ptr.struct_data_size(p)
+            child_ptrs_size = ptr.struct_ptrs_size(p)
+            end = start + (data_size+child_ptrs_size)*8
+            child_pos = start + data_size*8
+            child_n = child_ptrs_size
+            child_items = 0
+            child_data_length = 0
+        elif kind == ptr.LIST:
+            item_size = ptr.list_size_tag(p)
+            count = ptr.list_item_count(p)
+            if item_size == ptr.LIST_SIZE_COMPOSITE:
+                tag = seg.read_ptr(start)
+                count = ptr.offset(tag)
+                data_size = ptr.struct_data_size(tag)
+                child_ptrs_size = ptr.struct_ptrs_size(tag)
+                end = start + 8 + (data_size+child_ptrs_size)*8*count
+                if count > 0:
+                    child_data_length = data_size*8
+                    child_pos = start + 8 + child_data_length
+                    child_n = child_ptrs_size
+                    child_items = count - 1
+            elif item_size == ptr.LIST_SIZE_PTR:
+                end = start + 8*count
+                child_pos = start
+                child_n = count
+                child_items = 0
+                child_ptrs_size = 0
+                child_data_length = 0
+            elif item_size == ptr.LIST_SIZE_BIT:
+                end = _endof_list_bit(start, count)
+            else:
+                end = _endof_list_primitive(start, item_size, count)
+        else:
+            assert False, 'unknown ptr kind'
+        #
+        # 2. if the object has pointers, descend into it. If the current
+        # section is finished we don't need to come back to it, so we don't
+        # push it: this way, long chains of objects don't grow the stack
+        if child_n > 0:
+            if n > 0 or items > 0:
+                if stack is None:
+                    stack = LongStack()
+                stack.push(pos)
+                stack.push(n)
+                stack.push(items)
+                stack.push(ptrs_size)
+                stack.push(data_length)
+                stack.push(level)
+            pos = child_pos
+            n = child_n
+            items = child_items
+            ptrs_size = child_ptrs_size
+            data_length = child_data_length
+            level += 1
+        #
+        # 3. find the next non-NULL pointer, popping the finished sections
+        while True:
+            if n == 0:
+                if items > 0:
+                    items -= 1
+                    pos += data_length
+                    n = ptrs_size
+                    continue
+                if stack is None or stack.is_empty():
+                    return end
+                level = stack.pop()
+                data_length = stack.pop()
+                ptrs_size = stack.pop()
+                items = stack.pop()
+                n = stack.pop()
+                pos = stack.pop()
+                continue
+            p_offset = pos
+            p = seg.read_ptr(p_offset)
+            pos += 8
+            n -= 1
+            if p != 0:
+                break
+        #
+        # 4. the child must start exactly where the previous one ended
+        if ptr.deref(p, p_offset) != end:
             return -1
-        i += 1
-    #
-    return end
-
-def _endof_list_ptr(seg, p, offset, count):
-    end = offset + 8*count
-    return _endof_ptrs(seg, offset, count, end)
 
-def _endof_list_primitive(seg, p, offset, item_size, count):
+def _endof_list_primitive(offset, item_size, count):
     item_size = ptr.list_item_length(item_size)
     return ptr.round_up_to_word(offset + item_size*count)
 
-def _endof_list_bit(seg, p, offset, count):
+def _endof_list_bit(offset, count):
     bytes_length = ptr.round_up_to_word(count) // 8
     return ptr.round_up_to_word(offset + bytes_length)
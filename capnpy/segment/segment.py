@@ -1,7 +1,6 @@
 from capnpy.segment.base import BaseSegment
 from capnpy import ptr
 from capnpy import _hash
-from capnpy.printer import print_buffer, BufferPrinter
 
 
 class Segment(BaseSegment):
@@ -12,7 +11,14 @@ class Segment(BaseSegment):
 
     def __reduce__(self):
         # pickle support
-        return Segment, (self.buf,)
+        return Segment, (self._pickle_buf(),)
+
+    def _pickle_buf(self):
+        # buffers which are not bytes (e.g. memoryview or mmap) cannot be
+        # pickled: in that case, we pickle a copy of their content
+        if isinstance(self.buf, bytes):
+            return self.buf
+        return self.read_bytes(0, self.buflen)
 
     def read_ptr(self, offset):
         """
@@ -45,9 +51,10 @@ class Segment(BaseSegment):
             return default_
         assert ptr.kind(p) == ptr.LIST
         assert ptr.list_size_tag(p) == ptr.LIST_SIZE_8
+        self.charge_traversal(p)
         start = ptr.deref(p, offset)
         end = start + ptr.list_item_count(p) + additional_size
-        return self.buf[start:end]
+        return self.read_bytes(start, end)
 
     def hash_str(self, p, offset, default_, additional_size):
         if p == 0:
@@ -59,6 +66,7 @@ class Segment(BaseSegment):
         return _hash.strhash(self.buf, start, size)
 
     def _print(self, **kwds):
+        from capnpy.printer import BufferPrinter
         p = BufferPrinter(self.buf)
         p.printbuf(start=0, end=None, **kwds)
 
@@ -77,7 +85,7 @@ class MultiSegment(Segment):
 
     def __reduce__(self):
         # pickle support
-        return MultiSegment, (self.buf, self.segment_offsets)
+        return MultiSegment, (self._pickle_buf(), self.segment_offsets)
 
     def read_far_ptr(self, offset):
         """
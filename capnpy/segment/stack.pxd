@@ -0,0 +1,26 @@
+cimport cython
+
+# the methods are inline so that they can be called without going through
+# the vtable also from other modules, e.g. endof and builder
+@cython.final
+cdef class LongStack(object):
+    cdef long* items
+    cdef Py_ssize_t length
+    cdef Py_ssize_t allocated
+
+    cdef int _grow(self) except -1
+
+    cdef inline int push(self, long x) except -1:
+        if self.length == self.allocated:
+            self._grow()
+        self.items[self.length] = x
+        self.length += 1
+        return 0
+
+    cdef inline long pop(self):
+        # the caller must check that the stack is not empty
+        self.length -= 1
+        return self.items[self.length]
+
+    cdef inline bint is_empty(self):
+        return self.length == 0
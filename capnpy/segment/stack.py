@@ -0,0 +1,18 @@
+class LongStack(object):
+    """
+    A stack of integers, used to traverse deeply nested objects without
+    recursion. This is the pure-python version, see stack.pyx for the Cython
+    one.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def push(self, x):
+        self.items.append(x)
+
+    def pop(self):
+        return self.items.pop()
+
+    def is_empty(self):
+        return not self.items
@@ -0,0 +1,25 @@
+from cpython.mem cimport PyMem_Malloc, PyMem_Realloc, PyMem_Free
+
+DEF INITIAL_SIZE = 32
+
+cdef class LongStack(object):
+
+    def __cinit__(self):
+        self.items = <long*>PyMem_Malloc(INITIAL_SIZE * sizeof(long))
+        if self.items == NULL:
+            raise MemoryError
+        self.length = 0
+        self.allocated = INITIAL_SIZE
+
+    def __dealloc__(self):
+        PyMem_Free(self.items)
+
+    cdef int _grow(self) except -1:
+        cdef Py_ssize_t newsize = self.allocated * 2
+        cdef long* items = <long*>PyMem_Realloc(self.items,
+                                                newsize * sizeof(long))
+        if items == NULL:
+            raise MemoryError
+        self.items = items
+        self.allocated = newsize
+        return 0
@@ -3,7 +3,7 @@ from capnpy.blob cimport Blob
 from capnpy cimport ptr
 from capnpy.list cimport List, ItemType
 from capnpy.packing cimport pack_int64
-from capnpy.segment.builder cimport SegmentBuilder
+from capnpy.segment.builder cimport SegmentBuilder, new_builder, release_builder
 from capnpy.segment.endof cimport endof
 
 cpdef str check_tag(str curtag, str newtag)
@@ -18,6 +18,9 @@ cdef class Struct(Blob):
     cdef public long _ptrs_offset
     cdef public long _data_size
     cdef public long _ptrs_size
+    cdef long _cached_end
+    cdef object _cached_dump
+    cdef long _cached_hash
 
     cpdef _init_from_buffer(self, object buf, long offset,
                             long data_size, long ptrs_size)
@@ -56,6 +59,10 @@ cdef class Struct(Blob):
     cpdef object _ensure_union(self, long expected_tag)
     cpdef long __which__(self) except -1
 
+    @cython.locals(s=Struct)
+    cpdef _equals(self, other)
+    cpdef bint _data_equals(self, Struct other, long offset, long size) except? -1
+
     cpdef long _get_end(self)
     cpdef long _is_compact(self)
 
@@ -7,7 +7,7 @@ from capnpy.blob import Blob
 from capnpy.list import List
 from capnpy.segment.segment import Segment, MultiSegment
 from capnpy.segment.endof import endof
-from capnpy.segment.builder import SegmentBuilder
+from capnpy.segment.builder import SegmentBuilder, new_builder, release_builder
 from capnpy.util import magic_setattr, decode_maybe
 
 class Undefined(object):
@@ -39,6 +39,9 @@ class Struct(Blob):
     __tag_offset__ = None
     __tag__ = None
 
+    # set to True by the compiler for the structs annotated with $Py.key
+    __has_key__ = False
+
     # __static_{data,ptrs}_size__ contain the size of the struct as known from
     # the schema: they are class attributes. On the other hand, _data_size and
     # _ptrs_size contain the size as specified by the pointer which is
@@ -55,6 +58,9 @@ class Struct(Blob):
         self._ptrs_offset = offset + data_size*8
         self._data_size = data_size
         self._ptrs_size = ptrs_size
+        self._cached_end = -2
+        self._cached_dump = None
+        self._cached_hash = -1
         assert self._data_offset + data_size*8 <= len(self._seg.buf)
         assert self._ptrs_offset + ptrs_size*8 <= len(self._seg.buf)
 
@@ -76,16 +82,28 @@ class Struct(Blob):
         return struct_from_buffer(cls, buf, offset, data_size, ptrs_size)
 
     @classmethod
-    def load(cls, f):
-        return capnpy.message.load(f, cls)
+    def load(cls, f, **kwds):
+        return capnpy.message.load(f, cls, **kwds)
+
+    @classmethod
+    def loads(cls, s, **kwds):
+        return capnpy.message.loads(s, cls, **kwds)
 
     @classmethod
-    def loads(cls, s):
-        return capnpy.message.loads(s, cls)
+    def load_all(cls, f, **kwds):
+        return capnpy.message.load_all(f, cls, **kwds)
 
     @classmethod
-    def load_all(cls, f):
-        return capnpy.message.load_all(f, cls)
+    def load_packed(cls, f, **kwds):
+        return capnpy.message.load_packed(f, cls, **kwds)
+
+    @classmethod
+    def loads_packed(cls, s, **kwds):
+        return capnpy.message.loads_packed(s, cls, **kwds)
+
+    @classmethod
+    def load_all_packed(cls, f, **kwds):
+        return capnpy.message.load_all_packed(f, cls, **kwds)
 
     def _raw_dumps(self):
         """
@@ -197,6 +215,7 @@ class Struct(Blob):
         if p == 0:
             return None
         assert ptr.kind(p) == ptr.STRUCT
+        self._seg.charge_traversal(p)
         obj = structcls.__new__(structcls)
         obj._init_from_pointer(self._seg, offset, p)
         return obj
@@ -210,6 +229,7 @@ class Struct(Blob):
         if p == 0:
             return default_
         assert ptr.kind(p) == ptr.LIST
+        self._seg.charge_traversal(p)
         list_offset = ptr.deref(p, offset)
         # in theory we could simply use List.from_buffer; however, Cython is
         # not able to compile classmethods, so we create it manually
@@ -262,8 +282,12 @@ class Struct(Blob):
 
 
     def _get_end(self):
-        p = ptr.new_struct(0, self._data_size, self._ptrs_size)
-        return endof(self._seg, p, self._data_offset-8)
+        # the object is immutable, so we need to walk it only once. -2 means
+        # that we haven't computed it yet, because -1 means "not compact"
+        if self._cached_end == -2:
+            p = ptr.new_struct(0, self._data_size, self._ptrs_size)
+            self._cached_end = endof(self._seg, p, self._data_offset-8)
+        return self._cached_end
 
     def _is_compact(self):
         return self._get_end() != -1
@@ -274,10 +298,11 @@ class Struct(Blob):
         bigger message, it "extracts" it into a new message which contains
         only the needed pieces.
         """
-        builder = SegmentBuilder()
+        builder = new_builder()
         pos = builder.allocate(8)
         builder.copy_from_struct(pos, Struct, self)
         buf = builder.as_string()
+        release_builder(builder)
         t = type(self)
         res = t.__new__(t)
         res._init_from_buffer(buf, 8, self._data_size, self._ptrs_size)
@@ -288,21 +313,49 @@ class Struct(Blob):
     # ----------------------
 
     # in theory, this is the only method you need to override to enable
-    # hashing and comparability. But in PYX mode, we override _hash and
-    # _equals as well.
+    # hashing and comparability. But in PYX mode, we override __hash__ as
+    # well.
+    #
+    # Structs are immutable, so the hash is computed only once and stored in
+    # _cached_hash. -1 is never a valid hash, so we use it to mean "not
+    # computed yet".
     def _key(self):
         raise TypeError("Cannot hash or compare capnpy structs. "
                         "Use the $Py.key annotation to enable it")
 
     def __hash__(self):
-        return hash(self._key())
+        if self._cached_hash == -1:
+            self._cached_hash = hash(self._key())
+        return self._cached_hash
 
     def _equals(self, other):
-        if isinstance(other, Struct) or isinstance(other, tuple):
+        if isinstance(other, Struct):
+            s = other
+            if (self.__has_key__ and type(s) is type(self) and
+                s._seg.buf is self._seg.buf and
+                s._data_offset == self._data_offset and
+                s._data_size == self._data_size and
+                s._ptrs_size == self._ptrs_size):
+                # same bytes in the same buffer: no need to read the key
+                return True
+            if (self._cached_hash != -1 and s._cached_hash != -1 and
+                self._cached_hash != s._cached_hash):
+                return False
             # by doing this, we ensure that we compare equals to tuples
             return other == self._key()
+        elif isinstance(other, tuple):
+            return other == self._key()
         return False
 
+    def _data_equals(self, other, offset, size):
+        """
+        Check whether the ``size`` bytes at ``offset`` in the data section are
+        the same in self and other. This is used by the specialized _equals
+        which the compiler emits for keys made only of primitive fields.
+        """
+        return self._seg.bytes_equal(self._data_offset + offset, other._seg,
+                                     other._data_offset + offset, size)
+
     # this is already defined in blob.py: however, it seems if we do not
     # redeclare it here, Cython won't use it
     def __richcmp__(self, other, op):
@@ -318,3 +371,6 @@ class Struct(Blob):
 import capnpy.message
 magic_setattr(Struct, 'dump', capnpy.message.dump)
 magic_setattr(Struct, 'dumps', capnpy.message.dumps)
+magic_setattr(Struct, '_dump_bytes', capnpy.message._dump_bytes)
+magic_setattr(Struct, 'dump_packed', capnpy.message.dump_packed)
+magic_setattr(Struct, 'dumps_packed', capnpy.message.dumps_packed)
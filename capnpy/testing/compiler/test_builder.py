@@ -0,0 +1,418 @@
+import py
+import pytest
+import struct
+from io import BytesIO
+
+from capnpy import ptr
+from capnpy.builder import MessageBuilder
+from capnpy.message import loads
+from capnpy.testing.compiler.support import CompilerTest
+
+
+class TestBuilder(CompilerTest):
+
+    def test_primitive(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        p = msg.init_root(mod.Point)
+        p.set_x(1)
+        p.set_y(2)
+        obj = p.as_reader()
+        assert isinstance(obj, mod.Point)
+        assert obj.x == 1
+        assert obj.y == 2
+        #
+        # in-place mutation, the previous reader is a snapshot
+        p.set_x(42)
+        assert p.as_reader().x == 42
+        assert obj.x == 1
+
+    def test_dumps(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        p = msg.init_root(mod.Point)
+        p.set_x(1)
+        p.set_y(2)
+        assert msg.dumps() == mod.Point(1, 2).dumps()
+        obj = loads(msg.dumps(), mod.Point)
+        assert obj.x == 1
+        assert obj.y == 2
+        #
+        msg = MessageBuilder()
+        py.test.raises(ValueError, "msg.dumps()")
+
+    def test_build_into_bytearray(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        mybuf = bytearray(b'garbage!' * 8)
+        msg = MessageBuilder(buf=mybuf)
+        p = msg.init_root(mod.Point)
+        p.set_x(1)
+        p.set_y(2)
+        segment = msg.get_segments()[0]
+        assert mybuf[:len(segment)] == segment
+        assert msg.dumps() == mod.Point(1, 2).dumps()
+
+    def test_bool_and_defaults(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64 = 42;
+            a @1 :Bool;
+            b @2 :Bool = true;
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        foo = msg.init_root(mod.Foo)
+        obj = foo.as_reader()
+        assert obj.x == 42
+        assert not obj.a
+        assert obj.b
+        #
+        foo.set_x(1)
+        foo.set_a(True)
+        foo.set_b(False)
+        obj = foo.as_reader()
+        assert obj.x == 1
+        assert obj.a
+        assert not obj.b
+        #
+        foo.set_a(False)
+        assert not foo.as_reader().a
+
+    def test_enum(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+            blue @2;
+        }
+        struct Foo {
+            color @0 :Color;
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        foo = msg.init_root(mod.Foo)
+        foo.set_color(mod.Color.blue)
+        assert foo.as_reader().color == mod.Color.blue
+
+    def test_text_and_data(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Person {
+            name @0 :Text;
+            surname @1 :Text $Py.options(textType=unicode);
+            blob @2 :Data;
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        p = msg.init_root(mod.Person)
+        p.set_name(b'foo')
+        p.set_surname(u'bar')
+        p.set_blob(b'\x01\x02')
+        obj = p.as_reader()
+        assert obj.name == b'foo'
+        assert obj.surname == u'bar'
+        assert obj.blob == b'\x01\x02'
+        #
+        p.set_name(None)
+        assert p.as_reader().name is None
+
+    def test_struct(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Rectangle {
+            a @0 :Point;
+            b @1 :Point;
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        rect = msg.init_root(mod.Rectangle)
+        a = rect.init_a()
+        a.set_x(1)
+        a.set_y(2)
+        rect.set_b(mod.Point(3, 4))
+        a.set_y(20) # we can still modify a after having set b
+        obj = rect.as_reader()
+        assert obj.a.x == 1
+        assert obj.a.y == 20
+        assert obj.b.x == 3
+        assert obj.b.y == 4
+
+    def test_list(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            ints @0 :List(Int32);
+            flags @1 :List(Bool);
+            names @2 :List(Text);
+            points @3 :List(Point);
+            matrix @4 :List(List(Int8));
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        foo = msg.init_root(mod.Foo)
+        ints = foo.init_ints(3)
+        assert len(ints) == 3
+        ints[0] = 1
+        ints[1] = 2
+        ints[-1] = 3
+        py.test.raises(IndexError, "ints[3] = 4")
+        flags = foo.init_flags(10)
+        flags[1] = True
+        flags[9] = True
+        foo.set_names([b'foo', b'bar'])
+        points = foo.init_points(2)
+        points[0].set_x(1)
+        points[1].set_y(2)
+        matrix = foo.init_matrix(2)
+        row = matrix.init(0, 2)
+        row[0] = 1
+        row[1] = 2
+        matrix[1] = [3]
+        #
+        obj = foo.as_reader()
+        assert list(obj.ints) == [1, 2, 3]
+        assert list(obj.flags) == [False, True] + [False]*7 + [True]
+        assert list(obj.names) == [b'foo', b'bar']
+        assert [(p.x, p.y) for p in obj.points] == [(1, 0), (0, 2)]
+        assert [list(row) for row in obj.matrix] == [[1, 2], [3]]
+        #
+        py.test.raises(TypeError, "ints[0]")
+        py.test.raises(TypeError, "ints.init(0, 1)")
+
+    def test_union(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square @2 :Int64;
+            empty  @3 :Void;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        s = msg.init_root(mod.Shape)
+        s.set_area(64)
+        s.set_square(8)
+        obj = s.as_reader()
+        assert obj.which() == mod.Shape.__tag__.square
+        assert obj.square == 8
+        s.set_empty()
+        assert s.as_reader().which() == mod.Shape.__tag__.empty
+
+    def test_group(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Rectangle {
+            a :group {
+                x @0 :Int64;
+                y @1 :Int64;
+            }
+            b :group {
+                x @2 :Int64;
+                y @3 :Int64;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        rect = msg.init_root(mod.Rectangle)
+        a = rect.init_a()
+        a.set_x(1)
+        a.set_y(2)
+        rect.init_b().set_y(4)
+        obj = rect.as_reader()
+        assert (obj.a.x, obj.a.y, obj.b.x, obj.b.y) == (1, 2, 0, 4)
+
+    def test_nullable(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Foo {
+            x :group $Py.nullable {
+                isNull @0 :Int8;
+                value  @1 :Int64;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        msg = MessageBuilder()
+        foo = msg.init_root(mod.Foo)
+        foo.set_x(42)
+        assert foo.as_reader().x == 42
+        foo.set_x(None)
+        assert foo.as_reader().x is None
+
+
+class TestMultiSegment(CompilerTest):
+
+    SCHEMA = """
+    @0xbf5147cbbecf40c1;
+    struct Point {
+        x @0 :Int64;
+        y @1 :Int64;
+    }
+    struct Foo {
+        a @0 :Point;
+        b @1 :Point;
+        name @2 :Text;
+        ints @3 :List(Int64);
+        names @4 :List(Text);
+        points @5 :List(Point);
+    }
+    """
+
+    def build(self, mod, segment_size):
+        msg = MessageBuilder(segment_size=segment_size)
+        foo = msg.init_root(mod.Foo)
+        a = foo.init_a()
+        a.set_x(1)
+        a.set_y(2)
+        foo.set_b(mod.Point(3, 4))
+        foo.set_name(b'hello world')
+        ints = foo.init_ints(5)
+        for i in range(5):
+            ints[i] = i*10
+        names = foo.init_names(2)
+        names[0] = b'foo'
+        names[1] = b'bar'
+        points = foo.init_points(2)
+        points[1].set_x(5)
+        a.set_x(100)
+        return msg
+
+    def check(self, foo):
+        assert (foo.a.x, foo.a.y) == (100, 2)
+        assert (foo.b.x, foo.b.y) == (3, 4)
+        assert foo.name == b'hello world'
+        assert list(foo.ints) == [0, 10, 20, 30, 40]
+        assert list(foo.names) == [b'foo', b'bar']
+        assert [p.x for p in foo.points] == [0, 5]
+
+    def test_segments(self):
+        mod = self.compile(self.SCHEMA)
+        msg = self.build(mod, segment_size=None)
+        assert len(msg.get_segments()) == 1
+        self.check(msg.as_reader())
+        #
+        msg = self.build(mod, segment_size=64)
+        segments = msg.get_segments()
+        assert len(segments) > 1
+        for seg in segments:
+            assert len(seg) % 8 == 0
+            assert len(seg) <= 64
+        self.check(msg.as_reader())
+        self.check(loads(msg.dumps(), mod.Foo))
+
+    def test_segment_size_small_objects(self):
+        # the objects are rounded up to words: make sure that we take it into
+        # account when checking whether they fit in a segment
+        mod = self.compile(self.SCHEMA)
+        msg = MessageBuilder(segment_size=60)
+        foo = msg.init_root(mod.Foo)
+        names = foo.init_names(4)
+        for i in range(20):
+            names[i % 4] = b'x' * (i % 7)
+            foo.set_name(b'y' * (i % 7))
+        segments = msg.get_segments()
+        assert len(segments) > 1
+        for seg in segments:
+            assert len(seg) <= 60
+        obj = msg.as_reader()
+        assert list(obj.names) == [b'xx', b'xxx', b'xxxx', b'xxxxx']
+        assert obj.name == b'yyyyy'
+
+    def test_big_object(self):
+        mod = self.compile(self.SCHEMA)
+        msg = MessageBuilder(segment_size=64)
+        foo = msg.init_root(mod.Foo)
+        foo.init_ints(100)[99] = 42
+        segments = msg.get_segments()
+        assert len(segments) == 2
+        assert len(segments[1]) == 808 # landing pad + the list
+        assert foo.as_reader().ints[99] == 42
+
+    def test_header(self):
+        mod = self.compile(self.SCHEMA)
+        msg = self.build(mod, segment_size=64)
+        segments = msg.get_segments()
+        n = len(segments)
+        buf = msg.dumps()
+        header = struct.unpack_from('<%dI' % (n+1), buf, 0)
+        assert header[0] == n-1
+        assert list(header[1:]) == [len(seg)//8 for seg in segments]
+        header_size = ptr.round_up_to_word(4 + 4*n)
+        assert buf[header_size:] == b''.join(segments)
+
+    def test_dump(self, tmpdir):
+        mod = self.compile(self.SCHEMA)
+        msg = self.build(mod, segment_size=64)
+        myfile = tmpdir.join('foo.bin')
+        with myfile.open('wb') as f:
+            f.write(b'x' * 8) # make sure that we don't overwrite it
+            msg.dump(f)
+        assert myfile.read_binary() == b'x' * 8 + msg.dumps()
+        #
+        f = BytesIO()
+        msg.dump(f)
+        assert f.getvalue() == msg.dumps()
+
+    def test_segment_size_too_small(self):
+        py.test.raises(ValueError, "MessageBuilder(segment_size=8)")
+
+    def test_reset(self):
+        mod = self.compile(self.SCHEMA)
+        msg = self.build(mod, segment_size=64)
+        msg.reset()
+        py.test.raises(ValueError, "msg.dumps()")
+        foo = msg.init_root(mod.Foo)
+        foo.init_a().set_y(42)
+        obj = msg.as_reader()
+        assert obj.a.x == 0
+        assert obj.a.y == 42
+        assert obj.b is None
+        assert obj.name is None
+        #
+        # the result is the same as with a fresh builder
+        msg2 = MessageBuilder(segment_size=64)
+        msg2.init_root(mod.Foo).init_a().set_y(42)
+        assert msg.dumps() == msg2.dumps()
@@ -0,0 +1,97 @@
+import py
+import pytest
+from capnpy import annotate
+from capnpy.compiler.compiler import DynamicCompiler
+from capnpy.compiler.cache import SchemaCache, LOCKFILE
+from capnpy.testing.compiler.support import CompilerTest
+
+
+class TestSchemaCache(CompilerTest):
+
+    def load(self, cachedir, **kwargs):
+        comp = DynamicCompiler([self.tmpdir], cachedir=cachedir)
+        options = annotate.Options.from_dict(kwargs)
+        return comp, comp.load_schema(importname='/tmp.capnp', pyx=self.pyx,
+                                      options=options)
+
+    def test_reuse(self, monkeypatch):
+        self.tmpdir.join('tmp.capnp').write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """)
+        cachedir = self.tmpdir.join('cache')
+        comp, mod = self.load(cachedir)
+        assert mod.Point(1, 2).x == 1
+        [key] = [d.basename for d in cachedir.listdir()
+                 if d.check(dir=True)]
+        entry = comp.cache.get(key)
+        assert entry.modname == 'tmp'
+        assert entry.request
+        assert 'class Point' in entry.source
+        assert (entry.dll is not None) == self.pyx
+        #
+        # the second time we don't need to call capnp
+        def fail(*args):
+            raise AssertionError('capnp should not be called')
+        monkeypatch.setattr(DynamicCompiler, '_capnp_compile', fail)
+        comp, mod = self.load(cachedir)
+        assert mod.Point(3, 4).y == 4
+        #
+        # but we do if the options are different
+        py.test.raises(AssertionError, "self.load(cachedir, convert_case=False)")
+
+    def test_no_stray_files(self):
+        self.tmpdir.join('tmp.capnp').write("""
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+        }
+        """)
+        cachedir = self.tmpdir.join('cache')
+        self.load(cachedir)
+        self.load(cachedir, convert_case=False)
+        self.load(cachedir, cache_fields=True)
+        entries = [d for d in cachedir.listdir() if d.basename != LOCKFILE]
+        assert len(entries) == 3
+        for d in entries:
+            assert d.check(dir=True)
+            assert not d.basename.startswith('tmp-')
+
+
+def test_key(tmpdir):
+    incdir = tmpdir.join('include').ensure(dir=True)
+    main = tmpdir.join('main.capnp')
+    main.write("""
+    @0xbf5147cbbecf40c1;
+    using A = import "a.capnp";
+    using B = import "/b.capnp";
+    """)
+    a = tmpdir.join('a.capnp')
+    a.write('@0xbf5147cbbecf40c2;')
+    b = incdir.join('b.capnp')
+    b.write('@0xbf5147cbbecf40c3;')
+    cache = SchemaCache(tmpdir.join('cache'))
+    def key():
+        return cache.get_key(main, [incdir], pyx=False, options=None)
+    #
+    k1 = key()
+    assert key() == k1
+    assert cache.get_key(main, [incdir], pyx=True, options=None) != k1
+    assert cache.get_key(main, [tmpdir], pyx=False, options=None) != k1
+    a.write('@0xbf5147cbbecf40c2; struct A {}')
+    k2 = key()
+    assert k2 != k1
+    b.write('@0xbf5147cbbecf40c3; struct B {}')
+    assert key() != k2
+
+def test_env_var(tmpdir, monkeypatch):
+    cachedir = tmpdir.join('cache')
+    monkeypatch.setenv('CAPNPY_CACHE_DIR', str(cachedir))
+    comp = DynamicCompiler([])
+    assert comp.cache.cachedir == cachedir
+    monkeypatch.delenv('CAPNPY_CACHE_DIR')
+    comp = DynamicCompiler([])
+    assert comp.cache is None
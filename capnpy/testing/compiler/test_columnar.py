@@ -0,0 +1,171 @@
+import py
+import pytest
+import struct
+from io import BytesIO
+from six import PY3
+
+from capnpy import ptr
+from capnpy.message import dumps
+from capnpy.builder import MessageBuilder
+from capnpy.messagefile import MessageFile
+from capnpy.testing.compiler.support import CompilerTest
+
+np = pytest.importorskip('numpy')
+from capnpy.columnar import decode_columns
+
+
+class TestDecodeColumns(CompilerTest):
+
+    SCHEMA = """
+    @0xbf5147cbbecf40c1;
+    enum Color {
+        red @0;
+        green @1;
+        blue @2;
+    }
+    struct Foo {
+        x @0 :Int64;
+        y @1 :Float64;
+        z @2 :Int32 = 42;
+        flag @3 :Bool;
+        color @4 :Color;
+        name @5 :Text;
+        union {
+            a @6 :Int16;
+            b @7 :Void;
+        }
+    }
+    """
+
+    def make_messages(self, mod):
+        objs = [mod.Foo(x=1, y=1.5, z=10, flag=True, color=mod.Color.blue,
+                        name=b'one', a=3),
+                mod.Foo(x=2, y=2.5, flag=False, color=mod.Color.green,
+                        name=None, b=None),
+                mod.Foo(x=3, y=3.5, z=-1, flag=True, name=b'three', a=-3)]
+        return objs, b''.join([dumps(obj) for obj in objs])
+
+    def test_layout(self):
+        mod = self.compile(self.SCHEMA)
+        layout = mod.Foo.__layout__
+        assert layout['x'] == ('data', 'q', 0, 0, None)
+        assert layout['z'] == ('data', 'i', 16, 42, None)
+        assert layout['flag'] == ('bool', '?', 160, 0, None)
+        assert layout['name'] == ('ptr', None, 0, None, None)
+        assert layout['a'][-1] == 0
+        assert 'b' not in layout
+
+    def test_primitive(self):
+        mod = self.compile(self.SCHEMA)
+        objs, buf = self.make_messages(mod)
+        cols = decode_columns(buf, mod.Foo, fields=['x', 'y', 'z', 'color'])
+        assert sorted(cols) == ['color', 'x', 'y', 'z']
+        assert cols['x'].dtype == np.int64
+        assert list(cols['x']) == [1, 2, 3]
+        assert cols['y'].dtype == np.float64
+        assert list(cols['y']) == [1.5, 2.5, 3.5]
+        assert list(cols['z']) == [10, 42, -1]
+        assert list(cols['color']) == [2, 1, 0]
+
+    def test_bool(self):
+        mod = self.compile(self.SCHEMA)
+        objs, buf = self.make_messages(mod)
+        cols = decode_columns(buf, mod.Foo, fields=['flag'])
+        assert cols['flag'].dtype == np.bool_
+        assert list(cols['flag']) == [True, False, True]
+
+    def test_pointer(self):
+        mod = self.compile(self.SCHEMA)
+        objs, buf = self.make_messages(mod)
+        cols = decode_columns(buf, mod.Foo, fields=['name'])
+        assert cols['name'].dtype == object
+        assert list(cols['name']) == [b'one', None, b'three']
+
+    def test_union(self):
+        mod = self.compile(self.SCHEMA)
+        objs, buf = self.make_messages(mod)
+        cols = decode_columns(buf, mod.Foo, fields=['a'])
+        a = cols['a']
+        assert list(a.mask) == [False, True, False]
+        assert a.tolist() == [3, None, -3]
+
+    def test_all_fields(self):
+        mod = self.compile(self.SCHEMA)
+        objs, buf = self.make_messages(mod)
+        cols = decode_columns(buf, mod.Foo)
+        assert sorted(cols) == sorted(mod.Foo.__layout__)
+        for name, col in cols.items():
+            if name == 'a':
+                continue
+            expected = [getattr(obj, name) for obj in objs]
+            assert list(col) == expected
+
+    def test_sources(self, tmpdir):
+        mod = self.compile(self.SCHEMA)
+        objs, buf = self.make_messages(mod)
+        cols = decode_columns(BytesIO(buf), mod.Foo, fields=['x'])
+        assert list(cols['x']) == [1, 2, 3]
+        cols = decode_columns(bytearray(buf), mod.Foo, fields=['x'])
+        assert list(cols['x']) == [1, 2, 3]
+        #
+        if PY3: # MessageFile requires Python 3
+            myfile = tmpdir.join('foo.bin')
+            myfile.write_binary(buf)
+            with MessageFile(str(myfile), mod.Foo) as mf:
+                cols = decode_columns(mf, mod.Foo, fields=['x'])
+            assert list(cols['x']) == [1, 2, 3]
+        #
+        cols = decode_columns(b'', mod.Foo, fields=['x', 'name'])
+        assert len(cols['x']) == 0
+        assert len(cols['name']) == 0
+
+    def test_multi_segment(self):
+        mod = self.compile(self.SCHEMA)
+        msg = MessageBuilder(segment_size=16)
+        foo = msg.init_root(mod.Foo)
+        foo.set_x(42)
+        foo.set_name(b'hello world')
+        assert len(msg.get_segments()) > 1
+        buf = msg.dumps() + dumps(mod.Foo(x=43))
+        cols = decode_columns(buf, mod.Foo, fields=['x', 'name'])
+        assert list(cols['x']) == [42, 43]
+        assert list(cols['name']) == [b'hello world', None]
+
+    def test_old_schema(self):
+        # messages written with an older version of the schema have a
+        # smaller data section: the missing fields get their default value
+        old = self.compile("""
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64;
+        }
+        """)
+        buf = dumps(old.Foo(x=1))
+        mod = self.compile(self.SCHEMA)
+        cols = decode_columns(buf, mod.Foo, fields=['x', 'y', 'z', 'flag'])
+        assert list(cols['x']) == [1]
+        assert list(cols['y']) == [0.0]
+        assert list(cols['z']) == [42]
+        assert list(cols['flag']) == [False]
+
+    def test_errors(self):
+        mod = self.compile(self.SCHEMA)
+        objs, buf = self.make_messages(mod)
+        py.test.raises(ValueError, "decode_columns(buf, mod.Foo, ['nope'])")
+        py.test.raises(TypeError, "decode_columns(buf, object, ['x'])")
+
+    def test_invalid_root(self):
+        mod = self.compile(self.SCHEMA)
+        objs, buf = self.make_messages(mod)
+        def message_with_root(offset):
+            # 1 segment of 2 words: the root pointer and a data word
+            p = ptr.new_struct(offset, 1, 0)
+            return struct.pack('<IIqq', 0, 2, p, 42)
+        cols = decode_columns(message_with_root(0), mod.Foo, fields=['x'])
+        assert list(cols['x']) == [42]
+        # the root points into the next message, or before the beginning of
+        # its own one
+        for offset in (1, 5, -2, -3):
+            bad = message_with_root(offset) + buf
+            py.test.raises(ValueError,
+                           "decode_columns(bad, mod.Foo, fields=['x'])")
@@ -1,10 +1,12 @@
 # -*- encoding: utf-8 -*-
 import py
 import pytest
+import array
 from six import b
 
 from capnpy.schema import Field, Type, Value
 from capnpy.compiler.structor import Structor, FieldTree
+from capnpy.segment.builder import enable_builder_pool, new_builder
 from capnpy.testing.compiler.support import CompilerTest
 
 class TestConstructors(CompilerTest):
@@ -169,6 +171,39 @@ class TestConstructors(CompilerTest):
         assert foo._seg.buf == b('\x01\x00\x00\x00\x22\x00\x00\x00'   # ptrlist
                                  '\x01\x02\x03\x04\x00\x00\x00\x00')  # 1,2,3,4 + padding
 
+    def test_list_from_buffer(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :List(Int64);
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(array.array('q', [1, 2, 3]))
+        assert foo._seg.buf == mod.Foo([1, 2, 3])._seg.buf
+        assert list(foo.x) == [1, 2, 3]
+
+    def test_list_from_slice(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            x @0 :List(Int64);
+            points @1 :List(Point);
+        }
+        """
+        mod = self.compile(schema)
+        points = [mod.Point(i, i*2) for i in range(10)]
+        foo = mod.Foo(list(range(10)), points)
+        foo2 = mod.Foo(foo.x[2:8:2], foo.points[7:2:-2])
+        assert list(foo2.x) == [2, 4, 6]
+        assert [(p.x, p.y) for p in foo2.points] == [(7, 14), (5, 10), (3, 6)]
+        assert foo2._seg.buf == mod.Foo([2, 4, 6], [points[7], points[5],
+                                                    points[3]])._seg.buf
+
     def test_list_of_void(self):
         schema = """
         @0xbf5147cbbecf40c1;
@@ -353,6 +388,74 @@ class TestConstructors(CompilerTest):
         assert p.position.empty is None
 
 
+class TestBuilderPool(CompilerTest):
+
+    @pytest.fixture
+    def pool(self):
+        enable_builder_pool()
+        yield
+        enable_builder_pool(False)
+
+    def test_ctor(self, pool):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+            name @2 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        p1 = mod.Point(1, 2, b'foo')
+        p2 = mod.Point(3, 4, None)
+        assert (p1.x, p1.y, p1.name) == (1, 2, b'foo')
+        assert (p2.x, p2.y, p2.name) == (3, 4, None)
+
+    def test_nested_ctors(self, pool):
+        # the items of the list are built while the outer ctor is still
+        # using its builder
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Polygon {
+            points @0 :List(Point);
+        }
+        """
+        mod = self.compile(schema)
+        class LazyPoints(object):
+            def __len__(self):
+                return 3
+            def __iter__(self):
+                for i in range(3):
+                    yield mod.Point(i, i*2)
+        poly = mod.Polygon(points=LazyPoints())
+        assert [(p.x, p.y) for p in poly.points] == [(0, 0), (1, 2), (2, 4)]
+
+    def test_initial_capacity(self, pool):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Named {
+            x @0 :Int64;
+            name @1 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        # the builders used by the ctors end up in the pool, where we can
+        # look at them. Point has no pointers, so its builder has exactly the
+        # size of the struct
+        mod.Point(1, 2)
+        assert new_builder().length == 16
+        mod.Named(1, b'foo')
+        assert new_builder().length == 16 + 512
+
+
 class TestDefaults(CompilerTest):
     
     def test_no_args(self):
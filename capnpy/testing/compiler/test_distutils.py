@@ -63,6 +63,74 @@ class TestDistutilsCompiler(CompilerTest):
         assert outfile == outfile3
         assert outfile3.mtime() > mtime
 
+    def test_recompile_if_import_changed(self):
+        self.write("example.capnp", """
+        @0xbf5147cbbecf40c1;
+        using Other = import "/other.capnp";
+        struct Point {
+            x @0: Other.Int;
+            y @1: Other.Int;
+        }
+        """)
+        self.write("other.capnp", """
+        @0xbf5147cbbecf40c2;
+        using Int = Int64;
+        """)
+        compiler = DistutilsCompiler([self.tmpdir])
+        infile = self.tmpdir.join("example.capnp")
+        outfile = compiler.compile(infile, pyx=self.pyx)
+        mtime = outfile.mtime()
+        outfile2 = compiler.compile(infile, pyx=self.pyx)
+        assert outfile2.mtime() == mtime
+        #
+        self.tmpdir.join("other.capnp").setmtime(mtime+1)
+        outfile3 = compiler.compile(infile, pyx=self.pyx)
+        assert outfile3.mtime() > mtime
+
+    def test_dont_compile_if_import_not_found(self):
+        # an import which cannot be resolved on the path (e.g.
+        # /capnp/c++.capnp) must not cause a recompilation every time
+        self.write("example.capnp", """
+        @0xbf5147cbbecf40c1;
+        using Cxx = import "/capnp/c++.capnp";
+        struct Point {
+            x @0: Int64;
+            y @1: Int64;
+        }
+        """)
+        compiler = DistutilsCompiler([self.tmpdir])
+        infile = self.tmpdir.join("example.capnp")
+        outfile = self.tmpdir.join("example.py")
+        outfile.write("")
+        outfile.setmtime(infile.mtime()+1)
+        assert compiler._is_up_to_date(infile, outfile)
+        #
+        infile.setmtime(outfile.mtime()+1)
+        assert not compiler._is_up_to_date(infile, outfile)
+
+
+class TestCapnpify(CompilerTest):
+
+    def test_parallel(self, monkeypatch):
+        from capnpy.compiler.distutils import capnpify
+        for name in ('a', 'b', 'c'):
+            self.write("%s.capnp" % name, """
+            @0xbf5147cbbecf40c1;
+            struct Point {
+                x @0: Int64;
+                y @1: Int64;
+            }
+            """)
+        monkeypatch.chdir(self.tmpdir)
+        exts = capnpify("*.capnp", pyx=self.pyx, nthreads=2)
+        ext = self.pyx and 'pyx' or 'py'
+        for name in ('a', 'b', 'c'):
+            assert self.tmpdir.join('%s.%s' % (name, ext)).check(file=True)
+        if self.pyx:
+            assert len(exts) == 3
+        else:
+            assert exts == []
+
 
 class TestSetup(CompilerTest):
 
@@ -138,6 +138,11 @@ class TestField(CompilerTest):
         assert r.a.y == 2
         assert r.b.x == 3
         assert r.b.y == 4
+        #
+        # reading a struct field is charged to the traversal limit
+        r._seg.traversal_limit = 3
+        assert r.a.x == 1
+        py.test.raises(ValueError, "r.b")
 
     def test_nested_struct(self):
         schema = """
@@ -386,6 +391,59 @@ class TestField(CompilerTest):
         assert p.b == False
         assert p.c == True
 
+    def test_cache_fields(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            p @0 :Point;
+            items @1 :List(Int64);
+            name @2 :Text;
+            data @3 :Data;
+            other @4 :Point;
+        }
+        """
+        mod = self.compile(schema, cache_fields=True)
+        foo = mod.Foo(p=mod.Point(1, 2), items=[1, 2, 3], name=b'foo',
+                      data=b'bar', other=None)
+        assert foo.p is foo.p
+        assert foo.p.x == 1
+        assert foo.items is foo.items
+        assert list(foo.items) == [1, 2, 3]
+        assert foo.name is foo.name
+        assert foo.name == b'foo'
+        assert foo.data is foo.data
+        assert foo.other is None
+        assert foo.get_other().x == 0
+        #
+        mod = self.compile(schema)
+        foo = mod.Foo(p=mod.Point(1, 2), items=[1, 2, 3], name=b'foo',
+                      data=b'bar', other=None)
+        assert foo.p is not foo.p
+        assert foo.items is not foo.items
+
+    def test_cache_fields_annotation(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            a @0 :Point $Py.options(cacheFields=true);
+            b @1 :Point;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(a=mod.Point(1, 2), b=mod.Point(3, 4))
+        assert foo.a is foo.a
+        assert foo.b is not foo.b
+
+
 class TestList(CompilerTest):
 
     def test_list_of_primitive(self):
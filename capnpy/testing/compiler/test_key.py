@@ -91,6 +91,172 @@ class TestKey(CompilerTest):
         assert p3 == (1, 2, b"p3")
         assert hash(p1) == hash(p2) == hash((1, 2, "p1"))
 
+    def no_key(self, cls):
+        @cls.__extend__
+        class Foo:
+            def _key(self):
+                raise ValueError('_key not allowed')
+
+    def test_hash_cached(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point $Py.key("x, y") {
+            x @0 :Int64;
+            y @1 :Int64;
+            name @2 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        p1 = mod.Point(1, 2, b"p1")
+        h = hash(p1)
+        self.no_key(mod.Point)
+        assert hash(p1) == h
+
+    def test_equals_shortcuts(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point $Py.key("x, name") {
+            x @0 :Int64;
+            y @1 :Int64;
+            name @2 :Text;
+        }
+        struct Polygon {
+            points @0 :List(Point);
+        }
+        """
+        mod = self.compile(schema)
+        poly = mod.Polygon([mod.Point(1, 2, b"p1"), mod.Point(3, 4, b"p2")])
+        p1 = mod.Point(1, 2, b"p1")
+        p2 = mod.Point(1, 2, b"p2")
+        p3 = mod.Point(3, 4, b"p3")
+        hash(p1); hash(p3)
+        self.no_key(mod.Point)
+        # same buffer and offset
+        assert poly.points[0] == poly.points[0]
+        assert not poly.points[0] != poly.points[0]
+        # the hashes are already known and differ
+        assert p1 != p3
+        assert not p1 == p3
+        # the hash of p2 is unknown: we need to compare the keys
+        py.test.raises(ValueError, "p1 == p2")
+
+    def test_raw_equals(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Point $Py.key("x, y, color") {
+            x @0 :Int64;
+            y @1 :Int32;
+            name @2 :Text;
+            color @3 :Color;
+        }
+        """
+        mod = self.compile(schema)
+        # the key is made only of integers and enums, so comparing two Points
+        # does not need to build the keys
+        self.no_key(mod.Point)
+        p1 = mod.Point(1, 2, b"p1", mod.Color.red)
+        p2 = mod.Point(1, 2, b"p2", mod.Color.red)
+        p3 = mod.Point(1, 2, b"p3", mod.Color.green)
+        p4 = mod.Point(1, 0, b"p4", mod.Color.red)
+        assert p1 == p2
+        assert p1 != p3
+        assert not p1 == p3
+        assert p1 != p4
+        # but we need it to compare with a tuple
+        py.test.raises(ValueError, "p1 == (1, 2, mod.Color.red)")
+
+    def test_raw_equals_evolution(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point $Py.key("x, y") {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct OldPoint {
+            x @0 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        old = mod.Point.loads(mod.OldPoint(1).dumps())
+        assert old._data_size == 1
+        assert old == mod.Point(1, 0)
+        assert old != mod.Point(1, 2)
+        assert mod.Point(1, 0) == old
+
+    def test_list_lookup(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point $Py.key("x, y") {
+            x @0 :Int64;
+            y @1 :Int64;
+            name @2 :Text;
+        }
+        struct Polygon {
+            points @0 :List(Point);
+        }
+        """
+        mod = self.compile(schema)
+        N = 1000
+        points = [mod.Point(i, i*2, str(i).encode('ascii')) for i in range(N)]
+        poly = mod.Polygon(points)
+        lst = poly.points
+        index = lst.index_by_key()
+        assert len(index) == N
+        for i in range(N):
+            assert lst.lookup((i, i*2)).name == str(i).encode('ascii')
+        assert lst.lookup(mod.Point(42, 84, b'')).name == b'42'
+        py.test.raises(KeyError, "lst.lookup((1, 1))")
+        py.test.raises(KeyError, "lst.lookup((N, N*2))")
+        #
+        # lookup() builds the index automatically
+        poly = mod.Polygon(points)
+        assert poly.points.lookup((3, 6)).name == b'3'
+
+    def test_list_lookup_cache_fields(self):
+        # with cacheFields, reading the field returns always the same list,
+        # which keeps its index
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point $Py.key("x, y") {
+            x @0 :Int64;
+            y @1 :Int64;
+            name @2 :Text;
+        }
+        struct Polygon {
+            points @0 :List(Point) $Py.options(cacheFields=true);
+        }
+        """
+        mod = self.compile(schema)
+        poly = mod.Polygon([mod.Point(i, i*2, str(i).encode('ascii'))
+                            for i in range(10)])
+        poly.points.build_index(key=lambda p: p.name)
+        assert poly.points.lookup(b'3').x == 3
+
+    def test_raw_equals_float(self):
+        # floats cannot be compared bytewise
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point $Py.key("x, y") {
+            x @0 :Float64;
+            y @1 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        assert mod.Point(0.0, 1) == mod.Point(-0.0, 1)
+        nan = float('nan')
+        assert mod.Point(nan, 1) != mod.Point(nan, 1)
+
 
 
 class TestFashHash(CompilerTest):
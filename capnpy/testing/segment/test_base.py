@@ -1,5 +1,6 @@
 import pytest
 import sys
+import gc
 import struct
 import math
 from pypytools import IS_PYPY
@@ -18,6 +19,11 @@ def test_unpack_uint32():
     buf = b'abc'
     pytest.raises(IndexError, "unpack_uint32(buf, 0)")
 
+def test_unpack_uint32_buffer():
+    buf = memoryview(struct.pack('II', 12, 34))
+    assert unpack_uint32(buf, 4) == 34
+    pytest.raises(IndexError, "unpack_uint32(buf, 6)")
+
 
 class TestBaseSegment(object):
 
@@ -121,6 +127,47 @@ class TestBaseSegment(object):
         msg = s.dump_message(p, 8, 24)
         assert msg == exp
 
+    def test_bytes_equal(self):
+        s1 = BaseSegment(b('garbage0' 'abcdefgh'))
+        s2 = BaseSegment(b('abcdefgh' 'abcdxxxx'))
+        assert s1.bytes_equal(8, s2, 0, 8)
+        assert s1.bytes_equal(8, s2, 8, 4)
+        assert not s1.bytes_equal(8, s2, 8, 8)
+        assert not s1.bytes_equal(0, s2, 0, 8)
+        pytest.raises(IndexError, "s1.bytes_equal(12, s2, 0, 8)")
+        pytest.raises(IndexError, "s1.bytes_equal(8, s2, 12, 8)")
+        pytest.raises(IndexError, "s1.bytes_equal(-1, s2, 0, 8)")
+
+    def test_buffer_protocol(self):
+        buf = bytearray(struct.pack('qqq', 42, 43, 44))
+        s = BaseSegment(memoryview(buf))
+        assert s.read_int64(8) == 43
+        assert s.read_bytes(8, 16) == struct.pack('q', 43)
+        assert s.read_bytes(16, 100) == struct.pack('q', 44)
+        pytest.raises(IndexError, "s.read_int64(24)")
+        # the memory is shared, not copied
+        struct.pack_into('q', buf, 8, 100)
+        assert s.read_int64(8) == 100
+
+    def test_buffer_protocol_gc(self):
+        # the segment is reachable only from a cycle: the GC must not clear
+        # the memoryview while the segment still holds its buffer
+        s = BaseSegment(memoryview(bytearray(struct.pack('q', 42))))
+        cycle = [s]
+        cycle.append(cycle)
+        del s, cycle
+        gc.collect()
+
+    @pytest.mark.skipif(not PY3, reason='memoryview.cast is not available')
+    def test_buffer_protocol_non_bytes_items(self):
+        import array
+        buf = array.array('q', [42, 43, 44])
+        s = BaseSegment(buf)
+        assert s.read_int64(16) == 44
+        pytest.raises(IndexError, "s.read_int64(24)")
+        msg = s.dump_message(0, 8, 16)
+        assert msg[16:] == struct.pack('q', 43)
+
     def test_dump_message_errors(self):
         buf = b('garbage0'
                 '\x01\x00\x00\x00\x00\x00\x00\x00'  # 1
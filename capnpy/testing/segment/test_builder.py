@@ -1,4 +1,7 @@
 from __future__ import print_function
+import sys
+import array
+import threading
 import pytest
 import struct
 from six import b
@@ -7,7 +10,8 @@ from capnpy.blob import PYX
 from capnpy import ptr
 from capnpy.printer import print_buffer
 from capnpy.segment.segment import Segment
-from capnpy.segment.builder import SegmentBuilder
+from capnpy.segment.builder import (SegmentBuilder, enable_builder_pool,
+                                    new_builder, release_builder)
 from capnpy.struct_ import Struct
 from capnpy.list import PrimitiveItemType, StructItemType, TextItemType
 from capnpy.type import Types
@@ -32,7 +36,6 @@ class TestSegmentBuilder(object):
         assert s[:8] == struct.pack('q', 42)
         assert s[8:] == b'\x00' * (64*64-8)
 
-    @pytest.mark.skipif(not PYX, reason='PYX only')
     def test_resize_big_allocation(self):
         buf = SegmentBuilder(32)
         assert buf.length == 32
@@ -43,6 +46,47 @@ class TestSegmentBuilder(object):
         assert buf.length == 4096
         assert buf.end == 4096
 
+    def test_reset(self):
+        buf = SegmentBuilder(32)
+        buf.allocate(16)
+        buf.write_int64(0, 42)
+        buf.write_int64(8, 43)
+        buf.reset()
+        assert buf.end == 0
+        assert buf.length == 32
+        assert buf.as_string() == b''
+        # the reused memory is zeroed again
+        assert buf.allocate(8) == 0
+        assert buf.as_string() == b'\x00' * 8
+        buf.reset()
+        assert buf.allocate(24) == 0
+        assert buf.as_string() == b'\x00' * 24
+
+    def test_build_into_bytearray(self):
+        mybuf = bytearray(b'garbage!' * 4)
+        buf = SegmentBuilder(buf=mybuf)
+        assert buf.length == 32
+        pos = buf.allocate(16)
+        buf.write_int64(pos, 42)
+        assert mybuf[:16] == struct.pack('qq', 42, 0)
+        assert mybuf[16:] == b'garbage!' * 2
+        assert buf.as_string() == struct.pack('qq', 42, 0)
+
+    def test_build_into_exported_bytearray(self):
+        mybuf = bytearray(16)
+        view = memoryview(mybuf)
+        buf = SegmentBuilder(buf=mybuf)
+        assert buf.allocate(8) == 0
+        # the bytearray cannot be resized while the memoryview is alive
+        with pytest.raises(BufferError):
+            buf.allocate(64)
+        assert buf.length == 16
+        assert buf.get_length() == 8
+        assert len(mybuf) == 16
+        del view
+        assert buf.allocate(64) == 8
+        assert len(mybuf) >= 72
+
     def test_write(self):
         expected = struct.pack('<bBhHiIqQfd', 10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
         n = len(expected)
@@ -79,6 +123,18 @@ class TestSegmentBuilder(object):
         s = buf.as_string()
         assert s == expected
 
+    def test_write_bool(self):
+        buf = SegmentBuilder(8)
+        buf.allocate(8)
+        buf.write_bool(0, 0, True)
+        buf.write_bool(0, 3, True)
+        buf.write_bool(1, 7, True)
+        assert buf.as_string() == b'\x09\x80' + b'\x00'*6
+        # writing False clears the bit
+        buf.write_bool(0, 0, False)
+        buf.write_bool(1, 6, False)
+        assert buf.as_string() == b'\x08\x80' + b'\x00'*6
+
     def test_alloc_struct(self):
         buf = SegmentBuilder(64)
         buf.allocate(16)
@@ -143,6 +199,14 @@ class TestSegmentBuilder(object):
         assert s == b('\x00\x00\x00\x00\x00\x00\x00\x00'
                       'foobar\x00\x00')
 
+    def test_write_buffer(self):
+        buf = SegmentBuilder()
+        pos = buf.allocate(16)
+        buf.write_buffer(pos+4, array.array('h', [1, 2, 3]))
+        s = buf.as_string()
+        assert s == b('\x00\x00\x00\x00\x01\x00\x02\x00'
+                      '\x03\x00\x00\x00\x00\x00\x00\x00')
+
     def test_null_pointers(self):
         NULL = b'\x00\x00\x00\x00\x00\x00\x00\x00' # NULL pointer
         buf = SegmentBuilder()
@@ -195,6 +259,40 @@ class TestSegmentBuilder(object):
             '\xd9\xce\xf7\x53\xe3\xa5\x0b\x40'   # 3.456
             '\xf8\x53\xe3\xa5\x9b\x44\x12\x40')  # 4.567
 
+    def test_copy_from_list_buffer(self):
+        expected = b(
+            '\x01\x00\x00\x00\x1c\x00\x00\x00'   # ptrlist
+            '\x01\x00\x00\x00\x02\x00\x00\x00'   # 1, 2
+            '\x03\x00\x00\x00\x00\x00\x00\x00')  # 3 + padding
+        item_type = PrimitiveItemType(Types.int32)
+        #
+        # same layout: the whole buffer is copied at once
+        for lst in (array.array('i', [1, 2, 3]),
+                    memoryview(array.array('i', [1, 2, 3]))):
+            buf = SegmentBuilder()
+            pos = buf.allocate(8)
+            buf.copy_from_list(pos, item_type, lst)
+            assert buf.as_string() == expected
+        #
+        # different layout: fall back to the item-by-item copy
+        buf = SegmentBuilder()
+        pos = buf.allocate(8)
+        buf.copy_from_list(pos, item_type, array.array('q', [1, 2, 3]))
+        assert buf.as_string() == expected
+
+    def test_copy_from_list_numpy(self):
+        np = pytest.importorskip('numpy')
+        item_type = PrimitiveItemType(Types.float64)
+        lst = [1.234, 2.345, 3.456, 4.567]
+        buf1 = SegmentBuilder()
+        buf1.copy_from_list(buf1.allocate(8), item_type, lst)
+        for arr in (np.array(lst, dtype='<f8'),
+                    np.array(lst, dtype='>f8'),      # wrong byteorder
+                    np.repeat(lst, 2)[::2]):            # not contiguous
+            buf2 = SegmentBuilder()
+            buf2.copy_from_list(buf2.allocate(8), item_type, arr)
+            assert buf2.as_string() == buf1.as_string()
+
     def test_copy_from_list_of_structs(self):
         class Point(Struct):
             __static_data_size__ = 2
@@ -283,3 +381,85 @@ class TestSegmentBuilder(object):
                          'J' 'o' 'h' 'n' '\x00\x00\x00\x00'    # John
                          'E' 'm' 'i' 'l' 'y' '\x00\x00\x00')   # Emily
         assert s == expected_buf
+
+
+class TestBuilderPool(object):
+
+    @pytest.fixture
+    def pool(self):
+        enable_builder_pool()
+        yield
+        enable_builder_pool(False)
+
+    def test_disabled(self):
+        b1 = new_builder()
+        release_builder(b1)
+        b2 = new_builder()
+        assert b1 is not b2
+
+    def test_length(self):
+        assert new_builder().length == 512
+        assert new_builder(16).length == 16
+
+    def test_reuse(self, pool):
+        b1 = new_builder()
+        b1.allocate(8)
+        b1.write_int64(0, 42)
+        release_builder(b1)
+        b2 = new_builder()
+        assert b2 is b1
+        assert b2.as_string() == b''
+        assert b2.allocate(8) == 0
+        assert b2.as_string() == b'\x00' * 8
+        #
+        # two builders in use at the same time are different
+        b3 = new_builder()
+        assert b3 is not b2
+
+    def test_threads(self, pool):
+        # the pool is shared by all the threads: they must never get the same
+        # builder, nor fail if another thread empties the pool
+        errors = []
+        def run():
+            try:
+                for i in range(5000):
+                    b1 = new_builder()
+                    b2 = new_builder()
+                    if b1 is b2:
+                        errors.append('same builder')
+                    release_builder(b1)
+                    release_builder(b2)
+            except Exception as e:
+                errors.append(e)
+        #
+        old_interval = getattr(sys, 'getswitchinterval', lambda: None)()
+        if old_interval is not None:
+            sys.setswitchinterval(1e-6) # switch threads as often as possible
+        try:
+            threads = [threading.Thread(target=run) for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            if old_interval is not None:
+                sys.setswitchinterval(old_interval)
+        assert errors == []
+
+    @pytest.mark.skipif(PYX, reason="_pool is a C global in pyx mode")
+    def test_pool_emptied_concurrently(self, monkeypatch):
+        from capnpy.segment import builder
+        class EmptiedPool(list):
+            # simulate another thread which pops the last builder after we
+            # checked the pool
+            def __bool__(self):
+                return True
+            __nonzero__ = __bool__
+        monkeypatch.setattr(builder, '_pool', EmptiedPool())
+        assert isinstance(new_builder(), SegmentBuilder)
+
+    def test_big_builders_are_not_kept(self, pool):
+        b1 = new_builder()
+        b1.allocate(1024*1024)
+        release_builder(b1)
+        assert new_builder() is not b1
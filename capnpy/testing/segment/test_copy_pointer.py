@@ -6,6 +6,7 @@ from capnpy import ptr
 from capnpy.printer import print_buffer
 from capnpy.segment.segment import Segment, MultiSegment
 from capnpy.segment.builder import SegmentBuilder, copy_pointer
+from capnpy.testing.segment.test_endof import make_deep_tree
 
 
 class TestCopyPointer(object):
@@ -320,3 +321,36 @@ class TestCopyPointer(object):
             '\x00\x00\x00\x00\x02\x00\x00\x00'    # ptr to B {x, y}
             '\x01\x00\x00\x00\x00\x00\x00\x00'    # x == 1
             '\x02\x00\x00\x00\x00\x00\x00\x00')   # y == 2
+
+    def test_limits(self):
+        src = b('garbage0'
+                '\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+                '\x00\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+                '\x00\x00\x00\x00\x00\x00\x00\x00'    # ptr to b (NULL)
+                '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+                '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+        def copy(nesting_limit=-1, traversal_limit=-1):
+            src_seg = Segment(src)
+            src_seg.nesting_limit = nesting_limit
+            src_seg.traversal_limit = traversal_limit
+            self.copy_struct_segment(src_seg, offset=8, data_size=1, ptrs_size=2,
+                                     bufsize=64)
+            return src_seg
+        #
+        copy(nesting_limit=2)
+        with pytest.raises(ValueError) as exc:
+            copy(nesting_limit=1)
+        assert str(exc.value) == 'Exceeded the message nesting limit'
+        #
+        # the Rectangle is 3 words, a is 2 words
+        assert copy(traversal_limit=6).traversal_limit == 1
+        with pytest.raises(ValueError) as exc:
+            copy(traversal_limit=4)
+        assert str(exc.value) == 'Exceeded the message traversal limit'
+
+    def test_deep(self):
+        # this used to recurse once per level
+        src = make_deep_tree(10000)
+        dst = self.copy_struct(src, offset=0, data_size=1, ptrs_size=2)
+        assert dst[:8] == struct.pack('<q', ptr.new_struct(0, 1, 2))
+        assert dst[8:] == src
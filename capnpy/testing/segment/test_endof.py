@@ -1,3 +1,5 @@
+import py
+import struct
 from six import b
 
 from capnpy import ptr
@@ -5,6 +7,29 @@ from capnpy.printer import print_buffer
 from capnpy.segment.segment import Segment, MultiSegment
 from capnpy.segment.endof import endof
 
+
+def make_deep_tree(n):
+    """
+    Return a compact buffer containing n nested structs {x, a, b}, where a
+    points to the next struct and b to a leaf struct {y}: the leaves come
+    after all the structs, in reverse order
+    """
+    buf = []
+    leaves_start = n*24
+    for i in range(n):
+        buf.append(struct.pack('<q', i))
+        if i == n-1:
+            buf.append(struct.pack('<q', 0))
+        else:
+            buf.append(struct.pack('<q', ptr.new_struct(1, 1, 2)))
+        leaf = leaves_start + (n-1-i)*8
+        ptr_pos = i*24 + 16
+        buf.append(struct.pack('<q', ptr.new_struct((leaf-ptr_pos-8)//8, 1, 0)))
+    for i in reversed(range(n)):
+        buf.append(struct.pack('<q', i*10))
+    return b''.join(buf)
+
+
 class TestEndOf(object):
 
     def endof(self, seg, offset, data_size, ptrs_size):
@@ -307,3 +332,37 @@ class TestEndOf(object):
         seg = MultiSegment(seg0+seg1, segment_offsets=(0, 8))
         end = self.endof(seg, offset=0, data_size=0, ptrs_size=1)
         assert end == -1
+
+    def test_limits(self):
+        buf = b('garbage0'
+                '\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+                '\x04\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+                '\x08\x00\x00\x00\x02\x00\x00\x00'    # ptr to b
+                '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+                '\x02\x00\x00\x00\x00\x00\x00\x00'    # a.y == 2
+                '\x03\x00\x00\x00\x00\x00\x00\x00'    # b.x == 3
+                '\x04\x00\x00\x00\x00\x00\x00\x00')   # b.y == 4
+        seg = Segment(buf)
+        seg.nesting_limit = 2
+        seg.traversal_limit = 7
+        assert self.endof(seg, 8, data_size=1, ptrs_size=2) == 64
+        assert seg.traversal_limit == 0
+        py.test.raises(ValueError, "self.endof(seg, 8, data_size=1, ptrs_size=2)")
+        #
+        seg = Segment(buf)
+        seg.nesting_limit = 1
+        exc = py.test.raises(ValueError,
+                             "self.endof(seg, 8, data_size=1, ptrs_size=2)")
+        assert str(exc.value) == 'Exceeded the message nesting limit'
+
+    def test_deep(self):
+        # this used to recurse once per level
+        n = 10000
+        buf = make_deep_tree(n)
+        assert self.endof(buf, 0, data_size=1, ptrs_size=2) == len(buf)
+        #
+        # put a gap before the last leaf
+        i = (n-1)*24 + 16 # the b pointer of the last struct
+        buf = buf[:i] + struct.pack('<q', ptr.new_struct(2, 1, 0)) + buf[i+8:]
+        buf += b'garbage!'
+        assert self.endof(buf, 0, data_size=1, ptrs_size=2) == -1
@@ -26,6 +26,12 @@ def test_MultiSegment_pickle():
     assert buf2.buf == b'hello'
     assert buf2.segment_offsets == (1, 2, 3)
 
+def test_Segment_pickle_memoryview():
+    import pickle
+    buf = Segment(memoryview(b'hello'))
+    buf2 = pickle.loads(pickle.dumps(buf))
+    assert buf2.buf == b'hello'
+
 def test_read_str():
     buf = b('garbage0'
             'hello capnproto\0') # string
@@ -46,6 +52,17 @@ def test_hash_str():
     h = bb.hash_str(p, 0, 0, additional_size=0)
     assert h == hash(b"hello capnproto\0")
 
+def test_read_str_memoryview():
+    buf = memoryview(b('garbage0'
+                       'hello capnproto\0')) # string
+    p = ptr.new_list(0, ptr.LIST_SIZE_8, 16)
+    bb = Segment(buf)
+    s = bb.read_str(p, 0, "", additional_size=-1)
+    assert type(s) is bytes
+    assert s == b"hello capnproto"
+    h = bb.hash_str(p, 0, 0, additional_size=-1)
+    assert h == hash(b"hello capnproto")
+
 def test_hash_str_exception():
     buf = b''
     p = ptr.new_struct(0, 1, 1) # this is the wrong type of pointer
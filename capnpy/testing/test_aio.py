@@ -0,0 +1,92 @@
+import py
+import socket
+import asyncio
+from six import b
+
+from capnpy import aio
+from capnpy.message import loads, dumps_packed
+from capnpy.type import Types
+from capnpy.struct_ import Struct
+
+ONE = b('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+        '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+        '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+        '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+
+TWO = b('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+        '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+        '\x03\x00\x00\x00\x00\x00\x00\x00'   # x == 3
+        '\x04\x00\x00\x00\x00\x00\x00\x00')  # y == 4
+
+MULTI = b('\x01\x00\x00\x00\x01\x00\x00\x00'  # 2 segments, sizes 1 and
+          '\x03\x00\x00\x00\x00\x00\x00\x00'  # 3 words, padding
+          '\x02\x00\x00\x00\x01\x00\x00\x00'  # far ptr to segment 1
+          '\x00\x00\x00\x00\x02\x00\x00\x00'  # landing pad: ptr to Point
+          '\x05\x00\x00\x00\x00\x00\x00\x00'  # x == 5
+          '\x06\x00\x00\x00\x00\x00\x00\x00') # y == 6
+
+def xy(p):
+    return (p._read_primitive(0, Types.int64.ifmt),
+            p._read_primitive(8, Types.int64.ifmt))
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_load():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(ONE + TWO)
+        reader.feed_eof()
+        p1 = await aio.load(reader, Struct)
+        p2 = await aio.load(reader, Struct)
+        return xy(p1), xy(p2)
+    assert run(main()) == ((1, 2), (3, 4))
+
+def test_load_multiple_segments():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(MULTI)
+        reader.feed_eof()
+        return xy(await aio.load(reader, Struct))
+    assert run(main()) == (5, 6)
+
+def test_load_all():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(ONE + MULTI + TWO)
+        reader.feed_eof()
+        return [xy(p) async for p in aio.load_all(reader, Struct)]
+    assert run(main()) == [(1, 2), (5, 6), (3, 4)]
+
+def test_eof():
+    async def load(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await aio.load(reader, Struct)
+    py.test.raises(EOFError, "run(load(b''))")
+    py.test.raises(ValueError, "run(load(ONE[:2]))")
+    py.test.raises(ValueError, "run(load(ONE[:6]))")
+    py.test.raises(ValueError, "run(load(ONE[:-1]))")
+    py.test.raises(ValueError, "run(load(MULTI[:12]))")
+
+def test_dump():
+    async def main():
+        a, b = socket.socketpair()
+        reader, writer_a = await asyncio.open_connection(sock=a)
+        reader_b, writer = await asyncio.open_connection(sock=b)
+        obj = loads(ONE, Struct)
+        await aio.dump(obj, writer)
+        await aio.dump(obj, writer, packed=True)
+        writer.close()
+        await writer.wait_closed()
+        data = await reader.read()
+        writer_a.close()
+        return data
+    data = run(main())
+    assert data == ONE + dumps_packed(loads(ONE, Struct))
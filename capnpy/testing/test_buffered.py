@@ -1,11 +1,14 @@
 import pytest
-from capnpy.buffered import BufferedStream, BufferedSocket, StringBuffer
+from io import BytesIO
+from capnpy.buffered import (BufferedStream, BufferedSocket, StringBuffer,
+                             RingBufferedSocket, RingBufferedFile)
 
 class FakeSocket(object):
 
     def __init__(self, *packets):
         self.packets = iter(packets)
         self.received = b''
+        self.pending = b''
 
     def recv(self, size):
         try:
@@ -13,6 +16,14 @@ class FakeSocket(object):
         except StopIteration:
             return b''
 
+    def recv_into(self, view):
+        if not self.pending:
+            self.pending = self.recv(len(view))
+        n = min(len(view), len(self.pending))
+        view[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
     def sendall(self, data):
         self.received += data
 
@@ -33,7 +44,8 @@ class MyBufferedStream(BufferedStream):
 @pytest.mark.usefixtures('initargs')
 class TestBufferedStream(object):
 
-    @pytest.fixture(params=['BufferedStream', 'BufferedSocket'])
+    @pytest.fixture(params=['BufferedStream', 'BufferedSocket',
+                            'RingBufferedSocket'])
     def initargs(self, request):
         self.param = request.param
 
@@ -43,6 +55,10 @@ class TestBufferedStream(object):
         elif self.param == 'BufferedSocket':
             sock = FakeSocket(*packets)
             return BufferedSocket(sock)
+        elif self.param == 'RingBufferedSocket':
+            # use a very small capacity, to exercise the wrap-around logic
+            sock = FakeSocket(*packets)
+            return RingBufferedSocket(sock, capacity=8)
         assert False
 
     def test_buffering(self):
@@ -116,10 +132,13 @@ class TestBufferedStream(object):
         assert stream.read() == b''
 
     def test_write(self):
-        if self.param != 'BufferedSocket':
+        if self.param == 'BufferedStream':
             return
         sock = FakeSocket()
-        bufsock = BufferedSocket(sock)
+        if self.param == 'BufferedSocket':
+            bufsock = BufferedSocket(sock)
+        else:
+            bufsock = RingBufferedSocket(sock)
         bufsock.write(b'hello ')
         bufsock.write(b'world')
         assert sock.received == b''
@@ -131,6 +150,47 @@ class TestBufferedStream(object):
         assert sock.received == b'hello world foobar'
 
 
+class TestRingBufferedStream(object):
+
+    def test_readview(self):
+        stream = RingBufferedFile(BytesIO(b'aaaabbbbccccdddd'), capacity=8)
+        a = stream.readview(4)
+        assert isinstance(a, memoryview)
+        assert a == b'aaaa'
+        b = stream.readview(4)
+        c = stream.readview(4)
+        d = stream.readview(6)
+        assert stream.readview(4) == b''
+        # the views are still valid, because the buffer has not been reused
+        assert (a, b, c, d) == (b'aaaa', b'bbbb', b'cccc', b'dddd')
+
+    def test_reuse_buffer(self):
+        stream = RingBufferedFile(BytesIO(b'aaaabbbbccccdddd'), capacity=8)
+        buf = stream.buf
+        assert stream.read(6) == b'aaaabb'
+        assert stream.read(6) == b'bbcccc'
+        assert stream.buf is buf
+        view = stream.readview(2)
+        assert stream.read(2) == b'dd'
+        assert stream.buf is not buf
+        assert view == b'dd'
+
+    def test_grow(self):
+        data = b''.join([bytes(bytearray([i]))*10 for i in range(10)])
+        stream = RingBufferedFile(BytesIO(data), capacity=8)
+        assert stream.read(2) == data[:2]
+        view = stream.readview(50)
+        assert len(stream.buf) >= 50
+        assert view == data[2:52]
+        assert stream.read() == data[52:]
+
+    def test_readline_longer_than_capacity(self):
+        stream = RingBufferedFile(BytesIO(b'a'*20 + b'\nbb'), capacity=8)
+        assert stream.readline() == b'a'*20 + b'\n'
+        assert stream.readline() == b'bb'
+        assert stream.readline() == b''
+
+
 class TestStringBuffer(object):
 
     def test_read(self):
@@ -0,0 +1,22 @@
+import sys
+import subprocess
+import pytest
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='module-level __getattr__ requires Python >= 3.7')
+def test_DynamicCompiler_is_lazy():
+    # run a fresh interpreter, so that nothing is in sys.modules yet
+    src = """if 1:
+        import sys
+        import capnpy
+        assert 'capnpy.compiler.compiler' not in sys.modules
+        DynamicCompiler = capnpy.DynamicCompiler
+        compiler = sys.modules['capnpy.compiler.compiler']
+        assert DynamicCompiler is compiler.DynamicCompiler
+    """
+    subprocess.check_call([sys.executable, '-c', src])
+
+def test_missing_attribute():
+    import capnpy
+    with pytest.raises(AttributeError):
+        capnpy.this_does_not_exist
@@ -5,9 +5,10 @@ from six import b
 
 from capnpy.printer import print_buffer
 from capnpy.type import Types
-from capnpy.segment.segment import MultiSegment
+from capnpy.segment.segment import Segment, MultiSegment
 from capnpy import ptr
 from capnpy.list import (List, StructItemType, PrimitiveItemType, TextItemType,
+                         BoolItemType,
                          ListItemType, TextUnicodeItemType)
 from capnpy.struct_ import Struct
 
@@ -291,3 +292,275 @@ class TestPythonicInterface(object):
         assert mylist[3:] == [3, 4]
         assert mylist[:] == [0, 1, 2, 3, 4]
 
+    def test_slice_is_a_view(self, mylist):
+        view = mylist[1:4]
+        assert isinstance(view, List)
+        assert view._seg is mylist._seg
+        assert len(view) == 3
+        assert list(view) == [1, 2, 3]
+        assert view[0] == 1
+        assert view[-1] == 3
+        py.test.raises(IndexError, "view[3]")
+
+    def test_slice_step(self, mylist):
+        assert mylist[::2] == [0, 2, 4]
+        assert mylist[::-1] == [4, 3, 2, 1, 0]
+        assert mylist[3:0:-2] == [3, 1]
+        assert mylist[4:1] == []
+        assert len(mylist[4:1]) == 0
+
+    def test_slice_of_slice(self, mylist):
+        view = mylist[1:]
+        assert view[1:3] == [2, 3]
+        assert view[::-2] == [4, 2]
+        assert view[::-1][1:] == [3, 2, 1]
+        assert view[::2][::-1] == [3, 1]
+
+    def test_slice_get_end(self, mylist):
+        assert mylist._get_start() == 8
+        assert mylist._get_end() == 48
+        view = mylist[1:3]
+        assert view._get_start() == 16
+        assert view._get_end() == 32
+        assert view._get_slice() == mylist._seg.buf[16:32]
+        # the items are not contiguous
+        assert mylist[::2]._get_end() == -1
+
+    def test_slice_print(self, mylist, capsys):
+        mylist[1:3]._print_buf()
+        out, err = capsys.readouterr()
+        lines = out.splitlines()[1:] # skip the header
+        assert len(lines) == 2
+        # the offsets might be surrounded by color escape sequences
+        assert '16' in lines[0].split()[0]
+        assert '24' in lines[1].split()[0]
+
+    def test_slice_equals(self, mylist):
+        assert mylist[:2] == mylist[:2]
+        assert mylist[1:3] == mylist[1:3]
+        assert mylist[:2] != mylist[1:3]
+        assert mylist[::2] == mylist[::-1][::-2]
+
+
+
+class TestListIndex(object):
+
+    @py.test.fixture
+    def points(self):
+        class Point(Struct):
+            __static_data_size__ = 2
+            __static_ptrs_size__ = 0
+
+        # list of Point {x: Int64, y: Int64}
+        buf = b('\x01\x00\x00\x00\x47\x00\x00\x00'    # ptrlist
+               '\x10\x00\x00\x00\x02\x00\x00\x00'    # list tag
+               '\x0a\x00\x00\x00\x00\x00\x00\x00'    # 10
+               '\x64\x00\x00\x00\x00\x00\x00\x00'    # 100
+               '\x14\x00\x00\x00\x00\x00\x00\x00'    # 20
+               '\xc8\x00\x00\x00\x00\x00\x00\x00'    # 200
+               '\x1e\x00\x00\x00\x00\x00\x00\x00'    # 30
+               '\x2c\x01\x00\x00\x00\x00\x00\x00'    # 300
+               '\x14\x00\x00\x00\x00\x00\x00\x00'    # 20
+               '\x90\x01\x00\x00\x00\x00\x00\x00')   # 400
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        return blob._read_list(0, StructItemType(Point))
+
+    def x_of(self, p):
+        return p._read_primitive(0, Types.int64.ifmt)
+
+    def y_of(self, p):
+        return p._read_primitive(8, Types.int64.ifmt)
+
+    def test_lookup(self, points):
+        index = points.build_index(key=self.x_of)
+        assert len(index) == 4
+        assert self.y_of(points.lookup(10)) == 100
+        assert self.y_of(points.lookup(30)) == 300
+        assert self.y_of(index.lookup(30)) == 300
+        py.test.raises(KeyError, "points.lookup(40)")
+
+    def test_duplicate_keys(self, points):
+        points.build_index(key=self.x_of)
+        # we get the first one
+        assert self.y_of(points.lookup(20)) == 200
+
+    def test_not_structs(self):
+        buf = b('\x01\x00\x00\x00\x0D\x00\x00\x00'   # ptrlist
+               '\x01\x00\x00\x00\x00\x00\x00\x00')  # 1
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        lst = blob._read_list(0, PrimitiveItemType(Types.int64))
+        py.test.raises(TypeError, "lst.build_index()")
+
+
+class TestBisect(object):
+
+    @py.test.fixture
+    def points(self):
+        class Point(Struct):
+            __static_data_size__ = 2
+            __static_ptrs_size__ = 0
+            __layout__ = {
+                'x': ('data', 'q', 0, 0, None),
+                'y': ('data', 'q', 8, 0, None),
+                'z': ('data', 'q', 16, 0, None), # added by a newer schema
+                'name': ('ptr', None, 16, None, None),
+                'tag': ('data', 'h', 8, 0, 1),
+            }
+            @property
+            def x(self):
+                return self._read_primitive(0, Types.int64.ifmt)
+
+        # list of Point {x: Int64, y: Int64}, sorted by x
+        buf = b('\x01\x00\x00\x00\x57\x00\x00\x00'    # ptrlist
+               '\x14\x00\x00\x00\x02\x00\x00\x00'    # list tag
+               '\x0a\x00\x00\x00\x00\x00\x00\x00'    # 10
+               '\x64\x00\x00\x00\x00\x00\x00\x00'    # 100
+               '\x14\x00\x00\x00\x00\x00\x00\x00'    # 20
+               '\xc8\x00\x00\x00\x00\x00\x00\x00'    # 200
+               '\x14\x00\x00\x00\x00\x00\x00\x00'    # 20
+               '\x2c\x01\x00\x00\x00\x00\x00\x00'    # 300
+               '\x1e\x00\x00\x00\x00\x00\x00\x00'    # 30
+               '\x90\x01\x00\x00\x00\x00\x00\x00'    # 400
+               '\x28\x00\x00\x00\x00\x00\x00\x00'    # 40
+               '\xf4\x01\x00\x00\x00\x00\x00\x00')   # 500
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        return blob._read_list(0, StructItemType(Point))
+
+    def test_bisect(self, points):
+        assert len(points) == 5
+        assert points.bisect_left('x', 20) == 1
+        assert points.bisect_right('x', 20) == 3
+        assert points.bisect('x', 20) == 3
+        assert points.bisect_left('x', 5) == 0
+        assert points.bisect_left('x', 25) == 3
+        assert points.bisect_left('x', 50) == 5
+        assert points.bisect_left('y', 300) == 2
+
+    def test_bisect_view(self, points):
+        view = points[1:]
+        assert view.bisect_left('x', 20) == 0
+        assert view.bisect_right('x', 20) == 2
+        assert [p.x for p in view.range('x', 25, 50)] == [30, 40]
+
+    def test_range(self, points):
+        def xs(items):
+            return [p.x for p in items]
+        assert xs(points.range('x', 20, 40)) == [20, 20, 30]
+        assert xs(points.range('x', 0, 100)) == [10, 20, 20, 30, 40]
+        assert xs(points.range('x', 21, 30)) == []
+        assert xs(points.range('x', 40, 10)) == []
+
+    def test_field_not_in_data_section(self, points):
+        # the field reads as 0
+        assert points.bisect_left('z', 0) == 0
+        assert points.bisect_right('z', 0) == 5
+
+    def test_errors(self, points):
+        py.test.raises(ValueError, "points.bisect('foo', 0)")
+        py.test.raises(TypeError, "points.bisect('name', 0)")
+        py.test.raises(TypeError, "points.bisect('tag', 0)")
+        #
+        buf = b('\x01\x00\x00\x00\x0D\x00\x00\x00'   # ptrlist
+               '\x01\x00\x00\x00\x00\x00\x00\x00')  # 1
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        lst = blob._read_list(0, PrimitiveItemType(Types.int64))
+        py.test.raises(TypeError, "lst.bisect('x', 0)")
+
+
+class TestAsArray(object):
+
+    def read_list(self, buf, item_type):
+        blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+        return blob._read_list(0, item_type)
+
+    def float64_list(self):
+        buf = b('\x01\x00\x00\x00\x25\x00\x00\x00'   # ptrlist
+               '\x58\x39\xb4\xc8\x76\xbe\xf3\x3f'   # 1.234
+               '\xc3\xf5\x28\x5c\x8f\xc2\x02\x40'   # 2.345
+               '\xd9\xce\xf7\x53\xe3\xa5\x0b\x40'   # 3.456
+               '\xf8\x53\xe3\xa5\x9b\x44\x12\x40')  # 4.567
+        return self.read_list(buf, PrimitiveItemType(Types.float64))
+
+    def int16_list(self):
+        buf = b('\x01\x00\x00\x00\x1b\x00\x00\x00'   # ptrlist
+               '\x01\x00\xff\xff\x03\x00\x00\x00')  # 1, -1, 3
+        return self.read_list(buf, PrimitiveItemType(Types.int16))
+
+    def bool_list(self):
+        buf = b('\x01\x00\x00\x00\x51\x00\x00\x00'   # ptrlist
+               '\x05\x02\x00\x00\x00\x00\x00\x00')  # 10 bits
+        return self.read_list(buf, BoolItemType())
+
+    def test_as_numpy(self):
+        np = py.test.importorskip('numpy')
+        arr = self.float64_list().as_numpy()
+        assert arr.dtype == np.dtype('<f8')
+        assert list(arr) == [1.234, 2.345, 3.456, 4.567]
+        assert arr.sum() == 1.234 + 2.345 + 3.456 + 4.567
+        assert not arr.flags.writeable
+        #
+        arr = self.int16_list().as_numpy()
+        assert arr.dtype == np.dtype('<i2')
+        assert list(arr) == [1, -1, 3]
+
+    def test_as_numpy_is_a_view(self):
+        np = py.test.importorskip('numpy')
+        buf = bytearray(b('\x01\x00\x00\x00\x1b\x00\x00\x00'
+                          '\x01\x00\x02\x00\x03\x00\x00\x00'))
+        lst = self.read_list(Segment(buf), PrimitiveItemType(Types.int16))
+        arr = lst.as_numpy()
+        buf[8] = 42
+        assert list(arr) == [42, 2, 3]
+
+    def test_as_numpy_bool(self):
+        np = py.test.importorskip('numpy')
+        arr = self.bool_list().as_numpy()
+        assert arr.dtype == np.bool_
+        assert list(arr) == [True, False, True] + [False]*6 + [True]
+
+    def test_as_numpy_view(self):
+        np = py.test.importorskip('numpy')
+        lst = self.int16_list()
+        arr = lst[::-2].as_numpy()
+        assert list(arr) == [3, 1]
+        assert not arr.flags.writeable
+        assert list(lst[1:].as_numpy()) == [-1, 3]
+        assert list(lst[3:].as_numpy()) == []
+        arr = self.bool_list()[::-3].as_numpy()
+        assert list(arr) == [True, False, False, True]
+
+    def text_list(self):
+        buf = b('\x01\x00\x00\x00\x82\x00\x00\x00'   # ptrlist
+               'hello capnproto\0')                 # string
+        return self.read_list(buf, TextItemType(Types.text))
+
+    def test_as_numpy_unsupported(self):
+        # no importorskip: the TypeError is raised before importing numpy
+        lst = self.text_list()
+        py.test.raises(TypeError, "lst.as_numpy()")
+
+    def test_as_array_unsupported(self):
+        lst = self.text_list()
+        py.test.raises(TypeError, "lst.as_array()")
+
+    def test_as_array(self):
+        arr = self.float64_list().as_array()
+        assert arr.typecode == 'd'
+        assert list(arr) == [1.234, 2.345, 3.456, 4.567]
+        #
+        arr = self.int16_list().as_array()
+        assert arr.typecode == 'h'
+        assert list(arr) == [1, -1, 3]
+        #
+        arr = self.bool_list().as_array()
+        assert arr.typecode == 'B'
+        assert list(arr) == [1, 0, 1] + [0]*6 + [1]
+
+    def test_as_array_view(self):
+        lst = self.int16_list()
+        assert list(lst[1:].as_array()) == [-1, 3]
+        assert list(lst[::-2].as_array()) == [3, 1]
+        assert list(lst[3:].as_array()) == []
+        bools = self.bool_list()
+        assert list(bools[8:].as_array()) == [0, 1]
+        assert list(bools[::-3].as_array()) == [1, 0, 0, 1]
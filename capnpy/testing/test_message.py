@@ -1,9 +1,17 @@
 import py.test
+import socket
+import struct
+import pytest
 from io import BytesIO
 from six import b, PY3
-from capnpy.message import load, loads, load_all, _load_message, dumps
+from capnpy.message import load, loads, load_all, _load_message, dumps, dump_many
+from capnpy.message import (load_packed, loads_packed, load_all_packed,
+                            dumps_packed, dump_packed)
+from capnpy.packed import pack
 from capnpy.filelike import as_filelike
+from capnpy.buffered import RingBufferedFile, BufferedSocket, RingBufferedSocket
 from capnpy.type import Types
+from capnpy import ptr
 from capnpy.struct_ import Struct
 from capnpy.printer import print_buffer
 
@@ -49,6 +57,31 @@ def test_load_all():
     assert p2._read_primitive(0, Types.int64.ifmt) == 3
     assert p2._read_primitive(8, Types.int64.ifmt) == 4
 
+def test_load_ring_buffered():
+    one = _get_many_messages().getvalue()
+    multi = b('\x01\x00\x00\x00\x01\x00\x00\x00'  # 2 segments, sizes 1 and
+              '\x03\x00\x00\x00\x00\x00\x00\x00'  # 3 words, padding
+              '\x02\x00\x00\x00\x01\x00\x00\x00'  # far ptr to segment 1
+              '\x00\x00\x00\x00\x02\x00\x00\x00'  # landing pad: ptr to Point
+              '\x05\x00\x00\x00\x00\x00\x00\x00'  # x == 5
+              '\x06\x00\x00\x00\x00\x00\x00\x00') # y == 6
+    f = RingBufferedFile(BytesIO(one + multi + one), capacity=64)
+    messages = list(load_all(f, Struct))
+    assert len(messages) == 5
+    # the objects point into the buffer of the stream, but they have not
+    # been overwritten when reading the next ones
+    assert [(p._read_primitive(0, Types.int64.ifmt),
+             p._read_primitive(8, Types.int64.ifmt)) for p in messages] == [
+                 (1, 2), (3, 4), (5, 6), (1, 2), (3, 4)]
+    assert isinstance(messages[0]._seg.buf, memoryview)
+
+def test_load_ring_buffered_truncated():
+    buf = _get_many_messages().getvalue()
+    f = RingBufferedFile(BytesIO(buf[:-8]))
+    load(f, Struct)
+    exc = py.test.raises(ValueError, "load(f, Struct)")
+    assert str(exc.value) == ("Unexpected EOF: expected 24 bytes, got only 16. "
+                              "Segment size: 3")
 
 def test_loads():
     buf = b('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
@@ -105,6 +138,37 @@ def test_eof():
     buf = b''
     exc = py.test.raises(EOFError, "loads(buf, Struct)")
 
+# a malicious message: the root struct contains a pointer to itself
+CYCLE = b('\x00\x00\x00\x00\x02\x00\x00\x00'   # message header: 1 segment, size 2 words
+          '\x00\x00\x00\x00\x00\x00\x01\x00'   # ptr to payload (0, 1)
+          '\xfc\xff\xff\xff\x00\x00\x01\x00')  # ptr to itself (0, 1)
+
+def test_traversal_limit():
+    obj = loads(CYCLE, Struct, traversal_limit_in_words=10)
+    assert obj._seg.traversal_limit == 9 # the root has been charged
+    for i in range(9):
+        obj = obj._read_struct(0, Struct)
+    exc = py.test.raises(ValueError, "obj._read_struct(0, Struct)")
+    assert str(exc.value) == 'Exceeded the message traversal limit'
+    #
+    obj = loads(memoryview(CYCLE), Struct, traversal_limit_in_words=1)
+    py.test.raises(ValueError, "obj._read_struct(0, Struct)")
+    #
+    # by default, there is no limit
+    obj = loads(CYCLE, Struct)
+    for i in range(100):
+        obj = obj._read_struct(0, Struct)
+
+def test_nesting_limit():
+    obj = loads(CYCLE, Struct, nesting_limit=64)
+    exc = py.test.raises(ValueError, "obj.compact()")
+    assert str(exc.value) == 'Exceeded the message nesting limit'
+    py.test.raises(ValueError, "dumps(obj)")
+    #
+    obj = loads(CYCLE, Struct, traversal_limit_in_words=100)
+    exc = py.test.raises(ValueError, "obj.compact()")
+    assert str(exc.value) == 'Exceeded the message traversal limit'
+
 def test_segments():
     header = b('\x03\x00\x00\x00'  # 3+1 segments
                '\x10\x00\x00\x00'  # size0: 16
@@ -170,6 +234,126 @@ def test_dumps_not_compact():
             'J' 'o' 'h' 'n' '\x00\x00\x00\x00')  # John
     assert msg == exp
 
+def test_dumps_cache(monkeypatch):
+    import capnpy.message
+    class Person(Struct):
+        pass
+
+    buf = b('\x20\x00\x00\x00\x00\x00\x00\x00'   # age=32
+            '\x05\x00\x00\x00\x2a\x00\x00\x00'   # name=ptr
+            'garbage1'
+            'J' 'o' 'h' 'n' '\x00\x00\x00\x00')  # John
+    p = Person.from_buffer(buf, 0, data_size=1, ptrs_size=1)
+    assert not p._is_compact()
+    # the cache is disabled by default
+    msg = p._dump_bytes()
+    assert p._dump_bytes() == msg
+    assert p._dump_bytes() is not p._dump_bytes()
+    #
+    # make sure that the default is restored at the end of the test
+    monkeypatch.setattr(capnpy.message, 'DUMP_CACHE', capnpy.message.DUMP_CACHE)
+    capnpy.message.enable_dump_cache()
+    msg = p._dump_bytes()
+    assert p._dump_bytes() is msg
+    assert dumps(p) is msg
+    assert dumps(p, fastpath=False) == msg
+    assert dumps(p, fastpath=False) is not msg
+    assert dumps_packed(p) == pack(msg)
+    #
+    capnpy.message.enable_dump_cache(False)
+    p = Person.from_buffer(buf, 0, data_size=1, ptrs_size=1)
+    assert p._dump_bytes() == msg
+    assert p._dump_bytes() is not p._dump_bytes()
+
+def test_get_end_cache():
+    class Person(Struct):
+        pass
+
+    buf = b('\x20\x00\x00\x00\x00\x00\x00\x00'   # age=32
+            '\x01\x00\x00\x00\x2a\x00\x00\x00'   # name=ptr
+            'J' 'o' 'h' 'n' '\x00\x00\x00\x00')  # John
+    p = Person.from_buffer(buf, 0, data_size=1, ptrs_size=1)
+    assert p._get_end() == 24
+    # the object is visited only once, so it is charged only once
+    p._seg.traversal_limit = 0
+    assert p._get_end() == 24
+
+def _get_objects_for_dump_many():
+    class Person(Struct):
+        pass
+
+    buf = b('\x20\x00\x00\x00\x00\x00\x00\x00'   # age=32
+            '\x01\x00\x00\x00\x2a\x00\x00\x00'   # name=ptr
+            'J' 'o' 'h' 'n' '\x00\x00\x00\x00')  # John
+    compact = Person.from_buffer(buf, 0, data_size=1, ptrs_size=1)
+    buf = b('\x20\x00\x00\x00\x00\x00\x00\x00'   # age=32
+            '\x05\x00\x00\x00\x2a\x00\x00\x00'   # name=ptr
+            'garbage1'
+            'J' 'o' 'h' 'n' '\x00\x00\x00\x00')  # John
+    not_compact = Person.from_buffer(buf, 0, data_size=1, ptrs_size=1)
+    return [compact, not_compact] * 700 # more than a single batch
+
+def test_dump_many():
+    objs = _get_objects_for_dump_many()
+    expected = b''.join([dumps(obj) for obj in objs])
+    f = BytesIO()
+    dump_many(objs, f)
+    assert f.getvalue() == expected
+    f = BytesIO()
+    dump_many(iter(objs), f, fastpath=False)
+    assert f.getvalue() == expected
+
+def test_dump_many_writer_keeps_parts():
+    # f.write() is allowed to keep a reference to the parts instead of
+    # copying them, as e.g. BufferedFileLike.write() does: make sure that the
+    # headers of a batch are not overwritten by the next one
+    class Person(Struct):
+        pass
+
+    class CollectingWriter(object):
+        def __init__(self):
+            self.parts = []
+        def write(self, part):
+            self.parts.append(part)
+
+    objs = []
+    for i in range(1200): # more than a single batch
+        name = b'x' * (i % 20) + b'\x00'
+        name += b'\x00' * (-len(name) % 8)
+        buf = (struct.pack('<qq', i, ptr.new_list(0, ptr.LIST_SIZE_8,
+                                                  i % 20 + 1)) + name)
+        objs.append(Person.from_buffer(buf, 0, data_size=1, ptrs_size=1))
+    expected = b''.join([dumps(obj) for obj in objs])
+    f = CollectingWriter()
+    dump_many(objs, f)
+    assert b''.join([bytes(part) for part in f.parts]) == expected
+
+def test_dump_many_file(tmpdir):
+    objs = _get_objects_for_dump_many()
+    expected = b''.join([dumps(obj) for obj in objs])
+    myfile = tmpdir.join('foo.bin')
+    with myfile.open('wb') as f:
+        f.write(b'x' * 8) # make sure that we flush it before writev
+        dump_many(objs, f)
+    assert myfile.read_binary() == b'x' * 8 + expected
+
+@pytest.mark.parametrize('cls', [BufferedSocket, RingBufferedSocket])
+def test_dump_many_socket(cls):
+    objs = _get_objects_for_dump_many()
+    expected = b''.join([dumps(obj) for obj in objs])
+    a, b_ = socket.socketpair()
+    try:
+        bufsock = cls(a)
+        bufsock.write(b'hello')
+        bufsock.write_messages(objs[:10])
+        dump_many(objs[10:], a)
+        a.shutdown(socket.SHUT_WR)
+        data = BufferedSocket(b_).read()
+    finally:
+        a.close()
+        b_.close()
+    assert data == b'hello' + expected
+
 
 def test_Struct_loads():
     class Point(Struct):
@@ -184,6 +368,9 @@ def test_Struct_loads():
     assert isinstance(p, Point)
     assert p._read_primitive(0, Types.int64.ifmt) == 1
     assert p._read_primitive(8, Types.int64.ifmt) == 2
+    #
+    p = Point.loads(buf, traversal_limit_in_words=2)
+    assert p._seg.traversal_limit == 0
 
 def test_Struct_dumps():
     class Point(Struct):
@@ -199,6 +386,136 @@ def test_Struct_dumps():
             '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
     assert msg == exp
 
+class TestLoadsBuffer(object):
+    """
+    Test that message.loads works without copying on objects which support
+    the buffer protocol
+    """
+
+    buf = b('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+            '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+            '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+            '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+
+    def check(self, buf, x=1, y=2):
+        p = loads(buf, Struct)
+        assert isinstance(p, Struct)
+        assert p._read_primitive(0, Types.int64.ifmt) == x
+        assert p._read_primitive(8, Types.int64.ifmt) == y
+        return p
+
+    def test_memoryview(self):
+        self.check(memoryview(self.buf))
+
+    def test_bytearray_is_not_copied(self):
+        buf = bytearray(self.buf)
+        p = self.check(buf)
+        buf[16] = 42
+        assert p._read_primitive(0, Types.int64.ifmt) == 42
+
+    def test_mmap(self, tmpdir):
+        import mmap
+        myfile = tmpdir.join('myfile')
+        myfile.write(self.buf + self.buf, mode='wb')
+        with myfile.open('rb') as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.check(memoryview(m)[32:])
+            p = self.check(memoryview(m)[:32])
+            assert p.dumps() == self.buf
+            del p
+            m.close()
+
+    def test_numpy(self):
+        np = pytest.importorskip('numpy')
+        arr = np.frombuffer(self.buf, dtype=np.uint8)
+        self.check(arr)
+        self.check(arr.view(np.int64))
+
+    def test_multiple_segments(self):
+        buf = b('\x01\x00\x00\x00\x01\x00\x00\x00'   # 2 segments: (1, 2)
+                '\x02\x00\x00\x00\x00\x00\x00\x00'
+                '\x02\x00\x00\x00\x01\x00\x00\x00'   # far ptr to segment 1
+                '\x00\x00\x00\x00\x01\x00\x00\x00'   # landing pad: ptr to payload
+                '\x01\x00\x00\x00\x00\x00\x00\x00')  # x == 1
+        p = loads(memoryview(buf), Struct)
+        assert p._seg.segment_offsets == (0, 8)
+        assert p._read_primitive(0, Types.int64.ifmt) == 1
+
+    def test_errors(self):
+        buf = memoryview(self.buf + b'garbage0')
+        exc = py.test.raises(ValueError, "loads(buf, Struct)")
+        assert str(exc.value) == 'Not all bytes were consumed: 8 bytes left'
+        #
+        buf = memoryview(self.buf[:24])
+        exc = py.test.raises(ValueError, "loads(buf, Struct)")
+        assert str(exc.value) == ("Unexpected EOF: expected 24 bytes, got only "
+                                  "16. Segment size: 3")
+        #
+        buf = memoryview(b'hello')
+        exc = py.test.raises(ValueError, "loads(buf, Struct)")
+        assert str(exc.value) == 'Unexpected EOF when reading the header'
+        #
+        buf = memoryview(b'')
+        py.test.raises(EOFError, "loads(buf, Struct)")
+
+
+def test_dumps_packed():
+    class Point(Struct):
+        pass
+
+    buf = b('\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+            '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+    p = Point.from_buffer(buf, 0, data_size=2, ptrs_size=0)
+    exp = b('\x10\x03'      # header: 1 segment, size 3 words
+            '\x10\x02'      # ptr to payload (Point {x, y})
+            '\x01\x01'      # x == 1
+            '\x01\x02')     # y == 2
+    assert dumps(p, packed=True) == exp
+    assert dumps(p, fastpath=False, packed=True) == exp
+    assert dumps_packed(p) == exp
+    assert p.dumps_packed() == exp
+    f = BytesIO()
+    dump_packed(p, f)
+    assert f.getvalue() == exp
+
+def test_loads_packed():
+    buf = b('\x10\x03'      # header: 1 segment, size 3 words
+            '\x10\x02'      # ptr to payload (Point {x, y})
+            '\x01\x01'      # x == 1
+            '\x01\x02')     # y == 2
+    p = loads_packed(buf, Struct)
+    assert isinstance(p, Struct)
+    assert p._read_primitive(0, Types.int64.ifmt) == 1
+    assert p._read_primitive(8, Types.int64.ifmt) == 2
+    #
+    p = loads_packed(memoryview(buf), Struct)
+    assert p._read_primitive(0, Types.int64.ifmt) == 1
+    assert p._read_primitive(8, Types.int64.ifmt) == 2
+    #
+    p = load_packed(BytesIO(buf), Struct)
+    assert p._read_primitive(0, Types.int64.ifmt) == 1
+    assert p._read_primitive(8, Types.int64.ifmt) == 2
+
+def test_load_all_packed():
+    f = _get_many_messages()
+    one = f.read(32)
+    two = f.read(32)
+    f = BytesIO(dumps_packed(loads(one, Struct)) +
+                dumps_packed(loads(two, Struct)))
+    messages = list(load_all_packed(f, Struct))
+    x = [msg._read_primitive(0, Types.int64.ifmt) for msg in messages]
+    y = [msg._read_primitive(8, Types.int64.ifmt) for msg in messages]
+    assert x == [1, 3]
+    assert y == [2, 4]
+
+def test_load_packed_not_at_boundary():
+    # a zero run which crosses the boundary of the message
+    buf = b('\x10\x01'      # header: 1 segment, size 1 word
+            '\x00\x01')     # 2 zero words, but only one belongs to the msg
+    f = BytesIO(buf)
+    exc = py.test.raises(ValueError, "load_packed(f, Struct)")
+    assert str(exc.value) == "The message ends in the middle of a packed run"
+
 class TestFileLike(object):
     """
     Test that message.load work with various file-like objects
@@ -0,0 +1,107 @@
+import py
+import pytest
+import struct
+from six import PY3
+from capnpy.messagefile import MessageFile
+from capnpy.type import Types
+from capnpy.struct_ import Struct
+
+
+pytestmark = pytest.mark.skipif(not PY3,
+                                reason="MessageFile requires Python 3")
+
+def make_message(x):
+    # message header: 1 segment, size 2 words
+    # ptr to payload (a struct with 1 data word)
+    return struct.pack('<IIqq', 0, 2, 0x0000000100000000, x)
+
+def make_multisegment_message(x):
+    return struct.pack('<IIIIqqq',
+                       1, 1, 2, 0,          # 2 segments: (1, 2) + padding
+                       0x0000000100000002,  # far ptr to segment 1
+                       0x0000000100000000,  # landing pad: ptr to payload
+                       x)
+
+def read_x(obj):
+    return obj._read_primitive(0, Types.int64.ifmt)
+
+
+class TestMessageFile(object):
+
+    N = 10
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        myfile = tmpdir.join('messages')
+        parts = []
+        for i in range(self.N):
+            if i % 3 == 0:
+                parts.append(make_multisegment_message(i))
+            else:
+                parts.append(make_message(i))
+        myfile.write(b''.join(parts), mode='wb')
+        return str(myfile)
+
+    def test_len_getitem(self, path):
+        with MessageFile(path, Struct) as mf:
+            assert len(mf) == self.N
+            assert read_x(mf[0]) == 0
+            assert read_x(mf[4]) == 4
+            assert read_x(mf[-1]) == self.N-1
+            py.test.raises(IndexError, "mf[self.N]")
+            py.test.raises(IndexError, "mf[-self.N-1]")
+
+    def test_slice(self, path):
+        with MessageFile(path, Struct) as mf:
+            assert [read_x(obj) for obj in mf[2:5]] == [2, 3, 4]
+            assert [read_x(obj) for obj in mf[::-3]] == [9, 6, 3, 0]
+
+    def test_iter(self, path):
+        with MessageFile(path, Struct) as mf:
+            assert [read_x(obj) for obj in mf] == list(range(self.N))
+            assert ([read_x(obj) for obj in reversed(mf)] ==
+                    list(reversed(range(self.N))))
+
+    def test_objects_survive_close(self, path):
+        mf = MessageFile(path, Struct)
+        obj = mf[3]
+        mf.close()
+        assert read_x(obj) == 3
+        py.test.raises(ValueError, "mf[3]")
+
+    def test_empty_file(self, tmpdir):
+        myfile = tmpdir.join('empty')
+        myfile.write(b'', mode='wb')
+        with MessageFile(str(myfile), Struct) as mf:
+            assert len(mf) == 0
+            assert list(mf) == []
+
+    def test_truncated(self, tmpdir):
+        myfile = tmpdir.join('truncated')
+        myfile.write(make_message(1) + make_message(2)[:20], mode='wb')
+        exc = py.test.raises(ValueError, "MessageFile(str(myfile), Struct)")
+        assert str(exc.value) == ('Unexpected EOF: expected 16 bytes, got only '
+                                  '12. Segment size: 2')
+
+    def test_index_file(self, path, tmpdir, monkeypatch):
+        index_path = str(tmpdir.join('messages.idx'))
+        with MessageFile(path, Struct, index_path=index_path) as mf:
+            offsets = list(mf.offsets)
+        assert tmpdir.join('messages.idx').check()
+        #
+        # the second time, the index is loaded from the sidecar file
+        def fail(self):
+            assert False, 'the index should not be rebuilt'
+        monkeypatch.setattr(MessageFile, '_build_index', fail)
+        with MessageFile(path, Struct, index_path=index_path) as mf:
+            assert list(mf.offsets) == offsets
+            assert read_x(mf[7]) == 7
+
+    def test_stale_index_file(self, path, tmpdir):
+        index_path = str(tmpdir.join('messages.idx'))
+        MessageFile(path, Struct, index_path=index_path).close()
+        with open(path, 'ab') as f:
+            f.write(make_message(42))
+        with MessageFile(path, Struct, index_path=index_path) as mf:
+            assert len(mf) == self.N+1
+            assert read_x(mf[-1]) == 42
@@ -0,0 +1,149 @@
+import py
+import pytest
+from io import BytesIO
+from capnpy.packed import pack, unpack, PackedReader
+from capnpy.filelike import as_filelike
+
+# test vectors taken from the capnproto C++ test suite (packed-test.c++)
+VECTORS = [
+    (b'', b''),
+    (b'\x00'*8, b'\x00\x00'),
+    (b'\x00'*16, b'\x00\x01'),
+    (b'\x00\x00\x0c\x00\x00\x22\x00\x00', b'\x24\x0c\x22'),
+    (b'\x01\x03\x02\x04\x05\x07\x06\x08', b'\xff\x01\x03\x02\x04\x05\x07\x06\x08\x00'),
+    (b'\x01\x03\x02\x04\x05\x07\x06\x08' + b'\x00'*8,
+     b'\xff\x01\x03\x02\x04\x05\x07\x06\x08\x00\x00\x00'),
+    (b'\x00\x00\x0c\x00\x00\x22\x00\x00' + b'\x01\x03\x02\x04\x05\x07\x06\x08',
+     b'\x24\x0c\x22\xff\x01\x03\x02\x04\x05\x07\x06\x08\x00'),
+    (b'\x01\x03\x02\x04\x05\x07\x06\x08' + b'\x08\x06\x07\x04\x05\x02\x03\x01',
+     b'\xff\x01\x03\x02\x04\x05\x07\x06\x08\x01\x08\x06\x07\x04\x05\x02\x03\x01'),
+    (b'\x01\x02\x03\x04\x05\x06\x07\x08' +
+     b'\x01\x02\x03\x04\x05\x06\x07\x08' +
+     b'\x01\x02\x03\x04\x05\x06\x07\x08' +
+     b'\x01\x02\x03\x04\x05\x06\x07\x08' +
+     b'\x00\x02\x04\x00\x09\x00\x05\x01',
+     b'\xff\x01\x02\x03\x04\x05\x06\x07\x08\x03' +
+     b'\x01\x02\x03\x04\x05\x06\x07\x08' +
+     b'\x01\x02\x03\x04\x05\x06\x07\x08' +
+     b'\x01\x02\x03\x04\x05\x06\x07\x08' +
+     b'\xd6\x02\x04\x09\x05\x01'),
+    (b'\x08\x00\x64\x06\x00\x01\x01\x02' + b'\x00'*24 +
+     b'\x00\x00\x01\x00\x02\x00\x03\x01',
+     b'\xed\x08\x64\x06\x01\x01\x02\x00\x02\xd4\x01\x02\x03\x01'),
+]
+
+
+class TestPack(object):
+
+    @pytest.mark.parametrize('unpacked, packed', VECTORS)
+    def test_vectors(self, unpacked, packed):
+        assert pack(unpacked) == packed
+        assert unpack(packed) == unpacked
+
+    def test_wrong_length(self):
+        exc = py.test.raises(ValueError, "pack(b'\\x00' * 7)")
+        assert str(exc.value) == ("The length of the buffer must be a "
+                                  "multiple of 8 bytes: got 7")
+
+    def test_long_zero_run(self):
+        buf = b'\x00' * 8 * 1000
+        packed = pack(buf)
+        # 1000 words == 1 + 255, 1 + 255, 1 + 255, 1 + 231
+        assert packed == b'\x00\xff\x00\xff\x00\xff\x00\xe7'
+        assert unpack(packed) == buf
+
+    def test_long_raw_run(self):
+        word = b'\x01\x02\x03\x04\x05\x06\x07\x08'
+        buf = word * 300
+        packed = pack(buf)
+        assert packed[:1] == b'\xff'
+        assert packed[9:10] == b'\xff' # 255 more raw words
+        assert len(packed) == len(buf) + 4
+        assert unpack(packed) == buf
+
+    def test_roundtrip(self):
+        import random
+        rnd = random.Random(42)
+        for n in range(50):
+            words = []
+            for i in range(rnd.randrange(20)):
+                choice = rnd.randrange(3)
+                if choice == 0:
+                    words.append(b'\x00'*8)
+                elif choice == 1:
+                    words.append(bytes(bytearray(rnd.randrange(1, 256)
+                                                 for j in range(8))))
+                else:
+                    words.append(bytes(bytearray(rnd.choice([0, 42])
+                                                 for j in range(8))))
+            buf = b''.join(words)
+            assert unpack(pack(buf)) == buf
+
+    @pytest.mark.parametrize('unpacked, packed', VECTORS)
+    def test_buffers(self, unpacked, packed):
+        for conv in (bytearray, memoryview):
+            assert pack(conv(unpacked)) == packed
+            assert unpack(conv(packed)) == unpacked
+
+    @pytest.mark.parametrize('packed', [
+        b'\x24\x0c',                              # missing data byte
+        b'\x00',                                  # missing count
+        b'\xff\x01\x03\x02\x04\x05\x07\x06\x08',  # missing count
+        b'\xff\x01\x03\x02\x04\x05\x07\x06\x08\x01\x08\x06', # short raw run
+    ])
+    def test_unpack_truncated(self, packed):
+        exc = py.test.raises(ValueError, "unpack(packed)")
+        assert str(exc.value) == "Unexpected EOF: truncated packed data"
+
+
+class TestPackedReader(object):
+
+    def reader(self, buf):
+        return PackedReader(as_filelike(BytesIO(buf)))
+
+    @pytest.mark.parametrize('unpacked, packed', VECTORS)
+    def test_read_all(self, unpacked, packed):
+        r = self.reader(packed)
+        assert r.read(len(unpacked)) == unpacked
+        assert r.at_boundary()
+        assert r.read(8) == b''
+
+    @pytest.mark.parametrize('unpacked, packed', VECTORS)
+    def test_read_chunks(self, unpacked, packed):
+        for chunk in (1, 3, 4, 5, 8, 13):
+            r = self.reader(packed)
+            parts = []
+            while True:
+                data = r.read(chunk)
+                if not data:
+                    break
+                parts.append(data)
+            assert b''.join(parts) == unpacked
+
+    def test_read_only_what_is_needed(self):
+        buf = b'\x01\x03\x02\x04\x05\x07\x06\x08' + b'\x00'*8
+        packed = pack(buf)
+        f = BytesIO(packed + b'garbage')
+        r = PackedReader(as_filelike(f))
+        assert r.read(16) == buf
+        assert r.at_boundary()
+        assert f.read() == b'garbage'
+
+    def test_not_at_boundary(self):
+        r = self.reader(pack(b'\x00' * 32))
+        assert r.read(8) == b'\x00' * 8
+        assert not r.at_boundary()
+        assert r.read(20) == b'\x00' * 20
+        assert not r.at_boundary()
+        assert r.read(4) == b'\x00' * 4
+        assert r.at_boundary()
+
+    def test_truncated(self):
+        r = self.reader(b'\xff\x01\x03\x02\x04\x05\x07\x06\x08\x01\x08\x06')
+        assert r.read(8) == b'\x01\x03\x02\x04\x05\x07\x06\x08'
+        exc = py.test.raises(ValueError, "r.read(8)")
+        assert str(exc.value) == "Unexpected EOF: truncated packed data"
+
+    def test_read_without_size(self):
+        r = self.reader(b'')
+        py.test.raises(ValueError, "r.read()")
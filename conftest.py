@@ -1,5 +1,9 @@
 import sys
 
+if sys.version_info < (3, 6):
+    # async generators are not supported
+    collect_ignore = ['capnpy/testing/test_aio.py']
+
 def pytest_addoption(parser):
     group = parser.getgroup('pyx', 'enable pyx test')
     group.addoption('--pyx', action='store_true', default=False, dest='pyx')
@@ -122,16 +122,19 @@ def get_cython_extensions():
              "capnpy/segment/segment.py",
              "capnpy/segment/builder.pyx",
              "capnpy/segment/endof.py",
+             "capnpy/segment/stack.pyx",
              "capnpy/blob.py",
              "capnpy/enum.py",
              "capnpy/struct_.py",
              "capnpy/list.py",
              "capnpy/type.py",
              "capnpy/message.py",
+             "capnpy/columnar.py",
              "capnpy/buffered.py",
              "capnpy/filelike.py",
              "capnpy/ptr.pyx",
              "capnpy/packing.pyx",
+             "capnpy/packed.pyx",
              "capnpy/_hash.pyx",
              "capnpy/_util.pyx"
             ]
@@ -173,7 +176,7 @@ setup(name="capnpy",
       author='Antonio Cuni',
       author_email='anto.cuni@gmail.com',
       url='https://github.com/antocuni/capnpy',
-      use_scm_version=True,
+      use_scm_version={'write_to': 'capnpy/_version.py'},
       include_package_data=True,
       cmdclass={
           'sdist': my_sdist,